@@ -0,0 +1,251 @@
+import functools
+import numpy as np
+import datalibs
+import predict
+
+
+# Batched version of predict.move_ball. Balls are given as (N, 3) arrays of locations, velocities and angular
+# velocities, and all of them are simulated at once with the same gravity, bounce and surface rules as predict.py.
+
+
+def wall_anchor(wall):
+    if isinstance(wall, predict.SideWall):
+        return wall.wall_x, 0, 0
+    if isinstance(wall, predict.BackWall):
+        return 0, wall.wall_y, 0
+    return wall.anchor.tuple()
+
+
+class Surfaces:
+    # predict.SURFACES as arrays, in the same order. The planar walls come first, then the ceiling and the ground
+    def __init__(self):
+        radius = datalibs.BALL_RADIUS
+        self.gravity_z = predict.GRAVITY.z
+        self.count = len(predict.SURFACES)
+
+        walls = [s for s in predict.SURFACES if isinstance(s, (predict.SideWall, predict.BackWall, predict.CornerWall))]
+        anchors = np.array([wall_anchor(w) for w in walls], dtype=float)
+        normals = np.array([w.normal.tuple() for w in walls])
+        is_flat = np.array([not isinstance(w, predict.CornerWall) for w in walls])
+        is_back = np.array([isinstance(w, predict.BackWall) for w in walls])
+        self.wall_count = len(walls)
+        # The walls are vertical. A ball at location l is wall_offsets - l @ wall_normals_xy away from each wall,
+        # like in the time_till_hit methods, where only the corner walls don't subtract the ball's radius
+        self.wall_normals_xy = np.ascontiguousarray(normals[:, :2].T)
+        self.wall_offsets = (anchors[:, :2] * normals[:, :2]).sum(axis=1) - is_flat * radius
+        # A ball further than this outside of a wall doesn't hit it. Only matters for the back walls, where it means
+        # the ball is inside the goal
+        self.wall_min_dist = np.where(is_back, -radius, -np.inf)
+
+        self.ceiling_index = predict.SURFACES.index(predict.CEILING)
+        self.ground_index = predict.SURFACES.index(predict.GROUND)
+        self.ceiling_height = predict.CEILING.height
+        # Ball heights where it touches the ceiling and the ground, and the sign of the root to use for each
+        self.vertical_offsets = np.array([self.ceiling_height - radius, radius])
+        self.vertical_root_signs = np.array([-1.0, 1.0])
+
+        # The normals for bounce, with a zero normal at no_bounce that leaves the ball as it is.
+        # bounce_cross[i] @ v is bounce_normals[i].cross(v)
+        self.no_bounce = self.count
+        self.bounce_normals = np.vstack([[s.normal.tuple() for s in predict.SURFACES], np.zeros(3)])
+        self.bounce_cross = np.array([[[0, -nz, ny], [nz, 0, -nx], [-ny, nx, 0]] for nx, ny, nz in self.bounce_normals])
+
+        assert predict.SURFACES[:len(walls)] == walls
+        assert not normals[:, 2].any()
+        assert self.ceiling_index == self.ground_index - 1 == self.count - 2
+
+
+# Built on first use, since this module is imported while predict and datalibs are still loading
+# (predict -> datalibs -> threat -> batchpredict)
+@functools.lru_cache(maxsize=None)
+def surfaces():
+    return Surfaces()
+
+
+def from_balls(balls):
+    locations = np.array([ball.location.tuple() for ball in balls], dtype=float)
+    velocities = np.array([ball.velocity.tuple() for ball in balls], dtype=float)
+    angular_velocities = np.array([ball.angular_velocity.tuple() for ball in balls], dtype=float)
+    return locations, velocities, angular_velocities
+
+
+def to_ball(locations, velocities, angular_velocities, i):
+    ball = datalibs.Ball()
+    ball.location.x, ball.location.y, ball.location.z = locations[i]
+    ball.location_2d = ball.location.flat()
+    ball.velocity.x, ball.velocity.y, ball.velocity.z = velocities[i]
+    ball.angular_velocity.x, ball.angular_velocity.y, ball.angular_velocity.z = angular_velocities[i]
+    return ball
+
+
+def move_bodies(locations, velocities, time, acc_z):
+    # time and acc_z are arrays with one entry per body. acc_z is the gravity for the bodies affected by it and 0 for
+    # the rest. The operations are ordered like predict.move_body, so both give the exact same result
+    locations[:, 2] = time * time * (0.5 * acc_z) + time * velocities[:, 2] + locations[:, 2]
+    locations[:, :2] = time[:, None] * velocities[:, :2] + locations[:, :2]
+    velocities[:, 2] = time * acc_z + velocities[:, 2]
+
+
+def time_till_hits(locations, velocities, gravity, out=None):
+    # Returns an (N, surface count) array with the time until each ball touches each surface in predict.SURFACES,
+    # or inf if it doesn't. Same rules as the time_till_hit methods in predict.py. The result is written to out, if
+    # given, which saves allocating it in every step of move_balls.
+    # The cases without a hit are masked out after dividing, so call this with numpy's divide and invalid warnings off
+    arena = surfaces()
+    if out is None:
+        out = np.empty((len(locations), arena.count))
+
+    # Side, back and corner walls are vertical planes, so only x and y matter
+    vel_out = velocities[:, :2] @ arena.wall_normals_xy
+    dist = arena.wall_offsets - locations[:, :2] @ arena.wall_normals_xy
+    walls = out[:, :arena.wall_count]
+    np.divide(dist, vel_out, out=walls)
+    np.maximum(walls, 0, out=walls)
+    # The back walls can't be hit from inside the goal
+    walls[(vel_out <= 0) | (dist < arena.wall_min_dist)] = np.inf
+
+    # Ceiling and ground, the first root of ceiling_dist = vel_z * t + 1/2 * g * t^2 and the last root of
+    # 0 = height + vel_z * t + 1/2 * g * t^2. Both are solved at once as dists = vel_z * t + 1/2 * g * t^2.
+    # A root is nan if the ball doesn't reach that height, and not positive if the ball is already past it. For the
+    # ceiling, not reaching it means no hit. For the ground, both count as a hit right away.
+    # Rolling balls have no vertical speed, so they never hit the ceiling, and never hit the ground
+    vel_z = velocities[:, 2]
+    dists = arena.vertical_offsets - locations[:, 2:3]
+    disc = (vel_z * vel_z)[:, None] + 2 * arena.gravity_z * dists
+    vertical = out[:, arena.ceiling_index:]
+    np.divide(vel_z[:, None] + arena.vertical_root_signs * np.sqrt(disc), -arena.gravity_z, out=vertical)
+    ceiling = vertical[:, 0]
+    ceiling[(vel_z <= 0) | np.isnan(ceiling)] = np.inf
+    np.fmax(vertical, 0, out=vertical)
+    vertical[~gravity, 1] = np.inf
+
+    return out
+
+
+def bounce(velocities, angular_velocities, surface_indices):
+    # Same as predict.bounce for each ball, off the surface with the given index in predict.SURFACES, or not at all
+    # for surfaces().no_bounce. Like time_till_hits, this expects numpy's divide and invalid warnings to be off
+    arena = surfaces()
+    r = datalibs.BALL_RADIUS
+    normals = arena.bounce_normals.take(surface_indices, axis=0)
+    normal_cross = arena.bounce_cross.take(surface_indices, axis=0)
+    dot = np.einsum("ij,ij->i", velocities, normals)
+    v_perp = dot[:, None] * normals
+    s = (velocities - v_perp) + (normal_cross @ angular_velocities[:, :, None])[:, :, 0] * r
+
+    # fmax also gives the limit when |s| is 0, which makes delta_v_para 0
+    s_len = np.sqrt(np.einsum("ij,ij->i", s, s))
+    scale = np.fmax(-predict.BOUNCE_MU, (-2.0 * predict.BOUNCE_MU) * np.abs(dot) / s_len)
+    delta_v_para = s * scale[:, None]
+
+    velocities += v_perp * (predict.BOUNCINESS - 1) + delta_v_para
+    # delta_v_para.cross(normal) is -normal.cross(delta_v_para)
+    angular_velocities -= (normal_cross @ delta_v_para[:, :, None])[:, :, 0] * (predict.BOUNCE_A * r)
+
+
+def is_in_goal_mouth(locations):
+    return (locations[:, 2] < datalibs.GOAL_HEIGHT - datalibs.BALL_RADIUS) \
+           & (np.abs(locations[:, 0]) < datalibs.GOAL_WIDTH2 - datalibs.BALL_RADIUS)
+
+
+def move_balls(locations, velocities, angular_velocities, time, goal_times=None):
+    # Returns new (locations, velocities, angular_velocities) arrays with the state of every ball after the given
+    # time. time can be a float or an array with one entry per ball.
+    # If goal_times is given, it must be an array with one entry per ball. Balls are then only followed until they
+    # enter a goal, and goal_times gets the time of that, or inf for the balls that don't. The sign of the y of the
+    # returned location tells which goal it is.
+    # Each step moves every ball to its next contact, or to the end of its time. The steps work on all balls, with
+    # the finished ones standing still, since picking out the active balls costs more than it saves at these sizes
+    arena = surfaces()
+    locations = np.array(locations, dtype=float)
+    velocities = np.array(velocities, dtype=float)
+    angular_velocities = np.array(angular_velocities, dtype=float)
+    n = len(locations)
+    time = np.zeros(n) + time
+    rows = np.arange(n)
+    times = np.empty((n, arena.count))
+    radius = datalibs.BALL_RADIUS
+    vel_z = velocities[:, 2]
+    if goal_times is not None:
+        goal_times[:] = np.inf
+
+    now = np.zeros(n)
+    gravity = np.ones(n, dtype=bool)  # False while the ball is rolling on the ground
+    acc_z = np.full(n, arena.gravity_z)
+    events_left = predict.MIN_CONTACT_EVENTS + (time * predict.MAX_CONTACT_EVENTS_PER_SECOND).astype(int)
+    # Walls a ball is passing through into the goal
+    ignored = np.zeros((n, arena.count), dtype=bool)
+    any_ignored = False
+
+    active = time > 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        while active.any():
+            time_till_hits(locations, velocities, gravity, times)
+            if any_ignored:
+                times[ignored] = np.inf
+            surface = times.argmin(axis=1)
+            hit_time = now + times.min(axis=1)
+
+            # Balls with no contact before the time is up, or no contacts left, move the rest of the way and are done
+            finished = (hit_time > time) | (events_left == 0)
+            step = np.where(finished, time, hit_time) - now
+            step *= active
+            move_bodies(locations, velocities, step, acc_z)
+            now += step
+
+            active &= ~finished
+            events_left -= active
+
+            # Ground contacts either bounce or start rolling. Weak bounces also keep rolling balls on the ground
+            weak = np.abs(vel_z * predict.BOUNCINESS) < 2.0
+            on_ground = active & (surface == arena.ground_index)
+            starts_rolling = on_ground & weak
+            if starts_rolling.any():
+                vel_z[starts_rolling] = 0
+                locations[starts_rolling, 2] = radius
+                gravity[starts_rolling] = False
+                acc_z[starts_rolling] = 0
+
+            # Wall contacts bounce, except when the ball enters a goal
+            on_wall = active & ~on_ground
+            if on_wall.any():
+                enters_goal = on_wall & is_in_goal_mouth(locations)
+                if enters_goal.any():
+                    on_wall &= ~enters_goal
+                    if goal_times is not None:
+                        goal_times[enters_goal] = now[enters_goal]
+                        active &= ~enters_goal
+                    else:
+                        ignored[rows[enters_goal], surface[enters_goal]] = True
+                        any_ignored = True
+
+            # Bouncing all balls, with no_bounce for the others, is cheaper than picking out the bouncing ones
+            bounces = np.where(on_wall | (on_ground & ~weak), surface, arena.no_bounce)
+            if any_ignored:
+                prev_velocities = velocities[:, :2].copy()
+            bounce(velocities, angular_velocities, bounces)
+            if any_ignored:
+                # Like in predict.move_ball, a wall is only ignored until the ball's velocity towards it changes
+                changed = (velocities[:, :2] - prev_velocities) @ arena.wall_normals_xy != 0
+                ignored[:, :arena.wall_count] &= ~changed
+
+            # A rolling ball only leaves the ground if the bounce gave it some vertical speed
+            rolling_bounce = on_wall & ~gravity
+            if rolling_bounce.any():
+                weak = np.abs(vel_z * predict.BOUNCINESS) < 2.0
+                vel_z[rolling_bounce & weak] = 0
+                leaves_ground = rolling_bounce & ~weak
+                gravity[leaves_ground] = True
+                acc_z[leaves_ground] = arena.gravity_z
+
+    # Balls that used up their contacts moved the rest of the way through any surface. Keep them inside the arena
+    # at least
+    exhausted = (events_left == 0) & (time > 0)
+    if exhausted.any():
+        side_x = predict.SIDE_WALL_POS.wall_x - radius
+        back_y = predict.BACK_WALL_POS.wall_y - radius
+        locations[exhausted, 0] = np.clip(locations[exhausted, 0], -side_x, side_x)
+        locations[exhausted, 1] = np.clip(locations[exhausted, 1], -back_y, back_y)
+        locations[exhausted, 2] = np.clip(locations[exhausted, 2], radius, arena.ceiling_height - radius)
+
+    return locations, velocities, angular_velocities
@@ -1,12 +1,16 @@
 import rlutility
 import choices
 import datalibs
+import deadline
 import predict
 import route
 import moves
+import profiling
+import recording
 
 from vec import Vec3
-from rlbot.agents.base_agent import BaseAgent, SimpleControllerState
+from rlbot.agents.base_agent import BaseAgent, SimpleControllerState, BOT_CONFIG_AGENT_HEADER
+from rlbot.parsing.custom_config import ConfigObject
 from rlbot.utils.structures.game_data_struct import GameTickPacket
 
 
@@ -24,12 +28,46 @@ class Beast(BaseAgent):
         self.dodge_control = moves.DodgeControl()
         self.ignore_ori_till = 0
 
+        # Replaced with a profiling.TickProfiler if enabled in the config
+        self.profiler = profiling.NullProfiler()
+        # Replaced with a recording.Recorder if a recording file is given in the config
+        self.recorder = recording.NullRecorder()
+        # The time budget of each tick
+        self.deadline = deadline.Deadline()
+
+    @staticmethod
+    def create_agent_configurations(config: ConfigObject):
+        params = config.get_header(BOT_CONFIG_AGENT_HEADER)
+        params.add_value("profile", bool, default=False, description="Time each phase of a tick and print a summary periodically")
+        params.add_value("profile_interval", float, default=10.0, description="Seconds between profile summaries")
+        params.add_value("record", str, default="", description="File to record every packet to. {index} and {team} are replaced. Empty to not record")
+        params.add_value("deadline", float, default=deadline.TICK_BUDGET * 1000, description="Milliseconds per tick for optional refinements to fit in. 0 to always run them")
+
+    def load_config(self, config_header):
+        if config_header.getboolean("profile"):
+            self.profiler = profiling.TickProfiler(report_interval=config_header.getfloat("profile_interval"))
+        record_path = config_header.get("record")
+        if record_path:
+            self.recorder = recording.Recorder(record_path.format(index=self.index, team=self.team))
+        budget = config_header.getfloat("deadline")
+        self.deadline = deadline.Deadline(budget / 1000) if budget > 0 else deadline.NoDeadline()
+
     def initialize_agent(self):
         self.ut_system = get_offense_system(self)
         self.collect_boost = choices.CollectBoost(self)
+        # Simulate the dodges now, instead of in the middle of a game
+        moves.dodge_gains(False)
+        moves.dodge_gains(True)
 
     def get_output(self, packet: GameTickPacket) -> SimpleControllerState:
-        data = datalibs.Data(self, packet)
+        self.recorder.record(packet)
+        tick_deadline = self.deadline.begin()
+        profiler = self.profiler
+        profiler.begin("tick")
+
+        profiler.begin("data")
+        data = datalibs.Data(self, packet, tick_deadline=tick_deadline)
+        profiler.end("data")
 
         self.renderer.begin_rendering()
 
@@ -37,27 +75,47 @@ class Beast(BaseAgent):
 
         if self.dodge_control.is_dodging:
 
+            profiler.begin("dodge")
+            action = self.dodge_control.continue_dodge(data)
+            profiler.end("dodge")
+
             self.draw_status(data)
             self.renderer.end_rendering()
 
-            return self.dodge_control.continue_dodge(data)
         else:
+            profiler.begin("evaluate")
+            tick_deadline.stage(deadline.EVALUATE_SHARE)
             task, score = self.ut_system.evaluate(data)
-            if score < self.collect_boost.utility(data):
+            tick_deadline.stage(deadline.EXECUTE_SHARE)
+            profiler.end("evaluate")
+
+            profiler.begin("collect_boost")
+            collect_boost_score = self.collect_boost.utility(data)
+            profiler.end("collect_boost")
+
+            # Executing is its own phase, whether the task or collect boost is executed
+            profiler.begin("execute")
+            if score < collect_boost_score:
                 # collect boost has higher utility, bot keep the other task in mind
                 self.point_of_interest = task.get_point_of_interest(data)
                 action = self.collect_boost.execute(data)
             else:
                 action = task.execute(data)
+            profiler.end("execute")
 
             self.draw_status(data)
             self.renderer.end_rendering()
 
             if self.last_task != task:
-                print("Beast", self.index, "status:", str(task))
+                profiler.task_changed(task)
             self.last_task = task
 
-            return action
+        profiler.end("tick")
+        profiler.tick_done(packet.game_info.seconds_elapsed)
+        return action
+
+    def retire(self):
+        self.recorder.close()
 
     def draw_status(self, data):
         if self.last_task is not None:
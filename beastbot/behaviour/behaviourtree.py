@@ -9,10 +9,10 @@ ACTION = 3
 
 
 class BTNode:
-	def __init__(self, children=[]):
+	def __init__(self, children=None):
 		self.parent = None
 		self.children = []
-		for child in children:
+		for child in children or []:
 			self.add_child(child)
 	
 	def resolve(self, prev_status, car, packet: GameTickPacket):
@@ -62,7 +62,7 @@ class BehaviourTree:
 	
 	def reset(self):
 		self.current.reset()
-		self.current == self.root
+		self.current = self.root
 
 
 # ========================== Composite Nodes =========================================================================
@@ -70,7 +70,7 @@ class BehaviourTree:
 
 # Sequencer, aborts on failure by returning failure
 class Sequencer(BTNode):
-	def __init__(self, children = []):
+	def __init__(self, children=None):
 		super().__init__(children)
 		self.next = -1
 	
@@ -102,8 +102,6 @@ class Sequencer(BTNode):
 class Selector(BTNode):
 	def __init__(self, children=None):
 		super().__init__(children)
-		if children is None:
-			children = []
 		self.next = -1
 	
 	def resolve(self, prev_status, car, packet: GameTickPacket):
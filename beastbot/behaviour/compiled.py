@@ -0,0 +1,228 @@
+import copy
+
+from behaviour.behaviourtree import *
+from behaviour.datafetch import FetchContext
+
+from rlbot.agents.base_agent import SimpleControllerState
+from rlbot.utils.structures.game_data_struct import GameTickPacket
+
+
+# A BehaviourTree flattened into arrays indexed by node. The nodes are numbered breadth first, so the children of a
+# node are the indices child_start[i] to child_end[i]. The composite and decorator nodes from behaviourtree are
+# resolved by the executor loop from their kind code and state, without calling their resolve, and the rest (guards,
+# tasks and subclasses) are called like in BehaviourTree. The result is the same as resolving the BehaviourTree
+
+
+# Node kinds
+LEAF = 0
+SEQUENCER = 1
+SELECTOR = 2
+INVERTER = 3
+REPEAT_X_TIMES = 4
+TRY_X_TIMES = 5
+REPEAT_UNTIL_FAILURE = 6
+REPEAT_UNTIL_SUCCESS = 7
+ALWAYS_FAILURE = 8
+ALWAYS_SUCCESS = 9
+
+KIND_OF_TYPE = {
+	Sequencer: SEQUENCER,
+	Selector: SELECTOR,
+	Inverter: INVERTER,
+	RepeatXTimes: REPEAT_X_TIMES,
+	TryXTimes: TRY_X_TIMES,
+	RepeatUntilFailure: REPEAT_UNTIL_FAILURE,
+	RepeatUntilSuccess: REPEAT_UNTIL_SUCCESS,
+	AlwaysFailure: ALWAYS_FAILURE,
+	AlwaysSuccess: ALWAYS_SUCCESS,
+}
+
+# A resolve gives up after this many node visits per node in the tree, and continues where it was next tick
+DEFAULT_STEPS_PER_NODE = 8
+
+NO_NODE = -1
+
+
+class CompiledTree:
+	# The datafetch functions of the leaves go through the context, which can be shared with other trees. With
+	# prefetch, all of them are fetched at the start of each resolve. The tree keeps its own copies of the leaves for
+	# that, so the source tree is left as it was
+	def __init__(self, root, max_steps=None, context=None, prefetch=False):
+		self.nodes = []
+		self.kind = []
+		self.parent = []
+		self.child_start = []
+		self.child_end = []
+		self.x = []  # the x of RepeatXTimes and TryXTimes
+		self.state = []  # next child of composites, count of repeaters
+		self.index_of = {}  # by id of both the source node and the copy of a leaf
+		self.source_nodes = []  # keeps the ids in index_of in use
+		self.context = context if context is not None else FetchContext()
+		self.prefetch = prefetch
+		self.fetchers = []
+
+		# Breadth first, so each node's children get consecutive indices
+		self.add_node(root, NO_NODE)
+		i = 0
+		while i < len(self.nodes):
+			node = self.nodes[i]
+			self.child_start[i] = len(self.nodes)
+			for child in node.children:
+				self.add_node(child, i)
+			self.child_end[i] = len(self.nodes)
+			i += 1
+
+		self.max_steps = max_steps if max_steps is not None else DEFAULT_STEPS_PER_NODE * len(self.nodes)
+		self.current = 0
+		self.status = ACTION  # the status the current node is resolved with
+
+	def add_node(self, node, parent):
+		index = len(self.nodes)
+		kind = KIND_OF_TYPE.get(type(node), LEAF)
+		self.source_nodes.append(node)
+		self.index_of[id(node)] = index
+		if kind == LEAF:
+			# Leaves return the source tree's nodes as the next node, and themselves if they continue
+			node = copy.copy(node)
+		self.nodes.append(node)
+		self.kind.append(kind)
+		self.parent.append(parent)
+		self.child_start.append(index)
+		self.child_end.append(index)
+		self.x.append(getattr(node, "x", 0))
+		self.state.append(-1 if kind in (SEQUENCER, SELECTOR) else 0)
+		self.index_of[id(node)] = index
+
+		if kind == LEAF:
+			# Share datafetch results between the nodes
+			for name, value in list(vars(node).items()):
+				if not (name.endswith("Func") and callable(value)):
+					continue
+				if value not in self.fetchers:
+					self.fetchers.append(value)
+				setattr(node, name, self.context.wrap(value))
+
+	def reset_node(self, i):
+		kind = self.kind[i]
+		if kind == LEAF:
+			self.nodes[i].reset()
+		else:
+			self.state[i] = -1 if kind in (SEQUENCER, SELECTOR) else 0
+
+	def resolve(self, car, packet: GameTickPacket) -> SimpleControllerState:
+		if self.prefetch:
+			self.context.prefetch(car, packet, self.fetchers)
+		else:
+			self.context.begin_tick(packet)
+		kind = self.kind
+		parent = self.parent
+		child_start = self.child_start
+		state = self.state
+
+		i = self.current
+		status = self.status
+		for _ in range(self.max_steps):
+			k = kind[i]
+			if k == LEAF:
+				status, next_node, controller = self.nodes[i].resolve(status, car, packet)
+				nxt = NO_NODE if next_node is None else self.index_of[id(next_node)]
+				if status == ACTION:
+					self.current = 0 if nxt == NO_NODE else nxt
+					self.status = ACTION
+					return controller
+
+			elif k == SEQUENCER:
+				if status == FAILURE:
+					state[i] = -1
+					nxt = parent[i]
+				else:
+					state[i] += 1
+					if state[i] < self.child_end[i] - child_start[i]:
+						status, nxt = EVALUATING, child_start[i] + state[i]
+					else:
+						state[i] = -1
+						status, nxt = SUCCESS, parent[i]
+
+			elif k == SELECTOR:
+				if status == SUCCESS or status == ACTION:
+					state[i] = -1
+					status, nxt = SUCCESS, parent[i]
+				else:
+					state[i] += 1
+					if state[i] < self.child_end[i] - child_start[i]:
+						status, nxt = EVALUATING, child_start[i] + state[i]
+					else:
+						state[i] = -1
+						status, nxt = FAILURE, parent[i]
+
+			elif k == INVERTER:
+				if status == EVALUATING:
+					nxt = child_start[i]
+				else:
+					status, nxt = (SUCCESS if status == FAILURE else FAILURE), parent[i]
+
+			elif k == REPEAT_X_TIMES:
+				if state[i] < self.x[i]:
+					state[i] += 1
+					status, nxt = EVALUATING, child_start[i]
+				else:
+					state[i] = 0
+					status, nxt = SUCCESS, parent[i]
+
+			elif k == TRY_X_TIMES:
+				if status == ACTION or status == SUCCESS:
+					state[i] = 0
+					status, nxt = SUCCESS, parent[i]
+				elif state[i] < self.x[i]:
+					state[i] += 1
+					status, nxt = EVALUATING, child_start[i]
+				else:
+					state[i] = 0
+					status, nxt = FAILURE, parent[i]
+
+			elif k == REPEAT_UNTIL_FAILURE:
+				if status != FAILURE:
+					status, nxt = EVALUATING, child_start[i]
+				else:
+					status, nxt = SUCCESS, parent[i]
+
+			elif k == REPEAT_UNTIL_SUCCESS:
+				if status != SUCCESS and status != ACTION:
+					status, nxt = EVALUATING, child_start[i]
+				else:
+					status, nxt = SUCCESS, parent[i]
+
+			elif k == ALWAYS_FAILURE:
+				if status == EVALUATING:
+					nxt = child_start[i]
+				else:
+					status, nxt = FAILURE, parent[i]
+
+			else:  # ALWAYS_SUCCESS
+				if status == EVALUATING:
+					nxt = child_start[i]
+				else:
+					status, nxt = SUCCESS, parent[i]
+
+			if nxt == NO_NODE:
+				# We have reached the root, do nothing but start from root next time
+				self.current = 0
+				self.status = ACTION
+				self.reset_node(0)
+				return SimpleControllerState()
+			i = nxt
+
+		# Out of steps. Continue from here next tick
+		self.current = i
+		self.status = status
+		return SimpleControllerState()
+
+	def reset(self):
+		for i in range(len(self.nodes)):
+			self.reset_node(i)
+		self.current = 0
+		self.status = ACTION
+
+
+def compile_tree(tree: BehaviourTree, max_steps=None, context=None, prefetch=False) -> CompiledTree:
+	return CompiledTree(tree.root, max_steps, context, prefetch)
@@ -1,3 +1,4 @@
+import ctypes
 import math
 import rlmath
 import rlutility
@@ -85,3 +86,45 @@ def enemy_goal_location(car, packet: GameTickPacket):
 	if car.team == 1:
 		goal_offset *= -1
 	return Vec3(0, goal_offset)
+
+
+# Remembers what the fetch functions returned for each car in the current tick, so guards and tasks asking for the
+# same thing share one result. begin_tick must be called with each new packet, it forgets the last tick's results
+class FetchContext:
+	def __init__(self):
+		self.tick = None
+		self.values = {}
+
+	def begin_tick(self, packet: GameTickPacket):
+		tick = datalibs.tick_key(packet)
+		if tick != self.tick:
+			self.tick = tick
+			self.values.clear()
+
+	def fetch(self, func, car, packet: GameTickPacket):
+		# The packet is reused by the framework, so a car's address in it identifies the car
+		key = (func, ctypes.addressof(car))
+		try:
+			return self.values[key]
+		except KeyError:
+			value = self.values[key] = func(car, packet)
+			return value
+
+	def prefetch(self, car, packet: GameTickPacket, funcs):
+		# Fetches all of funcs for the car now, in one go at the start of the tick
+		self.begin_tick(packet)
+		for func in funcs:
+			self.fetch(func, car, packet)
+
+	def wrap(self, func):
+		# A function like func that fetches through this context
+		return ContextFetch(func, self)
+
+
+class ContextFetch:
+	def __init__(self, func, context):
+		self.func = func
+		self.context = context
+
+	def __call__(self, car, packet: GameTickPacket):
+		return self.context.fetch(self.func, car, packet)
@@ -0,0 +1,181 @@
+import argparse
+import contextlib
+import io
+import json
+import sys
+import time
+import tracemalloc
+
+import datalibs
+import headless
+import moves
+import recording
+
+from beastbot import Beast
+
+
+# Runs packets through the bot without a game and reports how long each part of the decision pipeline takes.
+# Run from the beastbot folder:  python benchmark.py --ticks 2000
+# Use --save and --compare to catch performance regressions between two versions.
+# Use --replay to run a recording made with the bot's record option, see recording.py
+
+
+def percentile(sorted_values, p):
+    # Nearest-rank percentile of an already sorted list
+    if not sorted_values:
+        return 0
+    index = min(len(sorted_values) - 1, max(0, int(round(p / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+class Stats:
+    def __init__(self):
+        self.times = []
+        self.peak_bytes = []
+
+    def summary(self):
+        times = sorted(self.times)
+        peaks = sorted(self.peak_bytes)
+        return {
+            "calls": len(times),
+            "p50_us": percentile(times, 50) * 1e6,
+            "p99_us": percentile(times, 99) * 1e6,
+            "peak_kib_p50": percentile(peaks, 50) / 1024,
+            "peak_kib_max": (peaks[-1] / 1024) if peaks else 0,
+        }
+
+
+def prepare(data):
+    # Computes the lazy predictions that several choices share, so they are measured on their own instead of as part
+    # of whichever choice happens to use them first
+    data.has_possession
+    data.active_boost_pads
+    data.intercept
+    data.threat
+
+
+def pipeline_steps(agent):
+    # Every step of the decision pipeline: name, and a function taking data
+    steps = [("Data.prepare", prepare)]
+    for choice in agent.ut_system.choices + [agent.collect_boost]:
+        # utility is always measured before execute, since some choices prepare their execute in utility
+        steps.append((type(choice).__name__ + ".utility", choice.utility))
+        steps.append((type(choice).__name__ + ".execute", choice.execute))
+    steps.append(("UtilitySystem.evaluate", agent.ut_system.evaluate))
+    return steps
+
+
+def run_step(agent, func, arg):
+    # Choices are free to start a dodge, which would change how the next steps behave. So start fresh each time.
+    # The packets are unrelated states, so a dodge carried over to the next packet would only skip the decisions
+    agent.dodge_control = moves.DodgeControl()
+    func(arg)
+
+
+def measure(packets, team=0, index=0, warmup=100):
+    agent = headless.make_agent(Beast, team, index)
+    stats = {}
+
+    def record(name, func, *args):
+        start = time.perf_counter()
+        func(*args)
+        stats.setdefault(name, Stats()).times.append(time.perf_counter() - start)
+
+    def record_alloc(name, func, *args):
+        tracemalloc.clear_traces()  # also resets the peak
+        func(*args)
+        current, peak = tracemalloc.get_traced_memory()
+        stats[name].peak_bytes.append(peak)
+
+    # The bot prints whenever its task changes
+    with contextlib.redirect_stdout(io.StringIO()):
+        for packet in packets[:warmup]:
+            run_step(agent, agent.get_output, packet)
+
+        # Latency. Full ticks first, then each step of the pipeline on its own
+        for packet in packets:
+            record("Beast.get_output", run_step, agent, agent.get_output, packet)
+        for packet in packets:
+            record("Data", datalibs.Data, agent, packet)
+            data = datalibs.Data(agent, packet)
+            for name, func in pipeline_steps(agent):
+                record(name, run_step, agent, func, data)
+
+        # Allocations are measured separately, since tracing them slows everything down
+        tracemalloc.start()
+        try:
+            for packet in packets:
+                record_alloc("Beast.get_output", run_step, agent, agent.get_output, packet)
+            for packet in packets:
+                record_alloc("Data", datalibs.Data, agent, packet)
+                data = datalibs.Data(agent, packet)
+                for name, func in pipeline_steps(agent):
+                    record_alloc(name, run_step, agent, func, data)
+        finally:
+            tracemalloc.stop()
+
+    return {name: s.summary() for name, s in stats.items()}
+
+
+def print_results(results, baseline=None):
+    print("{:<28} {:>7} {:>10} {:>10} {:>12} {:>12}".format("step", "calls", "p50 us", "p99 us", "peak KiB", "max KiB"))
+    for name, r in results.items():
+        line = "{:<28} {:>7} {:>10.1f} {:>10.1f} {:>12.1f} {:>12.1f}".format(
+            name, r["calls"], r["p50_us"], r["p99_us"], r["peak_kib_p50"], r["peak_kib_max"])
+        if baseline is not None and name in baseline and baseline[name]["p50_us"] > 0:
+            line += "  {:+.0%}".format(r["p50_us"] / baseline[name]["p50_us"] - 1)
+        print(line)
+
+
+def regressions(results, baseline, tolerance):
+    # Steps whose p50 or p99 latency got worse than the baseline by more than the tolerance
+    slow = []
+    for name, r in results.items():
+        if name not in baseline:
+            continue
+        for key in ("p50_us", "p99_us"):
+            if r[key] > baseline[name][key] * (1 + tolerance):
+                slow.append((name, key, baseline[name][key], r[key]))
+    return slow
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure the bot's per-tick latency and allocations without a game")
+    parser.add_argument("--ticks", type=int, help="number of packets. Default is 1000 synthetic packets or the whole replay")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--team", type=int, default=0)
+    parser.add_argument("--index", type=int, default=0)
+    parser.add_argument("--replay", help="use the packets of this recording instead of synthetic ones")
+    parser.add_argument("--save", help="write the results to this json file")
+    parser.add_argument("--compare", help="json file from an earlier --save. Exits with 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown when comparing, 0.2 = 20%%")
+    args = parser.parse_args(argv)
+
+    if args.replay:
+        packets = recording.Recording(args.replay)[:args.ticks]
+    else:
+        ticks = args.ticks or 1000
+        packets = [headless.kickoff_packet()] + headless.random_packets(ticks - 1, args.seed)
+    results = measure(packets, args.team, args.index)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    print_results(results, baseline)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if baseline is not None:
+        slow = regressions(results, baseline, args.tolerance)
+        for name, key, before, after in slow:
+            print("REGRESSION {} {}: {:.1f} -> {:.1f}".format(name, key, before, after))
+        return 1 if slow else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
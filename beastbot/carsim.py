@@ -0,0 +1,222 @@
+import math
+import numpy as np
+from vec import Vec3
+
+
+# A simple car model for rolling out sequences of controller inputs. Many rollouts are simulated at once, with all
+# cars held in numpy arrays, so options can be compared by simulating them side by side. Cars drive on flat ground
+# or fly ballistic after a jump. Walls, the ceiling and the car's pitch and roll are ignored, and a dodge is just
+# an impulse, so the model is only good for looking a second or two ahead.
+
+TICK = 1 / 120
+
+GRAVITY = -650
+MAX_SPEED = 2300
+THROTTLE_MAX_SPEED = 1410
+BOOST_ACCEL = 991.667
+BRAKE_ACCEL = 3500
+COAST_ACCEL = 525
+AIR_THROTTLE_ACCEL = 66.667
+BOOST_PER_SECOND = 33.3
+
+JUMP_IMPULSE = 291.667
+JUMP_HOLD_ACCEL = 1458.333
+JUMP_HOLD_TIME = 0.2
+DODGE_IMPULSE = 500
+DODGE_WINDOW = 1.25  # the second jump must come this soon after the first
+DODGE_DEADZONE = 0.5  # with less pitch and yaw than this, the second jump is a double jump
+DODGE_Z_DAMPING = 0.35  # a dodge cancels most of the car's vertical velocity
+
+AIR_YAW_RATE = 2.5
+HANDBRAKE_TURN = 1.5  # the handbrake makes turns this much tighter
+HANDBRAKE_GRIP = 3.0  # and lets the car slide sideways, losing this fraction of its sideways speed per second
+REST_HEIGHT = 17.01
+# The walls the car can't drive through, at x and y
+WALL_X = 4096
+WALL_Y = 5120
+
+
+def throttle_accel(v):
+    # Acceleration from full throttle at the given forward speeds
+    return np.interp(v, [0, 1400, 1410], [1600, 160, 0], right=0)
+
+
+# The curvature is linear between these speeds. Same as moves.kappa
+KAPPA_SPEEDS = [0, 500, 1000, 1500, 1750, 2500]
+KAPPA_VALUES = [0.0069, 0.00398, 0.00235, 0.001375, 0.0011, 0.0008]
+
+
+def kappa(v):
+    # Curvature at the given forward speeds, for arrays of speeds
+    return np.interp(v, KAPPA_SPEEDS, KAPPA_VALUES, right=0)
+
+
+class CarStates:
+    # A batch of simulated cars
+    def __init__(self, count):
+        self.location = np.zeros((count, 3))
+        self.velocity = np.zeros((count, 3))
+        self.yaw = np.zeros(count)
+        self.boost = np.zeros(count)
+        self.on_ground = np.ones(count, dtype=bool)
+        self.jump_time = np.full(count, math.inf)  # time since the first jump
+        self.holding_jump = np.zeros(count, dtype=bool)  # the first jump is still held, so it gives more height
+        self.can_jump_again = np.zeros(count, dtype=bool)
+        self.prev_jump = np.zeros(count, dtype=bool)
+
+    def __len__(self):
+        return len(self.yaw)
+
+    @staticmethod
+    def from_car(car, count=1):
+        # count copies of a datalibs.Car. An airborne car is assumed to have used its jumps
+        states = CarStates(count)
+        states.location[:] = car.location.tuple()
+        states.velocity[:] = car.velocity.tuple()
+        states.yaw[:] = car.orientation.front.ang()
+        states.boost[:] = car.boost
+        states.on_ground[:] = car.wheel_contact
+        return states
+
+    def copy(self):
+        states = CarStates(0)
+        for name, value in vars(self).items():
+            setattr(states, name, value.copy())
+        return states
+
+    def location_of(self, i):
+        return Vec3(*self.location[i])
+
+    def forward_speed(self):
+        return self.velocity[:, 0] * np.cos(self.yaw) + self.velocity[:, 1] * np.sin(self.yaw)
+
+
+class Controls:
+    # Controller inputs as (ticks, count) arrays, made from one sequence of SimpleControllerStates per car.
+    # A sequence has one state per tick. Sequences shorter than ticks hold their last state
+    FIELDS = ["throttle", "steer", "pitch", "yaw", "boost", "jump", "handbrake"]
+
+    def __init__(self, sequences, ticks):
+        for name in Controls.FIELDS:
+            setattr(self, name, np.zeros((ticks, len(sequences))))
+        for i, sequence in enumerate(sequences):
+            for tick in range(ticks):
+                state = sequence[min(tick, len(sequence) - 1)]
+                for name in Controls.FIELDS:
+                    getattr(self, name)[tick, i] = float(getattr(state, name))
+
+
+def step(states, throttle, steer, pitch, yaw, boost, jump, handbrake, dt=TICK):
+    # Advances all cars one tick. The inputs are arrays with one entry per car
+    ground = states.on_ground
+    all_on_ground = ground.all()
+    vel = states.velocity
+    cos_yaw = np.cos(states.yaw)
+    sin_yaw = np.sin(states.yaw)
+    vf = vel[:, 0] * cos_yaw + vel[:, 1] * sin_yaw
+    vs = vel[:, 1] * cos_yaw - vel[:, 0] * sin_yaw  # towards the car's right side
+
+    # Forwards acceleration. On the ground the throttle accelerates, brakes when against the car's movement, and
+    # the car coasts to a stop without it. Boost works everywhere
+    speed_f = np.abs(vf)
+    accel = np.where(throttle * vf < 0, np.sign(throttle) * BRAKE_ACCEL, throttle * throttle_accel(speed_f))
+    accel = np.where(throttle == 0, -np.sign(vf) * np.minimum(COAST_ACCEL, speed_f / dt), accel)
+    if not all_on_ground:
+        accel = np.where(ground, accel, throttle * AIR_THROTTLE_ACCEL)
+    boosting = (boost > 0) & (states.boost > 0)
+    if boosting.any():
+        accel += boosting * BOOST_ACCEL
+        states.boost = np.maximum(states.boost - boosting * (BOOST_PER_SECOND * dt), 0)
+    vf = vf + accel * dt
+
+    # Turning. Without the handbrake the wheels keep the car moving the way it faces
+    sliding = handbrake > 0
+    turn_rate = vf * kappa(np.abs(vf)) * steer
+    if sliding.any():
+        turn_rate *= np.where(sliding, HANDBRAKE_TURN, 1)
+        vs = np.where(sliding, vs * max(1 - HANDBRAKE_GRIP * dt, 0), 0)
+    else:
+        vs = 0
+    if not all_on_ground:
+        turn_rate = np.where(ground, turn_rate, yaw * AIR_YAW_RATE)
+        vs = np.where(ground, vs, vel[:, 1] * cos_yaw - vel[:, 0] * sin_yaw)
+    states.yaw = states.yaw + turn_rate * dt
+    if not all_on_ground:
+        # Only the wheels turn the velocity
+        cos_yaw = np.where(ground, np.cos(states.yaw), cos_yaw)
+        sin_yaw = np.where(ground, np.sin(states.yaw), sin_yaw)
+    else:
+        cos_yaw = np.cos(states.yaw)
+        sin_yaw = np.sin(states.yaw)
+    vel[:, 0] = vf * cos_yaw - vs * sin_yaw
+    vel[:, 1] = vf * sin_yaw + vs * cos_yaw
+
+    # Jumping. The first jump leaves the ground and gives more height while held. A second press before
+    # DODGE_WINDOW dodges in the direction of pitch and yaw, or jumps again if they are too small
+    jump = jump > 0
+    if jump.any() or states.holding_jump.any() or states.prev_jump.any():
+        pressed = jump & ~states.prev_jump
+        first_jump = pressed & ground
+        states.holding_jump = (states.holding_jump & jump & (states.jump_time < JUMP_HOLD_TIME)) | first_jump
+        second_jump = pressed & ~ground & states.can_jump_again & (states.jump_time < DODGE_WINDOW)
+        dodging = second_jump & (np.abs(pitch) + np.abs(yaw) >= DODGE_DEADZONE)
+        vel[:, 2] += (first_jump | (second_jump & ~dodging)) * JUMP_IMPULSE
+        vel[:, 2] += (states.holding_jump & ~first_jump) * (JUMP_HOLD_ACCEL * dt)
+        if dodging.any():
+            # Forwards is negative pitch
+            norm = np.maximum(np.sqrt(pitch * pitch + yaw * yaw), 1e-9)
+            forwards = -pitch / norm
+            right = yaw / norm
+            vel[:, 0] += dodging * DODGE_IMPULSE * (forwards * cos_yaw - right * sin_yaw)
+            vel[:, 1] += dodging * DODGE_IMPULSE * (forwards * sin_yaw + right * cos_yaw)
+            vel[:, 2] *= np.where(dodging, DODGE_Z_DAMPING, 1)
+        states.can_jump_again = (states.can_jump_again | first_jump) & ~second_jump
+        states.jump_time = np.where(first_jump, 0, states.jump_time)
+        states.on_ground = ground = ground & ~first_jump
+        all_on_ground = all_on_ground and not first_jump.any()
+        states.prev_jump = jump
+    states.jump_time = states.jump_time + dt
+
+    # Speed limit, gravity and movement
+    speed = np.sqrt(vel[:, 0] ** 2 + vel[:, 1] ** 2 + vel[:, 2] ** 2)
+    if (speed > MAX_SPEED).any():
+        vel *= np.minimum(MAX_SPEED / np.maximum(speed, 1e-9), 1)[:, None]
+    if not all_on_ground:
+        airborne = ~ground
+        vel[:, 2] += airborne * (GRAVITY * dt)
+    states.location += vel * dt
+
+    # Landing and the walls
+    if not all_on_ground:
+        landed = airborne & (states.location[:, 2] <= REST_HEIGHT) & (vel[:, 2] <= 0)
+        if landed.any():
+            states.location[:, 2] = np.where(landed, REST_HEIGHT, states.location[:, 2])
+            vel[:, 2] = np.where(landed, 0, vel[:, 2])
+            states.on_ground = ground | landed
+            states.jump_time = np.where(landed, math.inf, states.jump_time)
+            states.can_jump_again &= ~landed
+    for axis, half_size in ((0, WALL_X), (1, WALL_Y)):
+        outside = np.abs(states.location[:, axis]) > half_size
+        if outside.any():
+            states.location[:, axis] = np.clip(states.location[:, axis], -half_size, half_size)
+            vel[:, axis] = np.where(outside, 0, vel[:, axis])
+
+
+def rollout(states, sequences, ticks, dt=TICK, path=False):
+    # Simulates each car in states with the matching controller sequence for ticks ticks. The states are changed in
+    # place. If path is True, the locations after each tick are returned as a (ticks, count, 3) array
+    controls = Controls(sequences, ticks)
+    locations = np.zeros((ticks, len(states), 3)) if path else None
+    for tick in range(ticks):
+        step(states, controls.throttle[tick], controls.steer[tick], controls.pitch[tick], controls.yaw[tick],
+             controls.boost[tick], controls.jump[tick], controls.handbrake[tick], dt)
+        if path:
+            locations[tick] = states.location
+    return locations
+
+
+def location_after(car, sequence, time, dt=1 / 60):
+    # Where the datalibs.Car will be after following the controller sequence for the given time
+    states = CarStates.from_car(car)
+    rollout(states, [sequence], int(math.ceil(time / dt)), dt)
+    return states.location_of(0)
@@ -1,12 +1,15 @@
 import math
+import carsim
 import moves
-import time
 import rlmath
 import rlutility as rlu
 import easing
 import predict
 import datalibs
+import intercept
 import route
+import padindex
+import planner
 from vec import Vec3
 
 from rlbot.agents.base_agent import SimpleControllerState
@@ -29,7 +32,7 @@ class Dribbling:
 
     def execute(self, data):
         ball_land_eta = max(predict.time_of_arrival_at_height(data.ball, datalibs.BALL_RADIUS + 1).time, 0)
-        ball_land_loc = predict.move_ball(data.ball.copy(), ball_land_eta).location
+        ball_land_loc = data.ball_trajectory.state_at(ball_land_eta).location
 
         bias = (ball_land_loc - datalibs.get_goal_location(data.enemy.team)).rescale(20)
         dest = ball_land_loc + bias
@@ -92,9 +95,11 @@ class ShootAtGoal:
         self.aim_cone = None
         self.ball_to_goal_right = None
         self.ball_to_goal_left = None
+        self.planner = planner.RoutePlanner()
+        self.shot_search = route.ShotSearch()
 
     def utility(self, data):
-        ball_soon = predict.move_ball(data.ball.copy(), 1)
+        ball_soon = data.ball_trajectory.state_at(1)
         team_sign = datalibs.team_sign(data.car.team)
 
         own_half_01 = easing.fix(easing.remap(team_sign * datalibs.ARENA_LENGTH2, (-1 * team_sign) * datalibs.ARENA_LENGTH2, 0.0, 1.1, ball_soon.location.y))
@@ -110,17 +115,38 @@ class ShootAtGoal:
     def execute(self, data):
         car_to_ball = data.ball_when_hit.location - data.car.location
 
-        # Check dodge. A dodge happens after 0.18 sec
-        ball_soon = predict.move_ball(data.ball.copy(), 0.15).location
-        car_soon = predict.move_ball(datalibs.Ball().set(data.car), 0.25).location
-        car_to_ball_soon = ball_soon - car_soon
-        # Aim cone was calculated in utility
-        if car_to_ball_soon.length() < 240+92 and self.aim_cone.contains_direction(car_to_ball_soon):
-            if data.agent.dodge_control.can_dodge(data):
-                data.agent.dodge_control.begin_dodge(data, lambda d: d.ball.location, True)
+        # Check dodge. A dodge happens after 0.18 sec. The car can't get further than max speed allows, so the dodge
+        # is only simulated if the ball is close enough. The simulated dodge boosts like the real one
+        ball_soon = data.ball_trajectory.state_at(0.15).location
+        if ball_soon.dist(data.car.location) < 240+92 + 0.25 * carsim.MAX_SPEED and data.agent.dodge_control.can_dodge(data):
+            boost = True
+            ball_soon_rel = data.car.relative_location(ball_soon).flat().normalized()
+            dodge = data.agent.dodge_control.dodge_controls(-ball_soon_rel.x, ball_soon_rel.y, boost,
+                                                            moves.DODGE_SIM_STEP)
+            car_soon = carsim.location_after(data.car, dodge, 0.25, moves.DODGE_SIM_STEP)
+            car_to_ball_soon = ball_soon - car_soon
+            # Aim cone was calculated in utility
+            if car_to_ball_soon.length() < 240+92 and self.aim_cone.contains_direction(car_to_ball_soon):
+                data.agent.dodge_control.begin_dodge(data, lambda d: d.ball.location, boost)
                 data.agent.dodge_control.continue_dodge(data)
 
-        goto, goto_time = self.aim_cone.get_goto_point(data, data.ball_when_hit.location)
+        # The best moment to shoot, at the intercept or a bit later
+        shot = self.shot_search.find(data, self.enemy_goal_right, self.enemy_goal_left)
+        if shot is not None:
+            goto, goto_time, hit_time = shot.goto, shot.goto_time, shot.time
+            ball_loc, aim_dir = shot.ball_loc, shot.aim_dir
+        else:
+            goto, goto_time = self.aim_cone.get_goto_point(data, data.ball_when_hit.location)
+            hit_time = data.time_till_hit
+            ball_loc = data.ball_when_hit.location
+            aim_dir = self.aim_cone.get_center_dir()
+        if goto is not None and goto_time < 1:
+            # The car must come around to hit the ball towards the goal. Plan the way there
+            target = ball_loc.flat() - aim_dir * 50
+            planned = self.planner.plan(data, target, aim_dir, data.agent.collect_boost.pad_index)
+            route.draw_route(data.renderer, planned)
+            goto = planned.next_point
+            goto_time = planned.car_loc.dist(goto) / max(planned.remaining_length(), 1)
         dist = car_to_ball.length()
 
         self.aim_cone.draw(data.renderer, data.ball_when_hit.location, b=0)
@@ -137,7 +163,7 @@ class ShootAtGoal:
                 # return home
                 enemy_goal = datalibs.get_goal_location(data.enemy.team)
                 goal_to_ball = (data.ball_when_hit.location - enemy_goal).normalized()
-                offset_ball = data.ball_when_hit.location + goal_to_ball * 92
+                offset_ball = goal_to_ball.imul(92).iadd(data.ball_when_hit.location)
                 data.renderer.draw_line_3d(data.car.location.tuple(), offset_ball.tuple(), self.color(data.renderer))
                 return moves.go_towards_point(data, offset_ball, False, True)
             else:
@@ -148,7 +174,7 @@ class ShootAtGoal:
         else:
             if moves.consider_dodge(data, goto):
                 return data.agent.dodge_control.continue_dodge(data)
-            return moves.go_towards_point_with_timing(data, goto, data.time_till_hit * goto_time * 0.95, True)
+            return moves.go_towards_point_with_timing(data, goto, hit_time * goto_time * 0.95, True)
 
     def get_point_of_interest(self, data):
         return data.ball.location
@@ -224,8 +250,8 @@ class DefendGoal:
         ball_on_my_half_01 = easing.fix(easing.remap((-1*team_sign) * datalibs.ARENA_LENGTH2, team_sign * datalibs.ARENA_LENGTH2, 0, 1.6, data.ball.location.y))
         enemy_on_my_half_01 = easing.fix(easing.remap((-1*team_sign) * datalibs.ARENA_LENGTH2, team_sign * datalibs.ARENA_LENGTH2, 0.5, 1.1, data.ball.location.y))
 
-        enemy_reaches_first = predict.time_till_reach_ball(data.ball, data.enemy) < data.time_till_hit
-        enemy_first_01 = 1 if enemy_reaches_first else 0.6
+        # How likely the enemy reaches the ball first, over the threat samples
+        enemy_first_01 = 0.6 + 0.4 * data.threat.enemy_first
 
         return easing.fix(ball_on_my_half_01 * enemy_on_my_half_01 * vel_g_01 * enemy_first_01)
 
@@ -256,6 +282,10 @@ class DefendGoal:
 
 
 
+# How many intercepts SaveGoal tries when the car can't get to the right side of the ball at the first one
+SAVE_INTERCEPTS = 3
+
+
 class SaveGoal:
     def __init__(self, agent):
         team_sign = datalibs.team_sign(agent.team)
@@ -264,10 +294,9 @@ class SaveGoal:
         self.aim_cone = None
         self.ball_to_goal_right = None
         self.ball_to_goal_left = None
+        self.shot_search = route.ShotSearch()
 
     def utility(self, data):
-        team_sign = datalibs.team_sign(data.car.team)
-
         ball_to_goal = datalibs.get_goal_location(data.car.team) - data.ball.location
         ball_vel_g = data.ball.velocity.proj_onto_size(ball_to_goal)
         if ball_vel_g > 0:
@@ -277,8 +306,9 @@ class SaveGoal:
 
         too_close = ball_to_goal.length2() < 900*900
 
-        hits_goal_prediction = predict.will_ball_hit_goal(data.ball)
-        hits_goal = hits_goal_prediction.happens and rlmath.sign(data.ball.velocity.y) == team_sign and hits_goal_prediction.time < 6
+        # The chance that the ball ends in our goal, if we don't stop it
+        threat = data.threat
+        hits_goal = threat.probability if threat.time_to_goal < 6 else 0
 
         return easing.fix(vel_g_01) or hits_goal or too_close
 
@@ -288,7 +318,12 @@ class SaveGoal:
         self.aim_cone = route.AimCone(self.ball_to_goal_left.ang(), self.ball_to_goal_right.ang())
         car_to_ball = data.ball_when_hit.location - data.car.location
         in_position = self.aim_cone.contains_direction(car_to_ball)
-        goto, goto_time = self.aim_cone.get_goto_point(data, data.ball_when_hit.location)
+        # The best moment to save, at the intercept or a bit later
+        shot = self.shot_search.find(data, self.own_goal_left, self.own_goal_right)
+        if shot is not None:
+            goto, goto_time, hit_time = shot.goto, shot.goto_time, shot.time
+        else:
+            goto, goto_time, hit_time = self.intercept_goto(data)
 
         self.aim_cone.draw(data.renderer, data.ball_when_hit.location, r=220, g=0, b=110)
 
@@ -302,7 +337,21 @@ class SaveGoal:
         else:
             if moves.consider_dodge(data, goto):
                 return data.agent.dodge_control.continue_dodge(data)
-            return moves.go_towards_point_with_timing(data, goto, data.time_till_hit * goto_time * 0.95, True)
+            return moves.go_towards_point_with_timing(data, goto, hit_time * goto_time * 0.95, True)
+
+    def intercept_goto(self, data):
+        # The goto point at the intercept. If the car can't get to the right side of the ball there, the later
+        # intercepts are tried, while the deadline allows searching for them
+        goto, goto_time = self.aim_cone.get_goto_point(data, data.ball_when_hit.location)
+        if goto is not None:
+            return goto, goto_time, data.time_till_hit
+        for later in intercept.find_intercepts(data.car, data.ball_trajectory, SAVE_INTERCEPTS, data.deadline)[1:]:
+            ball_loc = later.ball.location
+            aim_cone = route.AimCone((self.own_goal_left - ball_loc).ang(), (self.own_goal_right - ball_loc).ang())
+            goto, goto_time = aim_cone.get_goto_point(data, ball_loc)
+            if goto is not None:
+                return goto, goto_time, later.time
+        return None, 1, data.time_till_hit
 
     def get_point_of_interest(self, data):
         return datalibs.get_goal_location(data.car.team)
@@ -314,19 +363,41 @@ class SaveGoal:
         return r.create_color(255, 220, 0, 110)
 
 
+# How much a boost pad's cached score may be off, before it is re-scored
+BOOST_PAD_SCORE_TOLERANCE = 0.02
+# How many of the nearest pads CollectBoost considers
+BOOST_PAD_CANDIDATES = 8
+
+
 class CollectBoost:
     def __init__(self, agent):
         self.collect_boost_system = None
+        self.pad_index = None
         self.init_array(agent)
 
     def init_array(self, agent):
+        field_info = agent.get_field_info()
         boost_choices = []
-        for i, pad in enumerate(agent.get_field_info().boost_pads):
-            if i >= agent.get_field_info().num_boosts:
-                break
-            boost_choices.append(SpecificBoostPad(pad, i))
-
-        self.collect_boost_system = rlu.UtilitySystem(boost_choices, 0)
+        for i in range(field_info.num_boosts):
+            boost_choices.append(SpecificBoostPad(field_info.boost_pads[i], i))
+
+        self.collect_boost_system = rlu.UtilitySystem(boost_choices, 0, BOOST_PAD_SCORE_TOLERANCE)
+        self.pad_index = padindex.BoostPadIndex(field_info)
+
+    def candidate_pads(self, data):
+        # Pads behind the car have a utility of 0, so only the nearest active pads in front of it are considered.
+        # Full boost pads are worth going further for, so those in front are always included
+        active = data.active_boost_pads
+        front = data.car.orientation.front
+        candidates = self.pad_index.nearest(data.car.location, BOOST_PAD_CANDIDATES, active, front)
+        for i in self.pad_index.full_boosts:
+            if (active >> i) & 1 and i not in candidates and self.pad_index.in_cone(data.car.location, i, front):
+                candidates.append(i)
+        if not candidates:
+            candidates = self.pad_index.nearest(data.car.location, 1, active)
+        if not candidates:
+            candidates = self.pad_index.nearest(data.car.location, 1)
+        return candidates
 
     def utility(self, data):
         if data.car.boost == 100:
@@ -346,7 +417,7 @@ class CollectBoost:
 
     def execute(self, data):
         try:
-            best, score = self.collect_boost_system.evaluate(data)
+            best, score = self.collect_boost_system.evaluate(data, self.candidate_pads(data))
             return best.execute(data)
         except ValueError:
             self.init_array(data.agent)
@@ -400,6 +471,42 @@ class SpecificBoostPad:
         # data.renderer.draw_line_3d(data.car.location.tuple(), self.location.tuple(), data.renderer.create_color(255, 0, int(result * 255), 0))
         return result
 
+    def utility_inputs(self, data):
+        # The point of interest is not included, since that part of the utility is disabled
+        rotation = data.car.rotation
+        heading = rotation.yaw if math.cos(rotation.pitch) > 0 else rotation.yaw + math.pi
+        loc = data.car.location
+        state = data.packet.game_boosts[self.index]
+        between_car_and_goal = datalibs.is_point_closer_to_goal(self.location, loc, data.car.team)
+        return loc.x, loc.y, loc.z, heading, state.is_active, between_car_and_goal
+
+    def utility_error(self, scored_inputs, inputs):
+        x0, y0, z0, heading0, active0, btcg0 = scored_inputs
+        x1, y1, z1, heading1, active1, btcg1 = inputs
+        if active0 != active1 or btcg0 != btcg1:
+            return math.inf
+        if not active1:
+            return 0
+
+        # The utility is dist * ang * k, where dist and ang are in [0, 1] and k is constant here.
+        # So it changes at most k * (dist_change + (dist + dist_change) * ang_change)
+        k = (1 if self.info.is_full_boost else 0.65) * (1 if btcg1 else 0.9)
+        moved = math.sqrt((x1 - x0)**2 + (y1 - y0)**2 + (z1 - z0)**2)
+        dist_change = moved / rlu.MAX_DIST
+        pad_dist = math.sqrt((self.location.x - x0)**2 + (self.location.y - y0)**2 + (self.location.z - z0)**2)
+        dist = 1 - rlu.dist_01(pad_dist)
+
+        # ang is the cos of the angle between the heading and the flat direction to the pad. That direction turns at
+        # most moved_flat / (pad_dist_flat - moved_flat) radians when the car moves
+        moved_flat = math.sqrt((x1 - x0)**2 + (y1 - y0)**2)
+        pad_dist_flat = math.sqrt((self.location.x - x0)**2 + (self.location.y - y0)**2)
+        if moved_flat >= pad_dist_flat:
+            return math.inf
+        direction_change = moved_flat / (pad_dist_flat - moved_flat)
+        heading_change = abs(rlmath.fix_ang(heading1 - heading0))
+
+        return k * (dist_change + (dist + dist_change) * (direction_change + heading_change))
+
     def execute(self, data):
         data.renderer.draw_line_3d(data.car.location.tuple(), self.location.tuple(), data.renderer.create_color(255, 0, 180, 0))
         return moves.go_towards_point(data, self.location, True, self.info.is_full_boost)
@@ -407,7 +514,7 @@ class SpecificBoostPad:
 
 class FixAirOrientation:
     def utility(self, data):
-        return not data.car.wheel_contact and time.time() > data.agent.ignore_ori_till
+        return not data.car.wheel_contact and data.time > data.agent.ignore_ori_till
 
     def execute(self, data):
         return moves.fix_orientation(data)
@@ -1,7 +1,11 @@
 import math
+import deadline
 import rlmath
 import rlutility
 import predict
+import intercept
+import threat
+import padindex
 import render
 from vec import *
 
@@ -88,7 +92,7 @@ class Ball:
 
     def set(self, other):
         self.location.set(other.location)
-        self.location_2d = self.location.flat()
+        self.location_2d.set_xyz(other.location.x, other.location.y, 0.0)
         self.velocity.set(other.velocity)
         self.angular_velocity.set(other.angular_velocity)
         return self
@@ -97,75 +101,196 @@ class Ball:
         return Ball().set(self)
 
 
+class lazy:
+    # Decorator that turns a method without arguments into an attribute, which is computed on first access.
+    # The result is stored on the instance, so later reads are plain attribute lookups
+    def __init__(self, func):
+        self.func = func
+        self.name = func.__name__
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        value = self.func(instance)
+        instance.__dict__[self.name] = value
+        return value
+
+
 class Car:
-    def __init__(self, game_car):
+    def __init__(self, game_car, rotation):
         self.team = int(game_car.team)
         self.location = Vec3().set(game_car.physics.location)
         self.location_2d = self.location.flat()
         self.velocity = Vec3().set(game_car.physics.velocity)
         self.angular_velocity = Vec3().set(game_car.physics.angular_velocity)
-        self.orientation = Orientation(game_car.physics.rotation)
+        self.rotation = rotation  # a copy, see World
         self.boost = int(game_car.boost)
         self.is_on_wall = not ARENA_EXCEPT_WALLS_ZONE.contains(self.location)
         self.wheel_contact = game_car.has_wheel_contact
 
-        # Default values for variables, set by Data
-        self.has_possession = False
-        self.possession_score = 0
-        self.dist_to_ball = 1000
-        self.dist_to_ball_2d = 1000
-        self.ang_to_ball_2d = 0
+        # Set by World. The ball dependent variables are computed when first used
+        self.ball = None
+
+    @lazy
+    def orientation(self):
+        return Orientation(self.rotation)
 
     def set_ball_dependent_variables(self, ball):
-        car_to_ball_2d = ball.location_2d - self.location_2d
+        self.ball = ball
+
+    @lazy
+    def dist_to_ball(self):
+        if self.ball is None:
+            return 1000
+        return self.location.dist(self.ball.location)
+
+    @lazy
+    def dist_to_ball_2d(self):
+        if self.ball is None:
+            return 1000
+        return self.location_2d.dist(self.ball.location_2d)
+
+    @lazy
+    def ang_to_ball_2d(self):
+        if self.ball is None:
+            return 0
+        return self.orientation.front.ang_to_flat(self.ball.location_2d - self.location_2d)
+
+    @lazy
+    def possession_score(self):
+        if self.ball is None:
+            return 0
+        try:
+            car_to_ball = self.ball.location - self.location
 
-        self.dist_to_ball = self.location.dist(ball.location)
-        self.dist_to_ball_2d = car_to_ball_2d.length()
-        self.ang_to_ball_2d = self.orientation.front.ang_to_flat(car_to_ball_2d)
+            dist = car_to_ball.length()
+            ang = self.orientation.front.ang_to(car_to_ball)
+
+            return rlutility.dist_01(dist) * rlutility.face_ang_01(ang)
+        except ZeroDivisionError:
+            return 0
+
+    @lazy
+    def orientation_matrix(self):
+        return self.orientation.matrix()
 
     def relative_location(self, location):
         return relative_location(self.location, location, self.orientation)
 
-class Data:
-    def __init__(self, agent, packet: GameTickPacket, should_render=False):
-        self.agent = agent
-        if should_render:
-            self.renderer = agent.renderer
-        else:
-            self.renderer = render.FakeRenderer()
+    def relative_locations(self, locations):
+        # relative_location of an (M, 3) array of locations at once. Worth it from a handful of locations
+        return relative_locations(self.location, locations, self.orientation_matrix)
+
+class World:
+    # The data of a tick, which is the same for every agent. Agents in the same process share it, see get_world.
+    # Like Data, everything but the ball is computed when first used
+    def __init__(self, packet: GameTickPacket, key=None):
         self.packet = packet
+        self.key = key
+        self.time = packet.game_info.seconds_elapsed
         self.ball = Ball().set_game_ball(packet.game_ball)
+        self.__cars = [None] * packet.num_cars
+        # The packet is reused by the framework, so keep a copy of the rotations for the orientations
+        self.rotations = []
+        for i in range(packet.num_cars):
+            rotation = packet.game_cars[i].physics.rotation
+            self.rotations.append(type(rotation).from_buffer_copy(rotation))
 
-        self.car = Car(packet.game_cars[agent.index])
-        self.enemy = Car(packet.game_cars[1 - agent.index])
+    def car(self, index):
+        car = self.__cars[index]
+        if car is None:
+            car = self.__cars[index] = Car(self.packet.game_cars[index], self.rotations[index])
+            car.set_ball_dependent_variables(self.ball)
+        return car
 
-        self.car.set_ball_dependent_variables(self.ball)
-        self.enemy.set_ball_dependent_variables(self.ball)
+    @lazy
+    def orientation_matrices(self):
+        # Orientation matrices of all cars as one (car count, 3, 3) array
+        return orientation_matrices([(rotation.pitch, rotation.yaw, rotation.roll) for rotation in self.rotations])
 
-        self.__decide_possession()
+    def relative_locations(self, index, locations):
+        # Car.relative_locations for the car with the given index, using the shared matrices
+        return relative_locations(self.car(index).location, locations, self.orientation_matrices[index])
 
-        # predictions
-        self.time_till_hit = predict.time_till_reach_ball(self.ball, self.car)
-        self.ball_when_hit = predict.move_ball(self.ball.copy(), self.time_till_hit)
-        if self.ball_when_hit.location.z > 100:
-            time_till_ground = predict.time_of_arrival_at_height(self.ball_when_hit, 100).time
-            self.ball_when_hit = predict.move_ball(self.ball_when_hit, time_till_ground)
-            self.time_till_hit += time_till_ground
+    @lazy
+    def active_boost_pads(self):
+        # bitmask, bit i is set if boost pad i is active
+        return padindex.active_mask(self.packet)
 
+    @lazy
+    def ball_trajectory(self):
+        return predict.BallTrajectory(self.ball)
 
-    def __decide_possession(self):
-        self.car.possession_score = self.__get_possession_score(self.car)
-        self.enemy.possession_score = self.__get_possession_score(self.enemy)
-        self.car.has_possession = self.car.possession_score >= self.enemy.possession_score
-        self.enemy.has_possession = not self.car.has_possession
 
-    def __get_possession_score(self, car):
-        try:
-            car_to_ball = self.ball.location - car.location
+_shared_world = None
 
-            dist = car_to_ball.length()
-            ang = car.orientation.front.ang_to(car_to_ball)
 
-            return rlutility.dist_01(dist) * rlutility.face_ang_01(ang)
-        except ZeroDivisionError:
-            return 0
+def tick_key(packet: GameTickPacket):
+    # Identifies the moment of a packet. The ball location is part of the key, so unrelated packets with the same
+    # game time don't get mixed up
+    ball_loc = packet.game_ball.physics.location
+    return packet.game_info.seconds_elapsed, ball_loc.x, ball_loc.y, ball_loc.z
+
+
+def get_world(packet: GameTickPacket):
+    # Returns the World of the given packet. The last one is reused, if the packet is from the same moment
+    global _shared_world
+    key = tick_key(packet)
+    if _shared_world is None or _shared_world.key != key:
+        _shared_world = World(packet, key)
+    return _shared_world
+
+
+class Data:
+    # The data of a tick from an agent's point of view. The parts that are the same for everyone are shared through
+    # the World. Everything else is computed when first used, and then kept for the rest of the tick.
+    # Optional refinements ask the deadline if there is time for them, see deadline.py
+    def __init__(self, agent, packet: GameTickPacket, should_render=False, tick_deadline=None):
+        self.agent = agent
+        self.deadline = tick_deadline if tick_deadline is not None else deadline.NO_DEADLINE
+        if should_render:
+            self.renderer = agent.renderer
+        else:
+            self.renderer = render.FakeRenderer()
+        self.packet = packet
+        self.time = packet.game_info.seconds_elapsed
+        self.world = get_world(packet)
+        self.ball = self.world.ball
+
+        self.car = self.world.car(agent.index)
+        self.enemy = self.world.car(1 - agent.index)
+
+    @lazy
+    def has_possession(self):
+        # If the scores are equal, our car has possession
+        return self.car.possession_score >= self.enemy.possession_score
+
+    @lazy
+    def active_boost_pads(self):
+        return self.world.active_boost_pads
+
+    # predictions
+    @lazy
+    def ball_trajectory(self):
+        return self.world.ball_trajectory
+
+    @lazy
+    def intercept(self):
+        return intercept.find_intercept(self.car, self.ball_trajectory)
+
+    @lazy
+    def time_till_hit(self):
+        return self.intercept.time
+
+    @lazy
+    def ball_when_hit(self):
+        return self.intercept.ball
+
+    @lazy
+    def threat(self):
+        # The threat to our goal, see threat.py
+        return threat.evaluate(self.ball, self.ball_trajectory, self.enemy, self.time_till_hit, self.car.team,
+                               self.deadline)
@@ -0,0 +1,82 @@
+import math
+import time
+
+
+# The time budget of a tick. A tick is a few stages, each allowed to run until some share of the budget is used.
+# The work that decides the action always runs, but optional refinements, like planning a route again or searching
+# for more shots, first ask the deadline if there is time left for them in the current stage. The deadline measures
+# what each refinement costs, so a refinement is skipped when it wouldn't finish in time, instead of after it overran.
+# Skipped refinements leave the result of the cheaper way, which is always there, so an action is ready in time no
+# matter how expensive the game state is.
+
+# The game runs at 120 ticks per second. What is left is for the framework
+TICK_BUDGET = 0.005
+# Share of the budget the stages may use, counted from the start of the tick
+EVALUATE_SHARE = 0.5
+EXECUTE_SHARE = 1.0
+# How fast the measured cost of a refinement follows new measurements
+COST_SMOOTHING = 0.2
+# How fast the cost of a skipped refinement falls back to its default cost, per skip
+COST_SKIP_DECAY = 0.2
+
+
+class Deadline:
+    def __init__(self, budget=TICK_BUDGET, clock=time.perf_counter):
+        self.budget = budget
+        self.clock = clock
+        self.start = 0
+        self.end = math.inf
+        self.stage_end = math.inf
+        self.costs = {}  # measured cost of each refinement in seconds
+        self.skipped = 0  # refinements skipped this tick
+
+    def begin(self):
+        self.start = self.clock()
+        self.end = self.start + self.budget
+        self.stage_end = self.end
+        self.skipped = 0
+        return self
+
+    def stage(self, share):
+        # The next refinements must be done when share of the budget is used
+        self.stage_end = min(self.start + share * self.budget, self.end)
+
+    def remaining(self):
+        return self.stage_end - self.clock()
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def allows(self, name, default_cost=0.0):
+        # True if the refinement is expected to be done before the stage ends. Refinements that were never measured
+        # cost default_cost
+        cost = self.costs.get(name, default_cost)
+        if self.remaining() >= cost:
+            return True
+        # A skipped refinement isn't measured, so after one slow run it would be skipped for good. Instead its cost
+        # falls back towards default_cost with every skip, until a tick has time to run and measure it again
+        if cost > default_cost:
+            self.costs[name] = cost + COST_SKIP_DECAY * (default_cost - cost)
+        self.skipped += 1
+        return False
+
+    def measure(self, name, start):
+        # Records what a refinement that started at start (from clock) cost
+        cost = self.clock() - start
+        prev = self.costs.get(name)
+        self.costs[name] = cost if prev is None else prev + COST_SMOOTHING * (cost - prev)
+
+
+class NoDeadline(Deadline):
+    # Allows everything, for code that runs outside the game
+    def __init__(self):
+        super().__init__(math.inf)
+
+    def allows(self, name, default_cost=0.0):
+        return True
+
+    def measure(self, name, start):
+        pass
+
+
+NO_DEADLINE = NoDeadline()
@@ -0,0 +1,135 @@
+import math
+import random
+import render
+
+from rlbot.utils.structures.game_data_struct import GameTickPacket, FieldInfoPacket
+
+
+# Stand-ins for what the RLBot framework normally gives an agent, so the bot can be run without a game.
+
+# Boost pads of a standard soccar field: (x, y, z, is_full_boost)
+SOCCAR_BOOST_PADS = [
+    (0.0, -4240.0, 70.0, False), (-1792.0, -4184.0, 70.0, False), (1792.0, -4184.0, 70.0, False),
+    (-3072.0, -4096.0, 73.0, True), (3072.0, -4096.0, 73.0, True), (-940.0, -3308.0, 70.0, False),
+    (940.0, -3308.0, 70.0, False), (0.0, -2816.0, 70.0, False), (-3584.0, -2484.0, 70.0, False),
+    (3584.0, -2484.0, 70.0, False), (-1788.0, -2300.0, 70.0, False), (1788.0, -2300.0, 70.0, False),
+    (-2048.0, -1036.0, 70.0, False), (0.0, -1024.0, 70.0, False), (2048.0, -1036.0, 70.0, False),
+    (-3584.0, 0.0, 73.0, True), (-1024.0, 0.0, 70.0, False), (1024.0, 0.0, 70.0, False),
+    (3584.0, 0.0, 73.0, True), (-2048.0, 1036.0, 70.0, False), (0.0, 1024.0, 70.0, False),
+    (2048.0, 1036.0, 70.0, False), (-1788.0, 2300.0, 70.0, False), (1788.0, 2300.0, 70.0, False),
+    (-3584.0, 2484.0, 70.0, False), (3584.0, 2484.0, 70.0, False), (0.0, 2816.0, 70.0, False),
+    (-940.0, 3310.0, 70.0, False), (940.0, 3308.0, 70.0, False), (-3072.0, 4096.0, 73.0, True),
+    (3072.0, 4096.0, 73.0, True), (-1792.0, 4184.0, 70.0, False), (1792.0, 4184.0, 70.0, False),
+    (0.0, 4240.0, 70.0, False)
+]
+
+TICK_RATE = 120
+
+
+class HeadlessRenderer(render.FakeRenderer):
+    def begin_rendering(self, group_id="default"):
+        pass
+
+    def end_rendering(self):
+        pass
+
+
+def make_field_info(pads=SOCCAR_BOOST_PADS):
+    field_info = FieldInfoPacket()
+    field_info.num_boosts = len(pads)
+    for i, (x, y, z, is_full_boost) in enumerate(pads):
+        pad = field_info.boost_pads[i]
+        pad.location.x, pad.location.y, pad.location.z = x, y, z
+        pad.is_full_boost = is_full_boost
+    return field_info
+
+
+def make_agent(agent_class, team, index, field_info=None):
+    # Creates an agent ready to receive packets, as if it was started by the framework
+    if field_info is None:
+        field_info = make_field_info()
+    agent = agent_class("Headless" + str(index), team, index)
+    agent.renderer = HeadlessRenderer()
+    agent.get_field_info = lambda: field_info
+    agent.initialize_agent()
+    return agent
+
+
+def set_physics(physics, location, velocity=(0, 0, 0), rotation=(0, 0, 0), angular_velocity=(0, 0, 0)):
+    physics.location.x, physics.location.y, physics.location.z = location
+    physics.velocity.x, physics.velocity.y, physics.velocity.z = velocity
+    physics.rotation.pitch, physics.rotation.yaw, physics.rotation.roll = rotation
+    physics.angular_velocity.x, physics.angular_velocity.y, physics.angular_velocity.z = angular_velocity
+
+
+def make_packet(ball, cars, boosts_active=None, seconds_elapsed=0.0, is_kickoff_pause=False):
+    # ball is a dict with keyword arguments for set_physics.
+    # cars is a list of dicts with set_physics arguments and optionally team, boost and wheel_contact
+    packet = GameTickPacket()
+
+    set_physics(packet.game_ball.physics, **ball)
+
+    packet.num_cars = len(cars)
+    for i, car in enumerate(cars):
+        game_car = packet.game_cars[i]
+        car = dict(car)
+        game_car.team = car.pop("team", i % 2)
+        game_car.boost = car.pop("boost", 34)
+        game_car.has_wheel_contact = car.pop("wheel_contact", True)
+        set_physics(game_car.physics, **car)
+
+    if boosts_active is None:
+        boosts_active = [True] * len(SOCCAR_BOOST_PADS)
+    packet.num_boost = len(boosts_active)
+    for i, active in enumerate(boosts_active):
+        packet.game_boosts[i].is_active = active
+
+    packet.game_info.seconds_elapsed = seconds_elapsed
+    packet.game_info.is_round_active = True
+    packet.game_info.is_kickoff_pause = is_kickoff_pause
+    packet.game_info.game_speed = 1.0
+    packet.game_info.world_gravity_z = -650
+    return packet
+
+
+def kickoff_packet(seconds_elapsed=0.0):
+    cars = [
+        dict(location=(-2048, -2560, 17), rotation=(0, math.pi / 4, 0), team=0),
+        dict(location=(2048, 2560, 17), rotation=(0, -3 * math.pi / 4, 0), team=1),
+    ]
+    return make_packet(dict(location=(0, 0, 92.75)), cars, seconds_elapsed=seconds_elapsed, is_kickoff_pause=True)
+
+
+def random_packet(rng: random.Random, seconds_elapsed=0.0, car_count=2):
+    # A random, but plausible, game state
+    if rng.random() < 0.5:
+        # rolling ball
+        ball = dict(location=(rng.uniform(-3800, 3800), rng.uniform(-4800, 4800), 92.75),
+                    velocity=(rng.uniform(-1500, 1500), rng.uniform(-1500, 1500), 0))
+    else:
+        ball = dict(location=(rng.uniform(-3800, 3800), rng.uniform(-4800, 4800), rng.uniform(100, 1500)),
+                    velocity=(rng.uniform(-2000, 2000), rng.uniform(-2000, 2000), rng.uniform(-1000, 1000)),
+                    angular_velocity=(rng.uniform(-6, 6), rng.uniform(-6, 6), rng.uniform(-6, 6)))
+
+    cars = []
+    for i in range(car_count):
+        yaw = rng.uniform(-math.pi, math.pi)
+        speed = rng.uniform(0, 2300)
+        on_ground = rng.random() < 0.9
+        cars.append(dict(
+            location=(rng.uniform(-4000, 4000), rng.uniform(-5000, 5000), 17 if on_ground else rng.uniform(50, 1000)),
+            velocity=(speed * math.cos(yaw), speed * math.sin(yaw), 0 if on_ground else rng.uniform(-500, 500)),
+            rotation=(0 if on_ground else rng.uniform(-1, 1), yaw, 0 if on_ground else rng.uniform(-1, 1)),
+            team=i % 2,
+            boost=rng.randint(0, 100),
+            wheel_contact=on_ground
+        ))
+
+    boosts_active = [rng.random() < 0.7 for _ in SOCCAR_BOOST_PADS]
+    return make_packet(ball, cars, boosts_active, seconds_elapsed)
+
+
+def random_packets(count, seed=0, car_count=2):
+    # Independent random states with a steadily running game clock
+    rng = random.Random(seed)
+    return [random_packet(rng, i / TICK_RATE, car_count) for i in range(count)]
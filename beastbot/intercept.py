@@ -0,0 +1,90 @@
+import datalibs
+import deadline
+import predict
+import reach
+
+
+# Finds where a car can hit the ball, by comparing the ball's predicted path with the time it takes the car to
+# get there. The slack at time t is t minus the time the car needs to reach the ball's location at t. The path is
+# scanned in coarse steps until the slack is positive, and the exact time is then found with a binary search.
+
+SCAN_STEP = 0.25
+BISECTION_STEPS = 6
+ALTERNATIVE_SPACING = 0.5
+# What scanning for one later intercept costs before it is measured (seconds)
+ALTERNATIVE_COST = 0.0002
+# The car waits for the ball to come down to this height, like before the intercept search
+MAX_HIT_HEIGHT = 100
+
+
+class Intercept:
+    def __init__(self, time, ball, feasible=True):
+        self.time = time
+        self.ball = ball
+        self.feasible = feasible  # False if the car can't reach the ball within the trajectory's horizon
+
+
+def slack(car, trajectory, time):
+    # Returns (slack, ball at time). Skips the table lookup if the ball is too far away to reach at top speed
+    ball = trajectory.state_at(time)
+    dist = ball.location.dist_flat(car.location) - datalibs.BALL_RADIUS - predict.REACH_MARGIN
+    if dist > time * reach.MAX_SPEED:
+        return time - dist / reach.MAX_SPEED, ball
+    return time - predict.time_till_reach_location(car, ball.location), ball
+
+
+def find_intercepts(car, trajectory: "predict.BallTrajectory", count=1, tick_deadline=deadline.NO_DEADLINE):
+    # Returns the earliest intercept, followed by up to count - 1 later ones, each at least ALTERNATIVE_SPACING apart.
+    # The later ones are only searched for while the deadline allows it, so fewer may be returned. If the car can't
+    # reach the ball within the trajectory's horizon, a single infeasible intercept is returned
+    intercepts = []
+    prev_time = 0
+    time = 0
+    while time <= trajectory.horizon:
+        s, ball = slack(car, trajectory, time)
+        if s >= 0:
+            if not intercepts:
+                # Binary search for the exact time between the previous step and this one
+                low, high = prev_time, time
+                for i in range(BISECTION_STEPS):
+                    if high - low <= 0:
+                        break
+                    mid = (low + high) / 2
+                    mid_slack, mid_ball = slack(car, trajectory, mid)
+                    if mid_slack >= 0:
+                        high, ball = mid, mid_ball
+                    else:
+                        low = mid
+                time = high
+            intercepts.append(wait_for_ball(trajectory, Intercept(time, ball)))
+            if len(intercepts) > 1:
+                tick_deadline.measure("intercept_alternative", start)
+            if len(intercepts) >= count or not tick_deadline.allows("intercept_alternative", ALTERNATIVE_COST):
+                break
+            start = tick_deadline.clock()
+            prev_time = time
+            time += ALTERNATIVE_SPACING
+        else:
+            prev_time = time
+            time += SCAN_STEP
+
+    if not intercepts:
+        # Not reachable in time. Aim for where the ball will be, when the car gets to where it is at the horizon
+        last = trajectory.state_at(trajectory.horizon)
+        time = max(trajectory.horizon, predict.time_till_reach_location(car, last.location))
+        intercepts.append(Intercept(time, trajectory.state_at(time), False))
+
+    return intercepts
+
+
+def find_intercept(car, trajectory: "predict.BallTrajectory"):
+    return find_intercepts(car, trajectory, 1)[0]
+
+
+def wait_for_ball(trajectory, intercept):
+    # Moves the intercept to when the ball is low enough to hit
+    if intercept.ball.location.z > MAX_HIT_HEIGHT:
+        time_till_ground = predict.time_of_arrival_at_height(intercept.ball, MAX_HIT_HEIGHT).time
+        intercept.time += time_till_ground
+        intercept.ball = trajectory.state_at(intercept.time)
+    return intercept
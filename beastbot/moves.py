@@ -1,7 +1,9 @@
+import functools
 import math
+import carsim
 import rlmath
+import numpy as np
 import datalibs
-import time
 from datalibs import Data
 from vec import Vec3, UP
 from route import Route
@@ -9,6 +11,12 @@ from rlbot.agents.base_agent import SimpleControllerState
 
 REQUIRED_SLIDE_ANG = 1.6
 
+# Dodges are judged by simulating them with carsim. consider_dodge compares dodging with driving on, which is
+# simulated once for every speed step
+DODGE_SPEED_STEP = 50
+DODGE_SIM_STEP = 1 / 60
+MIN_DODGE_GAIN = 50
+
 
 class PIDControl:
     def __init__(self):
@@ -22,12 +30,23 @@ class PIDControl:
 
 
 class DodgeControl:
+    # Times are game time, from data.time, so dodges are the same no matter how fast the game runs.
+    # The dodge goes through the phases below. A phase lasts at least one tick, so no input is missed at low tick rates
+    PHASE_JUMP = 0
+    PHASE_UNJUMP = 1
+    PHASE_AIM = 2
+    PHASE_SECOND_JUMP = 3
+    PHASE_SECOND_UNJUMP = 4
+    PHASE_WAIT_FLIP = 5
+    PHASE_FINISHING = 6
+
     def __init__(self):
         self.is_dodging = False
         self.target = None
         self.boost = False
-        self.last_start_time = time.time()
-        self.last_end_time = time.time()
+        self.phase = DodgeControl.PHASE_JUMP
+        self.last_start_time = -math.inf
+        self.last_end_time = -math.inf
 
         self._t_first_unjump = 0.10
         self._t_aim = 0.13
@@ -40,22 +59,28 @@ class DodgeControl:
         self._max_speed = 1900
         self._boost_ang_req = 0.25
 
+        # When each phase begins
+        self._phase_starts = [0, self._t_first_unjump, self._t_aim, self._t_second_jump, self._t_second_unjump,
+                              self._t_wait_flip, self._t_finishing]
+
     def can_dodge(self, data):
-        return time.time() >= self.last_end_time + self._t_ready and data.car.wheel_contact and not self.is_dodging
+        # The game clock starts over in a new match
+        ready = data.time >= self.last_end_time + self._t_ready or data.time < self.last_end_time
+        return ready and data.car.wheel_contact and not self.is_dodging
 
     def begin_dodge(self, data, target, boost=False):
         if not self.can_dodge(data):
             return None
 
         self.is_dodging = True
-        self.last_start_time = time.time()
+        self.phase = DodgeControl.PHASE_JUMP
+        self.last_start_time = data.time
         self.target = target
         self.boost = boost
         data.agent.ignore_ori_till = self.last_start_time + self._t_finishing
 
     def continue_dodge(self, data):
-        ct = time.time()
-        controller = SimpleControllerState()
+        self.phase = self.next_phase(self.phase, data.time - self.last_start_time)
 
         # target is allowed to be a function that takes data as a parameter. Check what it is
         if callable(self.target):
@@ -63,43 +88,53 @@ class DodgeControl:
         else:
             target = self.target
         car_to_point = target - data.car.location
-        vel = data.car.velocity.proj_onto_size(car_to_point)
-        face_ang = car_to_point.ang_to(data.car.orientation.front)
-        controller.boost = self.boost and face_ang < self._boost_ang_req and vel < self._max_speed
 
-        if ct >= self.last_start_time + self._t_finishing:
+        if self.phase == DodgeControl.PHASE_FINISHING:
             if data.car.wheel_contact:
-                self.end_dodge()
+                self.end_dodge(data)
             return fix_orientation(data)
 
-        elif ct >= self.last_start_time + self._t_wait_flip:
-            controller.throttle = 1
-
-        elif ct >= self.last_start_time + self._t_second_unjump:
-            controller.throttle = 1
-
-        elif ct >= self.last_start_time + self._t_aim:
-            if ct >= self.last_start_time + self._t_second_jump:
-                controller.jump = 1
+        car_to_point_u = car_to_point.flat().normalized()
+        car_to_point_rel = car_to_point_u.rotate_2d(-data.car.orientation.front.ang())
+        controller = self.phase_controls(self.phase, -car_to_point_rel.x, car_to_point_rel.y)
 
-            controller.throttle = 1
+        vel = data.car.velocity.proj_onto_size(car_to_point)
+        face_ang = car_to_point.ang_to(data.car.orientation.front)
+        controller.boost = self.boost and face_ang < self._boost_ang_req and vel < self._max_speed
 
-            car_to_point_u = car_to_point.flat().normalized()
-            car_to_point_rel = car_to_point_u.rotate_2d(-data.car.orientation.front.ang())
-            controller.pitch = -car_to_point_rel.x
-            controller.yaw = car_to_point_rel.y
+        return controller
 
-        elif ct >= self.last_start_time + self._t_first_unjump:
-            controller.throttle = 1
+    def next_phase(self, phase, elapsed):
+        # The phase of the next tick, elapsed seconds into the dodge. At most one phase is moved per tick
+        if phase < DodgeControl.PHASE_FINISHING and elapsed >= self._phase_starts[phase + 1]:
+            return phase + 1
+        return phase
 
-        elif ct >= self.last_start_time:
+    def phase_controls(self, phase, pitch, yaw):
+        # The controls of a phase before the car is left to land
+        controller = SimpleControllerState()
+        controller.throttle = 1
+        if phase == DodgeControl.PHASE_JUMP:
             controller.jump = 1
-            controller.throttle = 1
-
+        elif phase == DodgeControl.PHASE_AIM or phase == DodgeControl.PHASE_SECOND_JUMP:
+            controller.jump = phase == DodgeControl.PHASE_SECOND_JUMP
+            controller.pitch = pitch
+            controller.yaw = yaw
         return controller
 
-    def end_dodge(self):
-        self.last_end_time = time.time()
+    def dodge_controls(self, pitch=-1.0, yaw=0.0, boost=False, dt=carsim.TICK):
+        # The controls of a whole dodge, one per tick, for simulating it with carsim
+        controls = []
+        phase = DodgeControl.PHASE_JUMP
+        for tick in range(int(math.ceil(self._t_finishing / dt))):
+            phase = self.next_phase(phase, tick * dt)
+            controller = self.phase_controls(phase, pitch, yaw)
+            controller.boost = boost
+            controls.append(controller)
+        return controls
+
+    def end_dodge(self, data):
+        self.last_end_time = data.time
         self.is_dodging = False
         self.target = None
         self.boost = False
@@ -111,7 +146,6 @@ class DodgeControl:
 def go_towards_point(data, point: Vec3, slide=False, boost=False) -> SimpleControllerState:
     controller_state = SimpleControllerState()
 
-    car_to_point = point - data.car.location
     point_rel = data.car.relative_location(point)
     steer_correction_radians = point_rel.ang()
 
@@ -124,11 +158,14 @@ def go_towards_point(data, point: Vec3, slide=False, boost=False) -> SimpleContr
     vf = data.car.velocity.proj_onto_size(data.car.orientation.front)
     tr = turn_radius(abs(vf))
     tr_side = 1 if steer_correction_radians > 0 else -1
-    tr_center = (data.car.location + data.car.orientation.right * tr * tr_side).flat()
-    too_close = point.flat().dist2(tr_center) < tr * tr
+    car_loc = data.car.location
+    right = data.car.orientation.right
+    tr_center = Vec3(car_loc.x + right.x * tr * tr_side, car_loc.y + right.y * tr * tr_side)
+    dist2_to_tr_center = point.dist2_flat(tr_center)
+    too_close = dist2_to_tr_center < tr * tr
     if too_close:
         do_smoothing = False
-        if point.flat().dist2(tr_center) < tr*tr * 0.3:
+        if dist2_to_tr_center < tr*tr * 0.3:
             do_smoothing = True
 
     if do_smoothing:
@@ -138,7 +175,7 @@ def go_towards_point(data, point: Vec3, slide=False, boost=False) -> SimpleContr
 
     if boost:
         if not data.car.is_on_wall and not controller_state.handbrake and data.car.velocity.length() < 2000:
-            if is_heading_towards2(steer_correction_radians, car_to_point.length()):
+            if is_heading_towards2(steer_correction_radians, point.dist(car_loc)):
                 if data.car.orientation.up.ang_to(UP) < math.pi*0.3:
                     controller_state.boost = True
 
@@ -206,7 +243,9 @@ def reach_point_with_timing_and_vel(data: Data, point: Vec3, eta: float, vel_d:
 
 
 def follow_route(data: Data, route: Route):
-    return go_towards_point(data, route.points[0], False, True)
+    # The route is kept between ticks, so move it along first
+    route.advance(data.car.location.flat())
+    return go_towards_point(data, route.next_point, False, True)
 
 
 def fix_orientation(data: Data, point = None):
@@ -215,7 +254,7 @@ def fix_orientation(data: Data, point = None):
     strength = 0.22
     ori = data.car.orientation
 
-    if point is None and data.car.velocity.flat().length2() != 0:
+    if point is None and (data.car.velocity.x != 0 or data.car.velocity.y != 0):
         point = data.car.location + data.car.velocity.flat().rescale(500)
 
     pitch_error = -ori.pitch * strength
@@ -241,18 +280,44 @@ def consider_dodge(data: Data, point, min_dist=1000):
         car_to_point = point - data.car.location
         point_rel = data.car.relative_location(point)
         ang = point_rel.ang()
-        vel_f = data.car.velocity.proj_onto_size(car_to_point)
         dist = car_to_point.length()
-        req_dist = max(min_dist, vel_f * 1.2)
 
-        if point_rel.x > 0 and 400 < vel_f < 2000 and dist > req_dist and is_heading_towards2(ang, dist):
+        if point_rel.x > 0 and dist > min_dist and is_heading_towards2(ang, dist):
             boost = data.car.boost > 40 and dist > 4000
-            data.agent.dodge_control.begin_dodge(data, point, boost)
-            return True
+            vel_f = data.car.velocity.proj_onto_size(car_to_point)
+            gain, dodge_dist = dodge_gain(vel_f, boost)
+            # Dodge if it is faster than driving, and the car lands before it gets to the point
+            if gain > MIN_DODGE_GAIN and dist > dodge_dist:
+                data.agent.dodge_control.begin_dodge(data, point, boost)
+                return True
 
     return False
 
 
+def dodge_gain(speed, boost):
+    # Returns how much further a forward dodge gets than driving straight on, and how far the dodge gets, when the
+    # dodge is done. Both start on flat ground at the given forward speed
+    gains, dists = dodge_gains(boost)
+    i = min(max(int(round(speed / DODGE_SPEED_STEP)), 0), len(gains) - 1)
+    return gains[i], dists[i]
+
+
+@functools.lru_cache(maxsize=None)
+def dodge_gains(boost):
+    # dodge_gain for every speed step, simulated all at once
+    speeds = np.arange(0, carsim.MAX_SPEED + DODGE_SPEED_STEP, DODGE_SPEED_STEP)
+    count = len(speeds)
+    dodge = DodgeControl().dodge_controls(boost=boost, dt=DODGE_SIM_STEP)
+    drive = SimpleControllerState(throttle=1, boost=boost)
+    states = carsim.CarStates(2 * count)
+    states.location[:, 2] = carsim.REST_HEIGHT
+    states.velocity[:, 0] = np.concatenate([speeds, speeds])
+    states.boost[:] = 100 if boost else 0
+    carsim.rollout(states, [dodge] * count + [[drive]] * count, len(dodge), DODGE_SIM_STEP)
+    dodge_dists = states.location[:count, 0]
+    return (dodge_dists - states.location[count:, 0]).tolist(), dodge_dists.tolist()
+
+
 def go_to_and_stop(data: Data, point, boost=True, slide=True):
     controller_state = SimpleControllerState()
 
@@ -302,7 +367,7 @@ def jump_to_face(data: Data, point, angle=0.7, stop=True):
         return SimpleControllerState()
 
     if data.agent.dodge_control.can_dodge(data):
-        data.agent.ignore_ori_till = time.time() + 0.7
+        data.agent.ignore_ori_till = data.time + 0.7
         controller_state = SimpleControllerState()
         controller_state.jump = 1
         return controller_state
@@ -347,7 +412,7 @@ def is_heading_towards(car, point):
     car_direction = car.orientation.front
     car_to_point = point - car.location
     ang = car_direction.ang_to_flat(car_to_point)
-    dist = car_to_point.length()
+    dist = point.dist(car.location)
     return is_heading_towards2(ang, dist)
 
 
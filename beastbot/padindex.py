@@ -0,0 +1,84 @@
+import bisect
+import math
+
+
+# An index over the boost pads, built once from the field info, for finding the pads near a point.
+# The field is divided into a grid, and each cell knows all pads sorted by distance to the cell's center. A query
+# walks the list of its cell and stops once the remaining pads must be further away than the ones found.
+# Which pads are active is given as a bitmask, where bit i is set if pad i is active
+
+CELL_SIZE = 1024
+
+
+def active_mask(packet):
+    mask = 0
+    boosts = packet.game_boosts
+    for i in range(packet.num_boost):
+        if boosts[i].is_active:
+            mask |= 1 << i
+    return mask
+
+
+class BoostPadIndex:
+    def __init__(self, field_info, cell_size=CELL_SIZE):
+        self.cell_size = cell_size
+        self.count = field_info.num_boosts
+        self.locations = []
+        self.full_boosts = []
+        for i in range(self.count):
+            pad = field_info.boost_pads[i]
+            self.locations.append((float(pad.location.x), float(pad.location.y)))
+            if pad.is_full_boost:
+                self.full_boosts.append(i)
+
+        xs = [x for x, y in self.locations] or [0]
+        ys = [y for x, y in self.locations] or [0]
+        self.min_cell = self.cell_of(min(xs), min(ys))
+        self.max_cell = self.cell_of(max(xs), max(ys))
+
+        self.cells = {}
+        for cx in range(self.min_cell[0], self.max_cell[0] + 1):
+            for cy in range(self.min_cell[1], self.max_cell[1] + 1):
+                center = ((cx + 0.5) * cell_size, (cy + 0.5) * cell_size)
+                pads = sorted((math.hypot(x - center[0], y - center[1]), i) for i, (x, y) in enumerate(self.locations))
+                self.cells[(cx, cy)] = center, pads
+
+    def cell_of(self, x, y):
+        return int(math.floor(x / self.cell_size)), int(math.floor(y / self.cell_size))
+
+    def in_cone(self, location, index, direction, min_cos=0.0):
+        # True if the cos of the angle between the direction and the pad (on the xy plane) is at least min_cos
+        px, py = self.locations[index]
+        dx, dy = px - location.x, py - location.y
+        dot = dx * direction.x + dy * direction.y
+        return dot >= min_cos * math.sqrt((dx * dx + dy * dy) * (direction.x * direction.x + direction.y * direction.y))
+
+    def nearest(self, location, k, mask=-1, direction=None, min_cos=0.0):
+        # Returns the indexes of the k pads closest to location (on the xy plane) sorted by distance, only including
+        # pads in the mask. If a direction is given, only pads within the cone around the direction are included,
+        # i.e. the cos of the angle between the direction and the pad is at least min_cos
+        x, y = location.x, location.y
+        cx, cy = self.cell_of(x, y)
+        cx = min(max(self.min_cell[0], cx), self.max_cell[0])
+        cy = min(max(self.min_cell[1], cy), self.max_cell[1])
+        center, pads = self.cells[(cx, cy)]
+        # A pad is at least its distance to the center minus this from the location
+        offset = math.hypot(x - center[0], y - center[1])
+
+        dir_len = 0
+        if direction is not None:
+            dir_len = math.sqrt(direction.x * direction.x + direction.y * direction.y)
+
+        found = []  # sorted (dist, index)
+        for center_dist, i in pads:
+            if len(found) >= k and center_dist - offset > found[k - 1][0]:
+                break
+            if not (mask >> i) & 1:
+                continue
+            px, py = self.locations[i]
+            dx, dy = px - x, py - y
+            dist = math.sqrt(dx * dx + dy * dy)
+            if dir_len > 0 and dx * direction.x + dy * direction.y < min_cos * dist * dir_len:
+                continue
+            bisect.insort(found, (dist, i))
+        return [i for dist, i in found[:k]]
@@ -0,0 +1,252 @@
+import math
+import numpy as np
+
+import carsim
+import reach
+from route import Route, PASS_DIST
+from vec import Vec3
+
+
+# Plans a path on the ground to a target, which the car should arrive at moving in a given direction. Many candidate
+# paths are made each time: points behind the target at several distances and angles, paths with two points before
+# the target, arcs along the car's turning circles, and detours over boost pads. They are all scored at once with
+# numpy, by their estimated driving time plus a penalty for arriving in the wrong direction. The best path is kept,
+# and on the next ticks it is only repaired: the Route advances past the points the car has passed, and its end follows
+# the target. It is planned again from scratch a few times per second, or when the target moves too much.
+# Paths are lists of (x, y) tuples. The candidates are few and short, so making them with plain floats is faster
+# than with numpy.
+
+# Points behind the target, by distance and by angle off the arrival direction
+OFFSET_DISTS = [250, 500, 900, 1400]
+OFFSET_ANGLES = [-0.6, -0.3, 0.0, 0.3, 0.6]
+# Paths with two points before the target: the point right behind it at these distances, and a point twice as far
+# that is this far off to the side (radians)
+SWING_DISTS = [500, 900]
+SWING_ANGLE = 0.8
+# Arcs along the turning circle end where the car can head straight for the point this far behind the target
+ARC_OFFSET_DISTS = [500, 900]
+ARC_MAX_SWEEP = 1.5 * math.pi
+# How many active pads near the path are tried as detours
+PAD_DETOURS = 4
+FULL_BOOST_AMOUNT = 100
+SMALL_BOOST_AMOUNT = 12
+
+# Scoring. Driving after the first point is assumed to happen at the cruise speed. A turn at a point costs the time
+# it takes to turn at that speed, times TURN_COST. Arriving off the arrival direction costs APPROACH_COST seconds per
+# radian, and picked up boost is worth BOOST_VALUE seconds per unit
+CRUISE_SPEED = carsim.THROTTLE_MAX_SPEED
+CRUISE_SPEED_BOOST = 1800
+TURN_COST = 0.5
+APPROACH_COST = 0.6
+BOOST_VALUE = 0.004
+# Paths that pass this close to the target before their last segment would hit the ball from the wrong side
+TARGET_CLEARANCE = 150
+BLOCKED_COST = 3.0
+# Arcs shorter than this (radians) are left to the straight paths
+ARC_MIN_SWEEP = 0.1
+
+# The kept path is planned again from scratch when it gets this old, or the target moves this far (uu) or the arrival
+# direction turns this much (radians) from what it was planned for. If the tick has no time left for it, an old path is kept until a tick has
+# time, but a path to a moved target is replaced by the direct one. REPLAN_COST is what planning costs before it is
+# measured (seconds)
+REPLAN_INTERVAL = 0.5
+REPLAN_DIST = 200
+REPLAN_ANGLE = 0.3
+REPLAN_COST = 0.0005
+
+FIELD_X = 4030
+FIELD_Y = 5090
+
+
+def fix_angs(angs):
+    return (angs + math.pi) % (2 * math.pi) - math.pi
+
+
+def to_arrays(paths):
+    # A (paths, points, 2) array of the paths, padded by repeating their last point, and the number of points of each
+    size = max(len(path) for path in paths)
+    counts = np.array([len(path) for path in paths])
+    padded = np.array([path + path[-1:] * (size - len(path)) for path in paths], dtype=float)
+    np.clip(padded[..., 0], -FIELD_X, FIELD_X, out=padded[..., 0])
+    np.clip(padded[..., 1], -FIELD_Y, FIELD_Y, out=padded[..., 1])
+    return padded, counts
+
+
+def score(car_xy, heading, speed, boost, paths, counts, boosts, target, arrival_ang, first_rel):
+    # Returns the cost of each path, which is its estimated driving time in seconds with the penalties and boost
+    # bonus, the driving times and the arrival errors. first_rel is the first point of each path relative to the car,
+    # as (forward, right) pairs
+    first_dist = np.sqrt(first_rel[:, 0] ** 2 + first_rel[:, 1] ** 2)
+    first_rel_ang = np.arctan2(first_rel[:, 1], first_rel[:, 0])
+    times = reach.reach_times_at(first_dist, first_rel_ang, speed, boost)
+
+    # The headings of all segments, the first one from the car
+    segments = np.diff(paths, axis=1)
+    lengths = np.sqrt(segments[..., 0] ** 2 + segments[..., 1] ** 2)
+    angs = np.concatenate([(first_rel_ang + heading)[:, None], np.arctan2(segments[..., 1], segments[..., 0])], axis=1)
+    turns = np.abs(fix_angs(np.diff(angs, axis=1))) * (lengths > 0)
+
+    cruise = CRUISE_SPEED_BOOST if boost > 0 else max(speed, CRUISE_SPEED)
+    turn_time = TURN_COST / (cruise * float(carsim.kappa(cruise)))
+    times += lengths.sum(axis=1) / cruise + turns.sum(axis=1) * turn_time
+
+    # Distance from the target to every segment but the last
+    starts = np.empty_like(paths)
+    starts[:, 0] = car_xy
+    starts[:, 1:] = paths[:, :-1]
+    along = paths - starts
+    to_target = target - starts
+    frac = (to_target * along).sum(axis=2) / np.maximum((along * along).sum(axis=2), 1e-9)
+    offsets = to_target - np.clip(frac, 0, 1)[..., None] * along
+    close = (offsets * offsets).sum(axis=2) < TARGET_CLEARANCE ** 2
+    blocked = (close & (np.arange(paths.shape[1]) < (counts - 1)[:, None])).any(axis=1)
+
+    arrival_errors = np.abs(fix_angs(angs[np.arange(len(paths)), counts - 1] - arrival_ang))
+    costs = times + arrival_errors * APPROACH_COST - boosts * BOOST_VALUE + blocked * BLOCKED_COST
+    return costs, times, arrival_errors
+
+
+class RoutePlanner:
+    def __init__(self):
+        self.route = None  # the kept route
+        self.target = None  # the target of the last tick, which the end of the kept route follows
+        self.end_points = 2  # how many points at the end of the kept route follow the target
+        self.planned_target = None  # the target and arrival angle the kept route was planned for
+        self.arrival_ang = 0
+        self.planned_time = -math.inf
+        self.eta = 0  # estimated driving time of the kept route when it was planned
+        self.arrival_error = 0
+
+    def plan(self, data, target, arrival_dir, pad_index=None):
+        # Returns a Route to the target, which is reached moving in the arrival direction. pad_index is a
+        # padindex.BoostPadIndex for boost pad detours. The same Route is returned until it is planned again
+        car = data.car
+        car_loc = car.location.flat()
+        target = (target.x, target.y)
+        arrival_len = max(math.sqrt(arrival_dir.x ** 2 + arrival_dir.y ** 2), 1e-9)
+        arrival = (arrival_dir.x / arrival_len, arrival_dir.y / arrival_len)
+        arrival_ang = math.atan2(arrival[1], arrival[0])
+
+        kept = self.route
+        if kept is not None:
+            # The kept route, moved along with the target
+            kept.advance(car_loc, PASS_DIST)
+            dx, dy = target[0] - self.target[0], target[1] - self.target[1]
+            if dx != 0 or dy != 0:
+                kept.move_end(Vec3(dx, dy), self.end_points)
+            self.target = target
+            planned_x, planned_y = self.planned_target
+            on_target = math.hypot(target[0] - planned_x, target[1] - planned_y) <= REPLAN_DIST \
+                and abs(fix_angs(arrival_ang - self.arrival_ang)) <= REPLAN_ANGLE
+            if on_target and data.time - self.planned_time < REPLAN_INTERVAL:
+                return kept
+            if not data.deadline.allows("replan", REPLAN_COST):
+                if on_target:
+                    return kept
+                # Head straight for the target, until a tick has time to plan
+                self.end_points = 1
+                self.planned_target = target
+                self.arrival_ang = arrival_ang
+                self.planned_time = -math.inf
+                self.route = Route([Vec3(target[0], target[1])], Vec3(arrival[0], arrival[1]), 0, CRUISE_SPEED,
+                                   car_loc, False, True)
+                return self.route
+            kept = [(point.x, point.y) for point in kept.remaining_points()]
+
+        start = data.deadline.clock()
+        path = self.replan(data, (car_loc.x, car_loc.y), target, arrival, kept, pad_index)
+        data.deadline.measure("replan", start)
+        self.target = target
+        # A point behind the target moves with it, but a boost pad right before the target stays where it is
+        pads = pad_index.locations if pad_index is not None else []
+        self.end_points = 1 if len(path) >= 2 and path[-2] in pads else 2
+        self.planned_target = target
+        self.arrival_ang = arrival_ang
+        self.route = Route([Vec3(x, y) for x, y in path], Vec3(arrival[0], arrival[1]), 0, CRUISE_SPEED, car_loc,
+                           self.arrival_error < REPLAN_ANGLE, True)
+        return self.route
+
+    def replan(self, data, car_xy, target, arrival, kept, pad_index):
+        car = data.car
+        front = car.orientation.front
+        heading = math.atan2(front.y, front.x)
+        speed = max(car.velocity.dot(front), 0)
+
+        paths = [[target]]
+        if kept is not None:
+            paths.append(kept)
+        self.add_offsets(paths, target, arrival)
+        self.add_arcs(paths, car_xy, heading, speed, target, arrival)
+        boosts = [0.0] * len(paths)
+        if pad_index is not None and car.boost < 100:
+            self.add_pad_detours(paths, boosts, data, car_xy, target, arrival, pad_index)
+
+        padded, counts = to_arrays(paths)
+        boosts = np.array(boosts)
+        # The first points at the car's height, in the car's space with the matrices the World shares
+        firsts = np.empty((len(padded), 3))
+        firsts[:, :2] = padded[:, 0]
+        firsts[:, 2] = car.location.z
+        first_rel = data.world.relative_locations(data.agent.index, firsts)
+        costs, times, arrival_errors = score(np.array(car_xy), heading, speed, car.boost, padded, counts, boosts,
+                                             np.array(target), math.atan2(arrival[1], arrival[0]), first_rel)
+        best = int(np.argmin(costs))
+        self.eta = float(times[best])
+        self.arrival_error = float(arrival_errors[best])
+        self.planned_time = data.time
+        return [tuple(point) for point in padded[best, :counts[best]].tolist()]
+
+    @staticmethod
+    def add_offsets(paths, target, arrival):
+        # A point behind the target, and two before it swinging in from the side
+        tx, ty = target
+        ax, ay = arrival
+        for ang in OFFSET_ANGLES:
+            c, s = math.cos(ang), math.sin(ang)
+            dx, dy = c * ax - s * ay, s * ax + c * ay
+            for d in OFFSET_DISTS:
+                paths.append([(tx - dx * d, ty - dy * d), target])
+        for ang in (-SWING_ANGLE, SWING_ANGLE):
+            c, s = math.cos(ang), math.sin(ang)
+            dx, dy = c * ax - s * ay, s * ax + c * ay
+            for d in SWING_DISTS:
+                paths.append([(tx - dx * 2 * d, ty - dy * 2 * d), (tx - ax * d, ty - ay * d), target])
+
+    @staticmethod
+    def add_arcs(paths, car_xy, heading, speed, target, arrival):
+        # Follow the left or right turning circle, until the car can head straight for a point behind the target
+        radius = 1 / float(carsim.kappa(max(speed, reach.MIN_TURN_SPEED)))
+        x, y = car_xy
+        left_x, left_y = -math.sin(heading), math.cos(heading)
+        for side in (1, -1):  # 1 is counterclockwise
+            cx, cy = x + side * radius * left_x, y + side * radius * left_y
+            start_ang = math.atan2(y - cy, x - cx)
+            for d in ARC_OFFSET_DISTS:
+                behind = (target[0] - arrival[0] * d, target[1] - arrival[1] * d)
+                bx, by = behind[0] - cx, behind[1] - cy
+                dist = math.sqrt(bx * bx + by * by)
+                if dist <= radius:
+                    continue
+                # Where the tangent from the point touches the circle
+                end_ang = math.atan2(by, bx) - side * math.acos(radius / dist)
+                sweep = (side * (end_ang - start_ang)) % (2 * math.pi)
+                if not ARC_MIN_SWEEP < sweep < ARC_MAX_SWEEP:
+                    continue
+                middle_ang = start_ang + side * sweep / 2
+                paths.append([(cx + radius * math.cos(middle_ang), cy + radius * math.sin(middle_ang)),
+                              (cx + radius * math.cos(end_ang), cy + radius * math.sin(end_ang)),
+                              behind, target])
+
+    @staticmethod
+    def add_pad_detours(paths, boosts, data, car_xy, target, arrival, pad_index):
+        # Active pads near the middle of the way, then on to the target directly or from behind
+        middle = Vec3((car_xy[0] + target[0]) / 2, (car_xy[1] + target[1]) / 2)
+        missing = 100 - data.car.boost
+        d = OFFSET_DISTS[1]
+        behind = (target[0] - arrival[0] * d, target[1] - arrival[1] * d)
+        for i in pad_index.nearest(middle, PAD_DETOURS, data.active_boost_pads):
+            pad = pad_index.locations[i]
+            amount = FULL_BOOST_AMOUNT if i in pad_index.full_boosts else SMALL_BOOST_AMOUNT
+            paths.append([pad, target])
+            paths.append([pad, behind, target])
+            boosts += [min(amount, missing)] * 2
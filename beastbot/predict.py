@@ -1,22 +1,39 @@
+import heapq
 import math
 import rlmath
 import datalibs
-from vec import Vec3
+import reach
+from vec import Vec3, UP
 
 
 GRAVITY = Vec3(z=-650)
 BOUNCINESS = -0.6
 
+# See https://samuelpmish.github.io/notes/RocketLeague/ball_bouncing/
+BOUNCE_MU = 0.285
+BOUNCE_A = 0.0003
+
+TRAJECTORY_HORIZON = 6.0
+TRAJECTORY_STEP = 1 / 60
+
+# Upper bound on the surface contacts move_ball will simulate, so its cost never depends on how the ball bounces
+MIN_CONTACT_EVENTS = 10
+MAX_CONTACT_EVENTS_PER_SECOND = 20
+
+NO_HIT = math.inf
+
+# A car reaches the ball when it is this close to the ball's surface
+REACH_MARGIN = 25
+# Lookups in time_till_reach_ball, each refining where the ball will be
+REACH_ITERATIONS = 3
+
 
 def draw_ball_path(renderer, data, duration, time_step):
     time_passed = 0
-    ball_clone = datalibs.Ball()
     locations = [data.ball.location]
     while time_passed < duration:
         time_passed += time_step
-        ball_clone.set(data.ball)
-        move_ball(ball_clone, time_passed)
-        locations.append(ball_clone.location.copy())
+        locations.append(data.ball_trajectory.state_at(time_passed).location)
 
     prev_loc_t = locations[0].tuple()
     for loc in locations[1:]:
@@ -59,6 +76,14 @@ class SideWall:
         t = dist / ball.velocity.x
         return Prediction(t >= 0, t)
 
+    # Returns the time until the ball touches the wall, or NO_HIT if the ball isn't moving towards it
+    def time_till_hit(self, ball, gravity=True):
+        vel_out = ball.velocity.x * self.normal.x
+        if vel_out <= 0:
+            return NO_HIT
+        dist = abs(self.wall_x) - datalibs.BALL_RADIUS - ball.location.x * self.normal.x
+        return max(dist / vel_out, 0)
+
     def bounce_ball(self, ball):
         bounce(ball, self.normal)
 
@@ -75,6 +100,16 @@ class BackWall:
         t = dist / ball.velocity.y
         return Prediction(t >= 0, t)
 
+    def time_till_hit(self, ball, gravity=True):
+        vel_out = ball.velocity.y * self.normal.y
+        if vel_out <= 0:
+            return NO_HIT
+        dist = abs(self.wall_y) - datalibs.BALL_RADIUS - ball.location.y * self.normal.y
+        if dist < -datalibs.BALL_RADIUS:
+            # The ball is inside the goal
+            return NO_HIT
+        return max(dist / vel_out, 0)
+
     def bounce_ball(self, ball):
         bounce(ball, self.normal)
 
@@ -89,10 +124,16 @@ class CornerWall:
         if dot == 0:
             return Prediction(False, 1e307)
         # t = (self.normal.x * ball.location.x - self.normal.x * self.anchor.x + self.normal.y ) / -dot
-        scaled = self.normal.mul_components(ball.location - self.anchor)
-        t = (scaled.x + scaled.y) / -dot
+        t = (self.normal.x * (ball.location.x - self.anchor.x) + self.normal.y * (ball.location.y - self.anchor.y)) / -dot
         return Prediction(t >= 0, t)
 
+    def time_till_hit(self, ball, gravity=True):
+        vel_out = ball.velocity.dot(self.normal)
+        if vel_out <= 0:
+            return NO_HIT
+        dist = - ball.location.dot_sub(self.normal, self.anchor)
+        return max(dist / vel_out, 0)
+
     def bounce_ball(self, ball):
         bounce(ball, self.normal)
 
@@ -105,6 +146,43 @@ class Ceiling:
     def get_next_ball_hit(self, ball):
         return time_of_arrival_at_height(ball, self.height - datalibs.BALL_RADIUS)
 
+    def time_till_hit(self, ball, gravity=True):
+        vel_z = ball.velocity.z
+        if vel_z <= 0:
+            return NO_HIT
+        dist = self.height - datalibs.BALL_RADIUS - ball.location.z
+        if dist <= 0:
+            return 0
+        if not gravity:
+            return dist / vel_z
+        # First root of dist = vel_z * t + 1/2 * g * t^2
+        disc = vel_z * vel_z + 2 * GRAVITY.z * dist
+        if disc < 0:
+            return NO_HIT
+        return (vel_z - math.sqrt(disc)) / -GRAVITY.z
+
+    def bounce_ball(self, ball):
+        bounce(ball, self.normal)
+
+
+class Ground:
+    def __init__(self):
+        self.normal = UP
+
+    # A ball rolling on the ground (no gravity) never hits it
+    def time_till_hit(self, ball, gravity=True):
+        if not gravity:
+            return NO_HIT
+        height = ball.location.z - datalibs.BALL_RADIUS
+        vel_z = ball.velocity.z
+        if height <= 0 and vel_z <= 0:
+            return 0
+        # Last root of 0 = height + vel_z * t + 1/2 * g * t^2
+        disc = vel_z * vel_z - 2 * GRAVITY.z * height
+        if disc < 0:
+            return 0
+        return (vel_z + math.sqrt(disc)) / -GRAVITY.z
+
     def bounce_ball(self, ball):
         bounce(ball, self.normal)
 
@@ -118,36 +196,50 @@ CORNER_WALL_NP = CornerWall(Vec3(-3318, 4570), Vec3(-1, 1))
 CORNER_WALL_PN = CornerWall(Vec3(3318, -4570), Vec3(1, -1))
 CORNER_WALL_NN = CornerWall(Vec3(-3318, -4570), Vec3(-1, -1))
 CEILING = Ceiling(2044)
+GROUND = Ground()
 
 
+# Moves the body in-place
 def move_body(body, time, gravity=True):
-    acc = GRAVITY if gravity else Vec3()
+    acc_z = GRAVITY.z if gravity else 0.0
+    loc = body.location
+    vel = body.velocity
 
     # (1/2 * a * t^2) + (v * t) + p
-    new_loc = 0.5 * time * time * acc + time * body.velocity + body.location
-    new_vel = time * acc + body.velocity
-    body.location = new_loc
-    body.velocity = new_vel
+    loc.set_xyz(time * vel.x + loc.x,
+                time * vel.y + loc.y,
+                0.5 * time * time * acc_z + time * vel.z + loc.z)
+    vel.z = time * acc_z + vel.z
 
     return body
 
 
-def will_ball_hit_goal(ball):
+def will_ball_hit_goal(ball, trajectory=None):
     if ball.velocity.y == 0:
         return Prediction(False, 1e306)
 
     time = abs(ball.location.y) / abs(ball.velocity.y)
-    hit_loc = move_ball(ball.copy(), time).location
+    if trajectory is not None:
+        hit_loc = trajectory.state_at(time).location
+    else:
+        hit_loc = move_ball(ball.copy(), time).location
     hits_goal = abs(hit_loc.x) < 1900
     return Prediction(hits_goal, time)
 
 
+WALLS = [
+    SIDE_WALL_POS, SIDE_WALL_NEG, BACK_WALL_POS, BACK_WALL_NEG,
+    CORNER_WALL_PP, CORNER_WALL_PN, CORNER_WALL_NP, CORNER_WALL_NN,
+    CEILING
+]
+
+
+# Everything the ball can bounce on, in the order move_ball schedules them
+SURFACES = WALLS + [GROUND]
+
+
 def next_ball_wall_hit(ball):
-    walls = [
-        SIDE_WALL_POS, SIDE_WALL_NEG, BACK_WALL_POS, BACK_WALL_NEG,
-        CORNER_WALL_PP, CORNER_WALL_PN, CORNER_WALL_NP, CORNER_WALL_NN,
-        CEILING
-    ]
+    walls = WALLS
     wall_index = -1
     earliest_hit_time = 1e300
     for i, w in enumerate(walls):
@@ -167,11 +259,10 @@ def time_of_arrival_at_height(body, height, gravity=True):
     if height == body.location.z:
         return Prediction(True, 0)
 
-    acc = GRAVITY if gravity else Vec3()
-    if acc.z == 0:
+    if not gravity:
         return time_of_arrival_at_height_linear(body, height)
     else:
-        return time_of_arrival_at_height_quadratic(body, height, acc.z)
+        return time_of_arrival_at_height_quadratic(body, height, GRAVITY.z)
 
 
 def time_of_arrival_at_height_linear(body, height):
@@ -208,95 +299,204 @@ def time_of_arrival_at_height_quadratic(body, height, acc_z):
 
 
 def bounce(ball, normal):
-    # See https://samuelpmish.github.io/notes/RocketLeague/ball_bouncing/
-    MU = 0.285
-    A = 0.0003
+    # This is the vector math below, written out per component to avoid allocating temporary vectors:
+    #   v_perp = v.dot(n) * n
+    #   s = (v - v_perp) + R * n.cross(w)
+    #   delta_v_para = - min(1, 2 * |v_perp| / |s|) * MU * s
+    #   delta_v_perp = (BOUNCINESS - 1) * v_perp
+    #   v += delta_v_perp + delta_v_para
+    #   w += A * R * delta_v_para.cross(n)
+    vel = ball.velocity
+    ang = ball.angular_velocity
+    nx, ny, nz = normal.x, normal.y, normal.z
+    r = datalibs.BALL_RADIUS
+
+    dot = vel.dot(normal)
+    perp_x, perp_y, perp_z = nx * dot, ny * dot, nz * dot
+    s_x = (vel.x - perp_x) + (ny * ang.z - nz * ang.y) * r
+    s_y = (vel.y - perp_y) + (nz * ang.x - nx * ang.z) * r
+    s_z = (vel.z - perp_z) + (nx * ang.y - ny * ang.x) * r
+
+    s_len = math.sqrt(s_x**2 + s_y**2 + s_z**2)
+    if s_len == 0:
+        para_x = para_y = para_z = 0.0
+    else:
+        ratio = math.sqrt(perp_x**2 + perp_y**2 + perp_z**2) / s_len
+        scale = - min(1.0, 2.0 * ratio) * BOUNCE_MU
+        para_x, para_y, para_z = s_x * scale, s_y * scale, s_z * scale
 
-    v_perp = ball.velocity.dot(normal) * normal
-    v_para = ball.velocity - v_perp
-    v_spin = datalibs.BALL_RADIUS * normal.cross(ball.angular_velocity)
-    s = v_para + v_spin
+    restitution = BOUNCINESS - 1
+    vel.x += perp_x * restitution + para_x
+    vel.y += perp_y * restitution + para_y
+    vel.z += perp_z * restitution + para_z
 
-    if s.length() == 0:
-        delta_v_para = Vec3()
-    else:
-        ratio = v_perp.length() / s.length()
-        delta_v_para = - min(1.0, 2.0 * ratio) * MU * s
+    spin_scale = BOUNCE_A * r
+    ang.x += (para_y * nz - para_z * ny) * spin_scale
+    ang.y += (para_z * nx - para_x * nz) * spin_scale
+    ang.z += (para_x * ny - para_y * nx) * spin_scale
 
-    delta_v_perp = - 1.60 * v_perp
 
-    ball.velocity += delta_v_perp + delta_v_para
-    ball.angular_velocity += A * datalibs.BALL_RADIUS * delta_v_para.cross(normal)
+def is_in_goal_mouth(location):
+    return location.z < datalibs.GOAL_HEIGHT - datalibs.BALL_RADIUS and abs(location.x) < datalibs.GOAL_WIDTH2 - datalibs.BALL_RADIUS
 
 
-def move_ball(ball, time):
+# Simulates the ball as a series of contact events. A priority queue holds the next contact time with each surface.
+# After a contact only the surfaces whose contact time can have changed are rescheduled, i.e. those whose normal is
+# not perpendicular to the change in velocity. The number of contacts is capped per simulated second, so the work
+# done is bounded no matter how the ball bounces.
+# If path is a list, a segment (start_time, ball_copy, gravity) is appended every time the ball's motion changes
+def move_ball(ball, time, path=None):
     if time <= 0:
         return ball
 
-    time_spent = 0
-    limit = 30
-
-    while time - time_spent > 0.001 and limit != 0:
-        time_left = time - time_spent
-        limit -= 1
-
-        wall_hit = next_ball_wall_hit(ball)
-        ground_hit = next_ball_ground_hit(ball)
-
-        # Check if ball doesn't hits anything
-        if ground_hit.happens_after(time_left) and wall_hit.happens_after(time_left):
-            return move_body(ball, time_left)
-
-        elif wall_hit.happens_before_other(ground_hit):
-            # Simulate until ball it hits wall
-            move_body(ball, wall_hit.time)
-            time_spent += wall_hit.time
-            # Did ball hit a goal?
-            if ball.location.z < datalibs.GOAL_HEIGHT - datalibs.BALL_RADIUS and abs(ball.location.x) < datalibs.GOAL_WIDTH2 - datalibs.BALL_RADIUS:
-                pass  # no bounce
-            else:
-                wall_hit.wall.bounce_ball(ball)
-
-        elif ground_hit.time == 0.0 and abs(ball.velocity.z * BOUNCINESS) < 2.0:
-            # Simulate ball rolling until it hits wall or time's up
-            ball.velocity.z = 0
-
-            if not wall_hit.happens:
-                # The ball is laying still
-                return ball
-
-            if time_left < wall_hit.time:
-                # Time's up
-                move_body(ball, time_left, False)
-                return ball
-
-            # Roll
-            move_body(ball, wall_hit.time, False)
-            time_spent += wall_hit.time
-            # Did ball hit a goal?
-            if ball.location.z < datalibs.GOAL_HEIGHT - datalibs.BALL_RADIUS and abs(ball.location.x) < datalibs.GOAL_WIDTH2 - datalibs.BALL_RADIUS:
-                pass  # no bounce
+    if path is not None:
+        path.append((0, ball.copy(), True))
+
+    now = 0
+    gravity = True  # False while the ball is rolling on the ground
+    events_left = MIN_CONTACT_EVENTS + int(time * MAX_CONTACT_EVENTS_PER_SECOND)
+
+    # Queue entries are (time, surface index, version). Entries with an old version are outdated and skipped
+    versions = [0] * len(SURFACES)
+    queue = []
+    for i, surface in enumerate(SURFACES):
+        hit_time = surface.time_till_hit(ball, gravity)
+        if hit_time != NO_HIT:
+            queue.append((hit_time, i, 0))
+    heapq.heapify(queue)
+
+    while queue and events_left > 0:
+        hit_time, i, version = queue[0]
+        if version != versions[i]:
+            heapq.heappop(queue)
+            continue
+        if hit_time > time:
+            break
+        heapq.heappop(queue)
+        events_left -= 1
+
+        move_body(ball, hit_time - now, gravity)
+        now = hit_time
+
+        surface = SURFACES[i]
+        vel = ball.velocity
+        prev_vel_x, prev_vel_y, prev_vel_z = vel.x, vel.y, vel.z
+        prev_gravity = gravity
+
+        if surface is GROUND:
+            if abs(vel.z * BOUNCINESS) < 2.0:
+                # The bounce is too weak, so the ball starts rolling
+                vel.z = 0
+                ball.location.z = datalibs.BALL_RADIUS
+                gravity = False
             else:
-                wall_hit.wall.bounce_ball(ball)
-
+                bounce(ball, surface.normal)
+        elif is_in_goal_mouth(ball.location):
+            # No bounce. The ball enters the goal and won't touch this wall again
+            versions[i] += 1
+            continue
         else:
-            # Simulate until ball it hits ground
-            move_body(ball, ground_hit.time)
-            time_spent += ground_hit.time
-            bounce(ball, Vec3(0, 0, 1))
+            surface.bounce_ball(ball)
+            if not gravity:
+                # A rolling ball only leaves the ground if the bounce gave it some vertical speed
+                if abs(vel.z * BOUNCINESS) < 2.0:
+                    vel.z = 0
+                else:
+                    gravity = True
+
+        if path is not None:
+            path.append((now, ball.copy(), gravity))
+
+        # Reschedule the surfaces whose contact time may have changed
+        delta_x, delta_y, delta_z = vel.x - prev_vel_x, vel.y - prev_vel_y, vel.z - prev_vel_z
+        gravity_changed = gravity != prev_gravity
+        for j, other in enumerate(SURFACES):
+            normal = other.normal
+            if j == i or (gravity_changed and normal.z != 0) or normal.x * delta_x + normal.y * delta_y + normal.z * delta_z != 0:
+                versions[j] += 1
+                hit_time = other.time_till_hit(ball, gravity)
+                if hit_time != NO_HIT:
+                    heapq.heappush(queue, (now + hit_time, j, versions[j]))
+
+    move_body(ball, time - now, gravity)
+
+    if events_left == 0:
+        # The contact limit was reached. Keep the ball inside the arena at least
+        loc = ball.location
+        loc.set_xyz(min(max(-SIDE_WALL_POS.wall_x + datalibs.BALL_RADIUS, loc.x), SIDE_WALL_POS.wall_x - datalibs.BALL_RADIUS),
+                    min(max(-BACK_WALL_POS.wall_y + datalibs.BALL_RADIUS, loc.y), BACK_WALL_POS.wall_y - datalibs.BALL_RADIUS),
+                    min(max(datalibs.BALL_RADIUS, loc.z), CEILING.height - datalibs.BALL_RADIUS))
 
     return ball
 
 
+# The predicted path of the ball, shared by everything that needs a future ball state during a tick.
+# The path is stored as segments of uninterrupted motion. A fixed-step table maps each time slice to the segment
+# active at that time, so state_at(t) is a table lookup followed by a single closed-form move_body.
+# The path is simulated lazily, so a tick only pays for simulating as far ahead as it actually looks.
+class BallTrajectory:
+    def __init__(self, ball, horizon=TRAJECTORY_HORIZON, step=TRAJECTORY_STEP):
+        self.horizon = horizon
+        self.step = step
+        self.segments = [(0, ball.copy(), True)]
+        # segment_index[i] is the index of the last segment starting at or before time i * step
+        self.segment_index = [0]
+        self.simulated_until = 0
+        self.__end_ball = ball.copy()
+
+    # Returns a new Ball with the predicted state at the given time
+    def state_at(self, time):
+        if time <= 0:
+            return self.segments[0][1].copy()
+
+        if time > self.horizon:
+            start_time, state, gravity = self.segments[-1]
+            return move_ball(state.copy(), time - start_time)
+
+        if time > self.simulated_until:
+            self.__simulate_until(time)
+
+        seg = self.segment_index[int(time / self.step)]
+        while seg + 1 < len(self.segments) and self.segments[seg + 1][0] <= time:
+            seg += 1
+
+        start_time, state, gravity = self.segments[seg]
+        return move_body(state.copy(), time - start_time, gravity)
+
+    def __simulate_until(self, time):
+        # Simulate at least a second ahead at a time, rounded up to whole slices
+        time = max(time, self.simulated_until + 1.0)
+        slice_count = min(int(time / self.step), int(self.horizon / self.step)) + 2
+        end_time = (slice_count - 1) * self.step
+
+        new_segments = []
+        move_ball(self.__end_ball, end_time - self.simulated_until, new_segments)
+        for start_time, state, gravity in new_segments:
+            self.segments.append((self.simulated_until + start_time, state, gravity))
+        self.simulated_until = end_time
+
+        seg = self.segment_index[-1]
+        for i in range(len(self.segment_index), slice_count):
+            t = i * self.step
+            while seg + 1 < len(self.segments) and self.segments[seg + 1][0] <= t:
+                seg += 1
+            self.segment_index.append(seg)
+
+
+def time_till_reach_location(car, location):
+    # Looks up how long it takes the car to get within reach of the ball at the location on the ground
+    front = car.orientation.front
+    car_to_loc = Vec3(location.x - car.location.x, location.y - car.location.y)
+    dist = max(car_to_loc.length() - datalibs.BALL_RADIUS - REACH_MARGIN, 0)
+    return reach.reach_time(dist, front.ang_to_flat(car_to_loc), max(car.velocity.dot(front), 0), car.boost)
+
+
 def time_till_reach_ball(ball, car):
-    car_to_ball = (ball.location - car.location).flat()
-    dist = car_to_ball.length() - datalibs.BALL_RADIUS - 25
-    vel_c_f = car.velocity.proj_onto_size(car_to_ball)
-    vel_b_f = ball.velocity.proj_onto_size(car_to_ball)
-    vel_c_amp = rlmath.lerp(vel_c_f, car.velocity.length(), 0.6)
-    vel_f = vel_c_amp - vel_b_f
-    dist_long_01 = min(max(0, dist / 10_000.0), 1)**2
-    time_normal = dist / max(250, vel_f)
-    time_long = dist / max(car.velocity.length(), 1400)
-    time = rlmath.lerp(time_normal, time_long, dist_long_01)
+    # Looks up how long it takes the car to reach the ball. The ball is assumed to roll on in a straight line
+    # meanwhile, so the lookup is repeated a few times with the ball's location at the previous estimate.
+    # intercept.py searches the ball's predicted path instead
+    time = 0
+    location = Vec3()
+    for i in range(REACH_ITERATIONS):
+        time = time_till_reach_location(car, location.set(ball.velocity).imul(time).iadd(ball.location))
     return time
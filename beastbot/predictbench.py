@@ -0,0 +1,429 @@
+import argparse
+import json
+import math
+import os
+import sys
+import time
+import numpy as np
+
+import batchpredict
+import datalibs
+import headless
+import predict
+import recording
+from vec import Vec3
+
+
+# Measures how far the ball predictions are off and how long they take, so a faster predictor can't quietly be a
+# worse one. Run from the beastbot folder:  python predictbench.py
+# The reference paths are one of:
+# - A recording in the format of recording.py (--recording). Predictions start at every --stride'th tick and are
+#   compared with what the ball did, until a car gets close to it. With a recording made with the bot's record
+#   option this measures how close the predictions are to the game.
+#   The default is ball_reference.rec, next to this file. It holds the wall, corner, ceiling and goal mouth
+#   scenarios, recorded at 120 ticks per second with the stepped simulation below (--write-reference makes it
+#   again). The recording stays the same when move_ball's bounce rules change, so it catches changes to the rules
+#   themselves, but it isn't the game. Replace it with a recording of the game to measure accuracy.
+# - Scenarios (--scenarios): hand made balls for each kind of contact, plus random balls. Their reference is a brute
+#   force simulation in small fixed steps, which uses the bounce, rolling and goal mouth rules of move_ball as they
+#   are now. So this is only a consistency check: it catches mistakes in the event scheduling of move_ball and in
+#   faster predictors, but the errors say nothing about how close the model is to the game.
+# Use --save and --compare to catch regressions in accuracy or speed, like benchmark.py.
+
+HORIZONS = [0.25, 0.5, 1.0, 2.0, 3.0, 4.0, 6.0]
+SAMPLE_STEP = 1 / 60
+
+# Steps of the brute force reference per sample
+REFERENCE_SUBSTEPS = 20
+
+# A recorded path is only used until a car is this close to the ball
+TOUCH_DIST = 300
+# or until the ball moves further than this in a tick, which means it was reset after a goal
+MAX_BALL_SPEED = 6000
+
+R = datalibs.BALL_RADIUS
+
+# (name, location, velocity, angular velocity)
+SCENARIOS = [
+    ("side wall bounce", (2500, 0, 300), (1600, 400, 500), (0, 0, 0)),
+    ("back wall bounce", (2000, 3500, 800), (300, 1800, 200), (0, 0, 0)),
+    ("corner roll", (2000, 3000, R), (1000, 1200, 0), (0, 0, 0)),
+    ("corner bounce", (-2500, -3500, 400), (-1200, -1300, 300), (3, -2, 1)),
+    ("ceiling hit", (0, 1000, 1200), (300, -200, 1800), (0, 0, 0)),
+    ("goal mouth roll", (300, 3800, R), (-100, 1500, 0), (0, 0, 0)),
+    ("goal mouth bounce", (-500, -3000, 600), (200, -2000, 400), (0, 0, 0)),
+    ("crossbar", (0, 4000, 500), (0, 1600, 250), (0, 0, 0)),
+    ("spinning bounces", (0, 0, 1000), (800, -600, 0), (5, -4, 2)),
+    ("settling", (-1000, 1000, 300), (200, 100, -50), (0, 0, 0)),
+]
+RANDOM_SEED = 0
+
+# The default reference recording, and the scenarios in it
+REFERENCE_RECORDING = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ball_reference.rec")
+RECORDED_SCENARIOS = ["side wall bounce", "back wall bounce", "corner bounce", "ceiling hit", "goal mouth roll",
+                      "crossbar"]
+# will_ball_hit_goal is flagged as unreliable when it agrees with the reference less often than this
+GOAL_AGREEMENT_WARNING = 0.9
+
+
+def make_ball(location, velocity, angular_velocity=(0, 0, 0)):
+    ball = datalibs.Ball()
+    ball.location = Vec3(*location)
+    ball.location_2d = ball.location.flat()
+    ball.velocity = Vec3(*velocity)
+    ball.angular_velocity = Vec3(*angular_velocity)
+    return ball
+
+
+def in_goal(location):
+    return abs(location.y) > datalibs.ARENA_LENGTH2
+
+
+# Brute force reference for the consistency check. The ball is moved in small steps, and bounces off every surface
+# it is overlapping while moving into it. The bounce, rolling and goal mouth rules are the ones move_ball uses
+
+def contact(surface, loc, vel):
+    n = surface.normal
+    if isinstance(surface, predict.SideWall):
+        return loc.x * n.x > abs(surface.wall_x) - R and vel.x * n.x > 0
+    if isinstance(surface, predict.BackWall):
+        return loc.y * n.y > abs(surface.wall_y) - R and vel.y * n.y > 0
+    if isinstance(surface, predict.CornerWall):
+        return loc.dot_sub(n, surface.anchor) > 0 and vel.dot(n) > 0
+    if surface is predict.CEILING:
+        return loc.z > surface.height - R and vel.z > 0
+    return loc.z < R and vel.z < 0
+
+
+def reference_balls(ball, horizon, step=SAMPLE_STEP, substeps=REFERENCE_SUBSTEPS):
+    # Yields the ball every step, starting with the given one. The same Ball is moved on, so copy it to keep it
+    ball = ball.copy()
+    dt = step / substeps
+    gravity = True
+    passed = set()  # walls the ball went through into a goal
+    yield ball
+    for i in range(int(round(horizon / step))):
+        for j in range(substeps):
+            predict.move_body(ball, dt, gravity)
+            loc, vel = ball.location, ball.velocity
+            for surface in predict.SURFACES:
+                if surface in passed or (surface is predict.GROUND and not gravity) or not contact(surface, loc, vel):
+                    continue
+                if surface is predict.GROUND:
+                    if abs(vel.z * predict.BOUNCINESS) < 2.0:
+                        vel.z = 0
+                        loc.z = R
+                        gravity = False
+                    else:
+                        predict.bounce(ball, surface.normal)
+                elif predict.is_in_goal_mouth(loc):
+                    passed.add(surface)
+                else:
+                    surface.bounce_ball(ball)
+                    if not gravity:
+                        if abs(vel.z * predict.BOUNCINESS) < 2.0:
+                            vel.z = 0
+                        else:
+                            gravity = True
+        yield ball
+
+
+def reference_path(ball, horizon, step=SAMPLE_STEP, substeps=REFERENCE_SUBSTEPS):
+    # Locations every step, starting with the ball's, as a (samples, 3) array
+    return np.array([moved.location.tuple() for moved in reference_balls(ball, horizon, step, substeps)])
+
+
+def write_reference_recording(path, horizon=max(HORIZONS)):
+    # Records the RECORDED_SCENARIOS one after another, each until the ball is in a goal or the horizon has passed.
+    # Nothing but the ball is recorded
+    step = 1 / headless.TICK_RATE
+    substeps = int(round(SAMPLE_STEP * REFERENCE_SUBSTEPS / step))
+    scenarios = {name: (loc, vel, ang) for name, loc, vel, ang in SCENARIOS}
+    if os.path.exists(path):
+        os.remove(path)
+    recorder = recording.Recorder(path, max_cars=0, max_boosts=0)
+    packet = headless.make_packet({"location": (0, 0, 0)}, [])
+    tick = 0
+    for name in RECORDED_SCENARIOS:
+        for ball in reference_balls(make_ball(*scenarios[name]), horizon, step, substeps):
+            headless.set_physics(packet.game_ball.physics, ball.location.tuple(), ball.velocity.tuple(),
+                                 angular_velocity=ball.angular_velocity.tuple())
+            packet.game_info.seconds_elapsed = tick * step
+            recorder.record(packet)
+            tick += 1
+            if abs(ball.location.y) > datalibs.ARENA_LENGTH2 + R:
+                break
+    recorder.close()
+
+
+class Case:
+    # A start state and where the ball really went. reference[i] is the location at i * SAMPLE_STEP
+    def __init__(self, name, ball, reference):
+        self.name = name
+        self.ball = ball
+        self.reference = reference
+
+    @property
+    def horizon(self):
+        return (len(self.reference) - 1) * SAMPLE_STEP
+
+    def location_at(self, t):
+        return self.reference[int(round(t / SAMPLE_STEP))]
+
+
+def scenario_cases(random_count=20, horizon=max(HORIZONS)):
+    balls = [(name, make_ball(loc, vel, ang)) for name, loc, vel, ang in SCENARIOS]
+    for i, packet in enumerate(headless.random_packets(random_count, RANDOM_SEED)):
+        balls.append(("random {}".format(i), datalibs.Ball().set_game_ball(packet.game_ball)))
+    return [Case(name, ball, reference_path(ball, horizon)) for name, ball in balls]
+
+
+def recording_cases(path, stride=30, horizon=max(HORIZONS)):
+    # Predictions start every stride ticks, and right after the ball was reset, since the reset state is a new path
+    records = recording.Recording(path).records
+    times = records["seconds_elapsed"]
+    ball = records["ball"]
+    locations = ball["location"].astype(float)
+    cars = records["cars"]["physics"]["location"].astype(float)
+    car_counts = records["num_cars"]
+
+    # Ticks where the ball can't be predicted from the tick before: a car is close, or the ball jumped
+    car_dists = np.linalg.norm(cars - locations[:, None, :], axis=2)
+    car_dists[np.arange(cars.shape[1])[None, :] >= car_counts[:, None]] = math.inf
+    touched = car_dists.min(axis=1, initial=math.inf) < TOUCH_DIST
+    jumps = np.zeros(len(times), dtype=bool)
+    jumps[1:] = np.linalg.norm(np.diff(locations, axis=0), axis=1) > MAX_BALL_SPEED * np.maximum(np.diff(times), 0) + 50
+    broken = touched | jumps
+
+    cases = []
+    for start in sorted(set(range(0, len(times), stride)) | set(np.flatnonzero(jumps).tolist())):
+        if touched[start]:
+            continue
+        end = start + 1
+        while end < len(times) and not broken[end] and times[end] - times[start] <= horizon:
+            end += 1
+        sample_times = np.arange(0, times[end - 1] - times[start] + 1e-9, SAMPLE_STEP)
+        if len(sample_times) < 2:
+            continue
+        reference = np.stack([np.interp(times[start] + sample_times, times[start:end], locations[start:end, axis])
+                              for axis in range(3)], axis=1)
+        start_ball = make_ball(locations[start], ball["velocity"][start].astype(float),
+                               ball["angular_velocity"][start].astype(float))
+        cases.append(Case("tick {}".format(start), start_ball, reference))
+    return cases
+
+
+# Predictors. Each gives the predicted locations of a case at the given times, as a (len(times), 3) array
+
+def predict_move_ball(case, times):
+    return np.array([predict.move_ball(case.ball.copy(), t).location.tuple() for t in times])
+
+
+def predict_trajectory(case, times):
+    trajectory = predict.BallTrajectory(case.ball)
+    return np.array([trajectory.state_at(t).location.tuple() for t in times])
+
+
+PREDICTORS = [
+    ("move_ball", predict_move_ball),
+    ("BallTrajectory", predict_trajectory),
+]
+
+
+def predict_batch(cases, horizon):
+    # All cases with batchpredict.move_balls in one call per horizon
+    locations, velocities, angular_velocities = batchpredict.from_balls([case.ball for case in cases])
+    return batchpredict.move_balls(locations, velocities, angular_velocities, horizon)[0]
+
+
+def horizons_of(case):
+    return [h for h in HORIZONS if h <= case.horizon + 1e-9]
+
+
+def accuracy(cases):
+    # Position errors by predictor and horizon: {predictor: {horizon: [errors]}}
+    errors = {name: {h: [] for h in HORIZONS} for name, _ in PREDICTORS + [("batchpredict", None)]}
+    for name, func in PREDICTORS:
+        for case in cases:
+            horizons = horizons_of(case)
+            predicted = func(case, horizons)
+            for h, loc in zip(horizons, predicted):
+                errors[name][h].append(float(np.linalg.norm(loc - case.location_at(h))))
+    for h in HORIZONS:
+        long_enough = [case for case in cases if h <= case.horizon + 1e-9]
+        if long_enough:
+            predicted = predict_batch(long_enough, h)
+            for case, loc in zip(long_enough, predicted):
+                errors["batchpredict"][h].append(float(np.linalg.norm(loc - case.location_at(h))))
+    return errors
+
+
+def goal_agreement(cases):
+    # How often will_ball_hit_goal agrees with the reference about the ball going in within the case's horizon
+    agree = 0
+    for case in cases:
+        prediction = predict.will_ball_hit_goal(case.ball)
+        predicted = prediction.happens and prediction.time <= case.horizon
+        actual = any(abs(y) > datalibs.ARENA_LENGTH2 for y in case.reference[:, 1])
+        agree += predicted == actual
+    return agree / max(len(cases), 1)
+
+
+def best_time(func, repeat=5):
+    # Least wall time of a few runs, in seconds
+    best = math.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def speed(cases, horizon=max(HORIZONS)):
+    # Microseconds per simulated second. will_ball_hit_goal is a single query, so it is per call instead
+    simulated = horizon * len(cases)
+    balls = [case.ball for case in cases]
+    locations, velocities, angular_velocities = batchpredict.from_balls(balls)
+    steps = np.arange(1, int(round(horizon / SAMPLE_STEP)) + 1) * SAMPLE_STEP
+
+    def trajectories():
+        for ball in balls:
+            trajectory = predict.BallTrajectory(ball, horizon)
+            for t in steps:
+                trajectory.state_at(t)
+
+    def goals():
+        for ball in balls:
+            predict.will_ball_hit_goal(ball)
+
+    return {
+        "move_ball": best_time(lambda: [predict.move_ball(ball.copy(), horizon) for ball in balls]) / simulated * 1e6,
+        # every 1/60 s of the path, the way the bot reads it
+        "BallTrajectory": best_time(trajectories) / simulated * 1e6,
+        "batchpredict": best_time(lambda: batchpredict.move_balls(locations, velocities, angular_velocities,
+                                                                  horizon)) / simulated * 1e6,
+        "will_ball_hit_goal (per call)": best_time(goals) / len(balls) * 1e6,
+    }
+
+
+# What the errors are measured against
+SCENARIO_REFERENCE = "scenarios"
+RECORDING_REFERENCE = "recording"
+
+
+def measure(cases, reference, recording_path=None):
+    errors = accuracy(cases)
+    return {
+        "reference": reference,
+        "recording": os.path.basename(recording_path) if recording_path else None,
+        "cases": len(cases),
+        "mean_error": {name: {str(h): float(np.mean(e)) for h, e in by_h.items() if e} for name, by_h in errors.items()},
+        "max_error": {name: {str(h): float(np.max(e)) for h, e in by_h.items() if e} for name, by_h in errors.items()},
+        "goal_agreement": goal_agreement(cases),
+        "us_per_second": speed(cases),
+    }
+
+
+def print_results(results, baseline=None):
+    if results["reference"] == SCENARIO_REFERENCE:
+        print("Consistency check: the reference is a stepped simulation with move_ball's own rules, not the game.")
+        print("Use --recording with a recording of the game to measure accuracy.")
+    elif results.get("recording") == os.path.basename(REFERENCE_RECORDING):
+        print("The reference is the shipped ball_reference.rec, recorded with the stepped simulation, not the game.")
+        print("Use --recording with a recording of the game to measure accuracy.")
+    print("{} cases. Position error in uu, mean / max, after each horizon in seconds".format(results["cases"]))
+    horizons = list(next(iter(results["mean_error"].values())).keys())
+    print("{:<16}".format("predictor") + "".join("{:>14}".format(h) for h in horizons))
+    for name, by_h in results["mean_error"].items():
+        print("{:<16}".format(name) + "".join(
+            "{:>14}".format("{:.1f} / {:.0f}".format(by_h[h], results["max_error"][name][h])) for h in horizons))
+    print("will_ball_hit_goal agrees with the reference in {:.0%} of cases".format(results["goal_agreement"]))
+    if results["goal_agreement"] < GOAL_AGREEMENT_WARNING:
+        print("WARNING: will_ball_hit_goal is unreliable here. It guesses from a single state along the ball's path, "
+              "use threat.evaluate or the BallTrajectory instead")
+    print()
+    print("{:<32} {:>12}".format("speed", "us per s"))
+    for name, us in results["us_per_second"].items():
+        line = "{:<32} {:>12.1f}".format(name, us)
+        if baseline is not None and baseline["us_per_second"].get(name):
+            line += "  {:+.0%}".format(us / baseline["us_per_second"][name] - 1)
+        print(line)
+
+
+def regressions(results, baseline, tolerance, error_tolerance):
+    # Mean errors that grew by more than error_tolerance uu, and speeds that got worse by more than the tolerance
+    worse = []
+    for name, by_h in results["mean_error"].items():
+        for h, error in by_h.items():
+            before = baseline["mean_error"].get(name, {}).get(h)
+            if before is not None and error > before + error_tolerance:
+                worse.append(("{} error at {}s".format(name, h), before, error))
+    for name, us in results["us_per_second"].items():
+        before = baseline["us_per_second"].get(name)
+        if before is not None and us > before * (1 + tolerance):
+            worse.append((name + " us per s", before, us))
+    return worse
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure the accuracy and speed of the ball prediction")
+    parser.add_argument("--recording", default=REFERENCE_RECORDING,
+                        help="compare with the ball in this recording. Default is the shipped ball_reference.rec")
+    parser.add_argument("--scenarios", action="store_true",
+                        help="check consistency with a stepped simulation of the scenarios instead of a recording")
+    parser.add_argument("--write-reference", action="store_true",
+                        help="record the scenarios of the default reference again, to the --recording file")
+    parser.add_argument("--stride", type=int, default=30, help="ticks between predictions in a recording")
+    parser.add_argument("--random", type=int, default=20, help="random balls added to the scenarios")
+    parser.add_argument("--cases", action="store_true", help="also print the error of every case")
+    parser.add_argument("--save", help="write the results to this json file")
+    parser.add_argument("--compare", help="json file from an earlier --save. Exits with 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown when comparing, 0.2 = 20%%")
+    parser.add_argument("--error-tolerance", type=float, default=1.0, help="allowed growth of mean errors in uu")
+    args = parser.parse_args(argv)
+
+    if args.write_reference:
+        write_reference_recording(args.recording)
+        print("Wrote {}".format(args.recording))
+        return 0
+    if args.scenarios:
+        reference = SCENARIO_REFERENCE
+        cases = scenario_cases(args.random)
+    else:
+        reference = RECORDING_REFERENCE
+        cases = recording_cases(args.recording, args.stride)
+    if not cases:
+        print("No usable ball paths")
+        return 1
+    results = measure(cases, reference, args.recording if reference == RECORDING_REFERENCE else None)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get("reference", reference) != reference:
+            print("The baseline was measured against another reference")
+            return 1
+
+    if args.cases:
+        for case in cases:
+            horizons = horizons_of(case)
+            errors = np.linalg.norm(predict_move_ball(case, horizons) - [case.location_at(h) for h in horizons], axis=1)
+            print("{:<20}".format(case.name) + "".join("{:>8.1f}".format(e) for e in errors))
+        print()
+    print_results(results, baseline)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if baseline is not None:
+        worse = regressions(results, baseline, args.tolerance, args.error_tolerance)
+        for name, before, after in worse:
+            print("REGRESSION {}: {:.1f} -> {:.1f}".format(name, before, after))
+        return 1 if worse else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,88 @@
+import time
+
+from collections import deque
+
+
+# Timers around the phases of a tick. The agent holds either a TickProfiler or a NullProfiler, and calls begin/end
+# around each phase. The NullProfiler's methods do nothing, so a disabled profiler costs next to nothing.
+
+# The phases of Beast.get_output, in the order they are reported
+PHASES = ["data", "dodge", "evaluate", "collect_boost", "execute", "tick"]
+
+
+class NullProfiler:
+    enabled = False
+
+    def begin(self, phase):
+        pass
+
+    def end(self, phase):
+        pass
+
+    def task_changed(self, task):
+        pass
+
+    def tick_done(self, time_elapsed):
+        pass
+
+
+class TickProfiler:
+    enabled = True
+
+    def __init__(self, window=1200, report_interval=10.0, out=print):
+        # window is the number of measurements kept per phase, report_interval is in game seconds
+        self.window = window
+        self.report_interval = report_interval
+        self.out = out
+        self.samples = {}
+        self.starts = {}
+        self.task_changes = deque(maxlen=8)
+        self.task_change_count = 0
+        self.ticks = 0
+        self.last_report_time = None
+
+    def begin(self, phase):
+        self.starts[phase] = time.perf_counter()
+
+    def end(self, phase):
+        duration = time.perf_counter() - self.starts[phase]
+        samples = self.samples.get(phase)
+        if samples is None:
+            samples = self.samples[phase] = deque(maxlen=self.window)
+        samples.append(duration)
+
+    def task_changed(self, task):
+        self.task_changes.append(str(task))
+        self.task_change_count += 1
+
+    def tick_done(self, time_elapsed):
+        # Called at the end of every tick. Prints a summary every report_interval seconds of game time
+        self.ticks += 1
+        if self.last_report_time is None:
+            self.last_report_time = time_elapsed
+        elif time_elapsed - self.last_report_time >= self.report_interval or time_elapsed < self.last_report_time:
+            self.out(self.report())
+            self.last_report_time = time_elapsed
+            self.task_changes.clear()
+            self.task_change_count = 0
+
+    def phase_stats(self, phase):
+        # Returns (count, p50, p95, max) in seconds over the current window, or None if the phase was never timed
+        samples = self.samples.get(phase)
+        if not samples:
+            return None
+        ordered = sorted(samples)
+        count = len(ordered)
+        return count, ordered[(count - 1) // 2], ordered[int((count - 1) * 0.95)], ordered[-1]
+
+    def report(self):
+        lines = ["Tick profile, last {} samples per phase (p50 / p95 / max in ms):".format(self.window)]
+        phases = PHASES + sorted(p for p in self.samples if p not in PHASES)
+        for phase in phases:
+            stats = self.phase_stats(phase)
+            if stats is not None:
+                count, p50, p95, worst = stats
+                lines.append("  {:<14} {:>6.3f} / {:>6.3f} / {:>6.3f}  ({} samples)".format(phase, p50 * 1000, p95 * 1000, worst * 1000, count))
+        if self.task_change_count > 0:
+            lines.append("  {} task changes, latest: {}".format(self.task_change_count, " -> ".join(self.task_changes)))
+        return "\n".join(lines)
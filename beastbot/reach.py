@@ -0,0 +1,264 @@
+import math
+import os
+import numpy as np
+import rlmath
+from carsim import MAX_SPEED, THROTTLE_MAX_SPEED, BOOST_ACCEL, BRAKE_ACCEL, BOOST_PER_SECOND, throttle_accel, kappa
+
+
+# A table of the minimum time it takes a car to reach a point on the ground, given the distance to the point, the
+# angle between the car's heading and the point, the car's forward speed, and its boost. The times are found by
+# simulating a simple car model, which steers towards the point as fast as it can, while still being able to turn
+# sharp enough to reach it. The table is built ahead of time with `python reach.py` and shipped next to this module.
+
+MIN_TURN_SPEED = 250
+# The car drives at the speed of a turn this much tighter than needed, since it can't brake instantly
+TURN_MARGIN = 0.75
+
+# Table axes. The time changes fastest close to the car, so the distances are evenly spaced in their square root
+DISTANCES = np.linspace(0, math.sqrt(12000), 65)**2
+ANGLES = np.linspace(0, math.pi, 33)
+SPEEDS = np.linspace(0, MAX_SPEED, 11)
+BOOSTS = np.array([0, 12.5, 25, 50, 100])
+
+SIM_STEP = 1 / 60
+SIM_MAX_TIME = 10.0
+ARRIVE_DIST = 20
+
+TABLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "reach_table.npz")
+
+
+# The turning radius at each speed, for finding the speed with a given radius
+TURN_SPEEDS = np.linspace(0, MAX_SPEED, 231)
+TURN_RADII = 1 / kappa(TURN_SPEEDS)
+MIN_TURN_RADIUS = float(np.interp(MIN_TURN_SPEED, TURN_SPEEDS, TURN_RADII))
+
+
+def simulate(dists, angs, speeds, boosts):
+    # Returns the time it takes to reach each target. The car starts at the origin facing along the x axis.
+    # Targets that aren't reached within SIM_MAX_TIME get the time SIM_MAX_TIME
+    n = len(dists)
+    tx = dists * np.cos(angs)
+    ty = dists * np.sin(angs)
+    x = np.zeros(n)
+    y = np.zeros(n)
+    heading = np.zeros(n)
+    v = np.array(speeds, dtype=float)
+    boost = np.array(boosts, dtype=float)
+    times = np.full(n, SIM_MAX_TIME)
+    times[dists <= ARRIVE_DIST] = 0
+    # Cars driving straight on, until the target is outside their tightest turning circle
+    escaping = np.zeros(n, dtype=bool)
+
+    active = np.flatnonzero(dists > ARRIVE_DIST)
+    t = 0.0
+    dt = SIM_STEP
+    while len(active) > 0 and t < SIM_MAX_TIME:
+        ax, ay, ah, av, ab = x[active], y[active], heading[active], v[active], boost[active]
+        dx = tx[active] - ax
+        dy = ty[active] - ay
+        err = np.arctan2(dy, dx) - ah
+        err = (err + math.pi) % (2 * math.pi) - math.pi
+        steer = np.clip(3 * err, -1, 1)
+
+        # Limit the speed to the fastest speed, at which the turning circle is narrow enough to reach the target.
+        # A target behind the car is reached with a half circle at most. Crawling around very tight turns is slow,
+        # so the car doesn't go slower than MIN_TURN_SPEED, and if the target is inside the turning circle at that
+        # speed, it drives straight on at that speed until the target is outside the circle. Targets within
+        # ARRIVE_DIST of the circle are steered to directly
+        k = kappa(av)
+        dist = np.sqrt(dx * dx + dy * dy)
+        side = dist * np.abs(np.sin(err))
+        ahead = dist * np.cos(err)
+        with np.errstate(divide="ignore"):
+            needed_radius = dist / (2 * np.where(ahead < 0, 1, side / np.maximum(dist, 1e-9)))
+        center_dist = np.sqrt(ahead * ahead + (side - MIN_TURN_RADIUS)**2)
+        ae = escaping[active]
+        ae = np.where(ae, center_dist < MIN_TURN_RADIUS, center_dist < MIN_TURN_RADIUS - ARRIVE_DIST)
+        escaping[active] = ae
+        steer = np.where(ae, 0, steer)
+        turn_speed = np.maximum(np.interp(needed_radius * TURN_MARGIN, TURN_RADII, TURN_SPEEDS), MIN_TURN_SPEED)
+        speed_limit = np.where(ae, MIN_TURN_SPEED, turn_speed)
+
+        has_boost = ab > 0
+        max_accel = throttle_accel(av) + np.where(has_boost, BOOST_ACCEL, 0)
+        accel = np.clip((speed_limit - av) / dt, -BRAKE_ACCEL, max_accel)
+        ab = np.where(has_boost & (accel > 0), ab - BOOST_PER_SECOND * dt, ab)
+        new_v = np.clip(av + accel * dt, 0, np.where(has_boost, MAX_SPEED, np.maximum(av, THROTTLE_MAX_SPEED)))
+
+        ah = ah + new_v * k * steer * dt
+        nx = ax + new_v * np.cos(ah) * dt
+        ny = ay + new_v * np.sin(ah) * dt
+
+        # Did this step pass close enough to the target? Closest point on the step's segment
+        sx, sy = nx - ax, ny - ay
+        seg2 = sx * sx + sy * sy
+        with np.errstate(divide="ignore", invalid="ignore"):
+            frac = np.clip(np.where(seg2 > 0, (dx * sx + dy * sy) / seg2, 0), 0, 1)
+        close = (ax + frac * sx - tx[active])**2 + (ay + frac * sy - ty[active])**2 <= ARRIVE_DIST**2
+
+        x[active], y[active], heading[active], v[active], boost[active] = nx, ny, ah, new_v, ab
+        times[active[close]] = t + frac[close] * dt
+        active = active[~close]
+        t += dt
+
+    return times
+
+
+def build_table():
+    grid = np.meshgrid(DISTANCES, ANGLES, SPEEDS, BOOSTS, indexing="ij")
+    times = simulate(*(g.ravel() for g in grid))
+    return times.reshape(grid[0].shape)
+
+
+def table_settings():
+    return np.concatenate([DISTANCES, ANGLES, SPEEDS, BOOSTS, [
+        MAX_SPEED, THROTTLE_MAX_SPEED, BOOST_ACCEL, BRAKE_ACCEL, BOOST_PER_SECOND, MIN_TURN_SPEED, TURN_MARGIN,
+        SIM_STEP, SIM_MAX_TIME, ARRIVE_DIST]])
+
+
+def save_table(times):
+    np.savez_compressed(TABLE_FILE, settings=table_settings(), times=times.astype(np.float32))
+
+
+def load_table():
+    # Loads the shipped table. If it is missing or made with other settings, it is built in memory, which takes
+    # seconds, so `python reach.py` should be run after changing the settings
+    try:
+        with np.load(TABLE_FILE) as shipped:
+            if np.array_equal(shipped["settings"], table_settings()):
+                return shipped["times"].astype(float)
+    except (OSError, KeyError, ValueError):
+        pass
+    print("reach: {} is missing or outdated, building the table. Run reach.py to save it".format(TABLE_FILE))
+    return build_table()
+
+
+TIMES = load_table()
+
+# For the scalar lookup, which is faster on plain python floats
+_times_flat = TIMES.ravel().tolist()
+_s0, _s1, _s2, _s3 = [s // TIMES.itemsize for s in TIMES.strides]
+_max_dist = float(DISTANCES[-1])
+_dists = DISTANCES.tolist()
+_sqrt_dist_step = math.sqrt(DISTANCES[1])
+_ang_step = float(ANGLES[1] - ANGLES[0])
+_speed_step = float(SPEEDS[1] - SPEEDS[0])
+_boosts = BOOSTS.tolist()
+# For reach_times_at, which takes a (distance, angle) slice at a time
+_times_by_speed = np.ascontiguousarray(TIMES.transpose(2, 3, 0, 1))
+
+
+def _axis_pos(value, step, count):
+    # Index of the cell on an axis starting at 0, and the weight of the next index
+    pos = min(max(value / step, 0), count - 1)
+    i = min(int(pos), count - 2)
+    return i, pos - i
+
+
+def _dist_pos(dist):
+    # _axis_pos for the distance axis, which is found from the square root, but interpolated linearly in distance
+    i = min(int(math.sqrt(max(dist, 0)) / _sqrt_dist_step), len(_dists) - 2)
+    return i, (dist - _dists[i]) / (_dists[i + 1] - _dists[i])
+
+
+def reach_time(dist, ang, speed, boost):
+    # Minimum time to reach a point dist away at the given angle (radians, either side) from the car's heading,
+    # with the given forward speed and boost amount
+    extra = 0
+    if dist > _max_dist:
+        # Beyond the table, the rest is driven at top speed
+        extra = (dist - _max_dist) / (MAX_SPEED if boost > 0 else THROTTLE_MAX_SPEED)
+        dist = _max_dist
+
+    i0, w0 = _dist_pos(dist)
+    i1, w1 = _axis_pos(abs(rlmath.fix_ang(ang)), _ang_step, len(ANGLES))
+    i2, w2 = _axis_pos(speed, _speed_step, len(SPEEDS))
+    boost = min(max(boost, 0), _boosts[-1])
+    i3 = 0
+    while i3 < len(_boosts) - 2 and _boosts[i3 + 1] <= boost:
+        i3 += 1
+    w3 = (boost - _boosts[i3]) / (_boosts[i3 + 1] - _boosts[i3])
+
+    # Multilinear interpolation between the 16 surrounding entries, one axis at a time
+    t = _times_flat
+    s0, s1, s2, s3 = _s0, _s1, _s2, _s3
+    v3 = 1 - w3
+    b = i0 * s0 + i1 * s1 + i2 * s2 + i3 * s3
+    c000 = t[b] * v3 + t[b + s3] * w3
+    c001 = t[b + s2] * v3 + t[b + s2 + s3] * w3
+    c010 = t[b + s1] * v3 + t[b + s1 + s3] * w3
+    c011 = t[b + s1 + s2] * v3 + t[b + s1 + s2 + s3] * w3
+    b += s0
+    c100 = t[b] * v3 + t[b + s3] * w3
+    c101 = t[b + s2] * v3 + t[b + s2 + s3] * w3
+    c110 = t[b + s1] * v3 + t[b + s1 + s3] * w3
+    c111 = t[b + s1 + s2] * v3 + t[b + s1 + s2 + s3] * w3
+    c00 = c000 + (c001 - c000) * w2
+    c01 = c010 + (c011 - c010) * w2
+    c10 = c100 + (c101 - c100) * w2
+    c11 = c110 + (c111 - c110) * w2
+    c0 = c00 + (c01 - c00) * w1
+    c1 = c10 + (c11 - c10) * w1
+    return c0 + (c1 - c0) * w0 + extra
+
+
+def reach_times(dists, angs, speeds, boosts):
+    # Vectorized reach_time
+    dists = np.asarray(dists, dtype=float)
+    angs = np.abs((np.asarray(angs, dtype=float) + math.pi) % (2 * math.pi) - math.pi)
+    speeds = np.asarray(speeds, dtype=float)
+    boosts = np.asarray(boosts, dtype=float)
+    dists, angs, speeds, boosts = np.broadcast_arrays(dists, angs, speeds, boosts)
+
+    max_dist = DISTANCES[-1]
+    extra = np.maximum(dists - max_dist, 0) / np.where(boosts > 0, MAX_SPEED, THROTTLE_MAX_SPEED)
+
+    indexes = []
+    weights = []
+    for values, axis in zip((np.minimum(dists, max_dist), angs, speeds, boosts), (DISTANCES, ANGLES, SPEEDS, BOOSTS)):
+        values = np.clip(values, axis[0], axis[-1])
+        i = np.clip(np.searchsorted(axis, values, side="right") - 1, 0, len(axis) - 2)
+        indexes.append(i)
+        weights.append((values - axis[i]) / (axis[i + 1] - axis[i]))
+
+    result = np.zeros(dists.shape)
+    for corner in range(16):
+        offsets = [(corner >> k) & 1 for k in range(4)]
+        w = np.ones(dists.shape)
+        for k in range(4):
+            w = w * (weights[k] if offsets[k] else 1 - weights[k])
+        result += w * TIMES[indexes[0] + offsets[0], indexes[1] + offsets[1], indexes[2] + offsets[2], indexes[3] + offsets[3]]
+    return result + extra
+
+
+def reach_times_at(dists, angs, speed, boost):
+    # reach_times for many points, but one speed and boost amount. The table is first reduced to the given speed and
+    # boost, so each point only needs the 4 entries around it
+    i2, w2 = _axis_pos(speed, _speed_step, len(SPEEDS))
+    boost = min(max(boost, 0), _boosts[-1])
+    i3 = 0
+    while i3 < len(_boosts) - 2 and _boosts[i3 + 1] <= boost:
+        i3 += 1
+    w3 = (boost - _boosts[i3]) / (_boosts[i3 + 1] - _boosts[i3])
+    t = _times_by_speed
+    table = (t[i2, i3] * ((1 - w2) * (1 - w3)) + t[i2 + 1, i3] * (w2 * (1 - w3))
+             + t[i2, i3 + 1] * ((1 - w2) * w3) + t[i2 + 1, i3 + 1] * (w2 * w3))
+
+    dists = np.asarray(dists, dtype=float)
+    extra = np.maximum(dists - _max_dist, 0) / (MAX_SPEED if boost > 0 else THROTTLE_MAX_SPEED)
+    # Distances and angles can't be negative, so only the upper end needs clamping
+    dists = np.minimum(np.maximum(dists, 0), _max_dist)
+    angs = np.abs((np.asarray(angs, dtype=float) + math.pi) % (2 * math.pi) - math.pi)
+    pos1 = np.minimum(angs / _ang_step, len(ANGLES) - 1)
+    i0 = np.minimum((np.sqrt(dists) / _sqrt_dist_step).astype(int), len(DISTANCES) - 2)
+    i1 = np.minimum(pos1.astype(int), len(ANGLES) - 2)
+    w0 = (dists - DISTANCES[i0]) / (DISTANCES[i0 + 1] - DISTANCES[i0])
+    w1 = pos1 - i1
+    c0 = table[i0, i1] + (table[i0, i1 + 1] - table[i0, i1]) * w1
+    c1 = table[i0 + 1, i1] + (table[i0 + 1, i1 + 1] - table[i0 + 1, i1]) * w1
+    return c0 + (c1 - c0) * w0 + extra
+
+
+if __name__ == "__main__":
+    # TIMES was built on import if the saved table is outdated
+    save_table(TIMES)
@@ -0,0 +1,210 @@
+import functools
+import os
+import struct
+import numpy as np
+
+from rlbot.utils.structures.game_data_struct import GameTickPacket
+
+
+# Recordings of the packets a bot saw. A file is a header followed by one fixed size record per tick, so a recording
+# can be memory-mapped and read as a numpy structured array without parsing or loading it all. Records are written
+# with struct, in the exact (packed, little-endian) layout of the numpy dtype.
+
+MAGIC = b"BEASTREC"
+VERSION = 1
+HEADER = struct.Struct("<8sHHH")  # magic, version, max cars, max boosts
+
+# Cars and boost pads beyond these aren't recorded
+MAX_CARS = 8
+MAX_BOOSTS = 50
+
+# Rotations are (pitch, yaw, roll)
+PHYSICS_DTYPE = np.dtype([
+    ("location", "<f4", (3,)),
+    ("rotation", "<f4", (3,)),
+    ("velocity", "<f4", (3,)),
+    ("angular_velocity", "<f4", (3,)),
+])
+PHYSICS_FORMAT = "12f"
+
+CAR_DTYPE = np.dtype([
+    ("physics", PHYSICS_DTYPE),
+    ("boost", "u1"),
+    ("team", "u1"),
+    ("has_wheel_contact", "?"),
+    ("is_super_sonic", "?"),
+    ("jumped", "?"),
+    ("double_jumped", "?"),
+    ("is_demolished", "?"),
+])
+CAR_FORMAT = PHYSICS_FORMAT + "BB5?"
+
+
+def record_dtype(max_cars=MAX_CARS, max_boosts=MAX_BOOSTS):
+    return np.dtype([
+        ("seconds_elapsed", "<f8"),
+        ("game_time_remaining", "<f4"),
+        ("game_speed", "<f4"),
+        ("world_gravity_z", "<f4"),
+        ("is_round_active", "?"),
+        ("is_kickoff_pause", "?"),
+        ("is_match_ended", "?"),
+        ("ball", PHYSICS_DTYPE),
+        ("num_cars", "u1"),
+        ("cars", CAR_DTYPE, (max_cars,)),
+        ("num_boost", "u1"),
+        ("boost_active", "?", (max_boosts,)),
+        ("boost_timer", "<f4", (max_boosts,)),
+    ])
+
+
+@functools.lru_cache(maxsize=None)
+def record_struct(max_cars=MAX_CARS, max_boosts=MAX_BOOSTS):
+    return struct.Struct("<d3f3?" + PHYSICS_FORMAT + "B" + CAR_FORMAT * max_cars + "B" + "{0}?{0}f".format(max_boosts))
+
+
+def physics_values(physics):
+    loc, rot, vel, ang = physics.location, physics.rotation, physics.velocity, physics.angular_velocity
+    return (loc.x, loc.y, loc.z, rot.pitch, rot.yaw, rot.roll, vel.x, vel.y, vel.z, ang.x, ang.y, ang.z)
+
+
+class NullRecorder:
+    def record(self, packet):
+        pass
+
+    def close(self):
+        pass
+
+
+class Recorder:
+    # Appends a record of every packet to a file. An existing recording with the same layout is continued
+    def __init__(self, path, max_cars=MAX_CARS, max_boosts=MAX_BOOSTS):
+        self.max_cars = max_cars
+        self.max_boosts = max_boosts
+        self.struct = record_struct(max_cars, max_boosts)
+        self.empty_car = (0.0,) * 12 + (0, 0) + (False,) * 5
+
+        header = HEADER.pack(MAGIC, VERSION, max_cars, max_boosts)
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            self.file = open(path, "r+b")
+            if self.file.read(HEADER.size) != header:
+                self.file.close()
+                raise ValueError("{} is not a recording with the same layout".format(path))
+            # Drop a record that was cut off while being written
+            count = (os.path.getsize(path) - HEADER.size) // self.struct.size
+            self.file.truncate(HEADER.size + count * self.struct.size)
+            self.file.seek(0, os.SEEK_END)
+        else:
+            self.file = open(path, "wb")
+            self.file.write(header)
+
+    def record(self, packet: GameTickPacket):
+        info = packet.game_info
+        values = [info.seconds_elapsed, info.game_time_remaining, info.game_speed, info.world_gravity_z,
+                  info.is_round_active, info.is_kickoff_pause, info.is_match_ended]
+        values.extend(physics_values(packet.game_ball.physics))
+
+        num_cars = min(packet.num_cars, self.max_cars)
+        values.append(num_cars)
+        for i in range(num_cars):
+            car = packet.game_cars[i]
+            values.extend(physics_values(car.physics))
+            values.extend((min(max(car.boost, 0), 255), car.team, car.has_wheel_contact, car.is_super_sonic,
+                           car.jumped, car.double_jumped, car.is_demolished))
+        for i in range(num_cars, self.max_cars):
+            values.extend(self.empty_car)
+
+        num_boost = min(packet.num_boost, self.max_boosts)
+        values.append(num_boost)
+        boosts = packet.game_boosts
+        active = [boosts[i].is_active for i in range(num_boost)]
+        timers = [boosts[i].timer for i in range(num_boost)]
+        padding = self.max_boosts - num_boost
+        values.extend(active)
+        values.extend((False,) * padding)
+        values.extend(timers)
+        values.extend((0.0,) * padding)
+
+        self.file.write(self.struct.pack(*values))
+
+    def close(self):
+        self.file.close()
+
+
+class Recording:
+    # A memory-mapped recording. records is a numpy structured array with one record per tick, so fields can be
+    # read for all ticks at once without copying, e.g. recording.records["ball"]["location"].
+    # Indexing gives a GameTickPacket, and slicing a Recording of the slice. Iterating fills in the same packet
+    # for each tick, like the framework does
+    def __init__(self, path):
+        with open(path, "rb") as file:
+            header = file.read(HEADER.size)
+        if len(header) < HEADER.size:
+            raise ValueError("{} is not a recording".format(path))
+        magic, version, max_cars, max_boosts = HEADER.unpack(header)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("{} is not a version {} recording".format(path, VERSION))
+
+        dtype = record_dtype(max_cars, max_boosts)
+        # A record that was cut off while being written is left out
+        count = (os.path.getsize(path) - HEADER.size) // dtype.itemsize
+        if count > 0:
+            self.records = np.memmap(path, dtype=dtype, mode="r", offset=HEADER.size, shape=(count,))
+        else:
+            self.records = np.zeros(0, dtype=dtype)
+
+    @staticmethod
+    def from_records(records):
+        recording = Recording.__new__(Recording)
+        recording.records = records
+        return recording
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return Recording.from_records(self.records[index])
+        return to_packet(self.records[index])
+
+    def __iter__(self):
+        packet = GameTickPacket()
+        for record in self.records:
+            yield to_packet(record, packet)
+
+
+def set_physics(physics, values, i):
+    # Sets the physics from the 12 values starting at i
+    loc, rot, vel, ang = physics.location, physics.rotation, physics.velocity, physics.angular_velocity
+    loc.x, loc.y, loc.z, rot.pitch, rot.yaw, rot.roll, vel.x, vel.y, vel.z, ang.x, ang.y, ang.z = values[i:i + 12]
+
+
+def to_packet(record, packet=None):
+    # Fills in a GameTickPacket from a record. The record is unpacked with the struct it was written with
+    if packet is None:
+        packet = GameTickPacket()
+    max_cars = record.dtype["cars"].shape[0]
+    max_boosts = record.dtype["boost_active"].shape[0]
+    values = record_struct(max_cars, max_boosts).unpack(record.tobytes())
+
+    info = packet.game_info
+    (info.seconds_elapsed, info.game_time_remaining, info.game_speed, info.world_gravity_z,
+     info.is_round_active, info.is_kickoff_pause, info.is_match_ended) = values[0:7]
+    set_physics(packet.game_ball.physics, values, 7)
+
+    packet.num_cars = values[19]
+    i = 20
+    for c in range(packet.num_cars):
+        car = packet.game_cars[c]
+        set_physics(car.physics, values, i)
+        (car.boost, car.team, car.has_wheel_contact, car.is_super_sonic,
+         car.jumped, car.double_jumped, car.is_demolished) = values[i + 12:i + 19]
+        i += 19
+    i = 20 + 19 * max_cars
+
+    packet.num_boost = values[i]
+    boosts = packet.game_boosts
+    for b in range(packet.num_boost):
+        boosts[b].is_active = values[i + 1 + b]
+        boosts[b].timer = values[i + 1 + max_boosts + b]
+    return packet
@@ -17,20 +17,75 @@ def face_ang_01(ang):
 
 
 class UtilitySystem:
-	def __init__(self, choices, prev_bias=0.15):
+	# Choices can let the system skip re-scoring them. Such a choice has two extra methods:
+	#   utility_inputs(data) returns a tuple of the state its utility depends on
+	#   utility_error(scored_inputs, inputs) returns how much its utility can at most have changed since it was
+	#   scored with scored_inputs, or math.inf if it can't tell.
+	# A cached score is reused while its possible error is at most the tolerance. Cached scores that might beat the
+	# best choice are always re-scored, so the chosen choice and its score are the same as if everything was scored.
+	# evaluate can be limited to some of the choices, by giving their indexes as candidates.
+	def __init__(self, choices, prev_bias=0.15, tolerance=0.0):
 		self.choices = choices
 		self.scores = [0] * len(choices)
 		self.best_index = -1
 		self.prev_bias = prev_bias
+		self.tolerance = tolerance
+		self.scored_inputs = [None] * len(choices)
+		self.errors = [math.inf] * len(choices)
+		self.rescored_count = 0  # number of utility calls in the last evaluation
 
-	def evaluate(self, data):
-		for i, ch in enumerate(self.choices):
-			self.scores[i] = ch.utility(data)
-			if i == self.best_index:
-				self.scores[i] += self.prev_bias  # was previous best choice bias
+	def evaluate(self, data, candidates=None):
+		if candidates is None:
+			candidates = range(len(self.choices))
+		self.rescored_count = 0
+		for i in candidates:
+			ch = self.choices[i]
+			inputs_method = getattr(ch, "utility_inputs", None)
+			if inputs_method is None:
+				self.__score(i, data, None)
+				continue
+
+			inputs = inputs_method(data)
+			scored_inputs = self.scored_inputs[i]
+			error = math.inf if scored_inputs is None else ch.utility_error(scored_inputs, inputs)
+			if error > self.tolerance:
+				self.__score(i, data, inputs)
+			else:
+				self.errors[i] = error
+
+		# The best choice must be exact, and no other choice may be able to beat it
+		while True:
+			best_score = -math.inf
+			best_index = -1
+			for i in candidates:
+				score = self.scores[i]
+				if i == self.best_index:
+					score += self.prev_bias  # was previous best choice bias
+				if score > best_score:
+					best_score = score
+					best_index = i
+
+			if best_index == -1:
+				raise ValueError("No choices to evaluate")
+
+			if self.errors[best_index] > 0:
+				self.__score(best_index, data)
+				continue
+
+			uncertain = False
+			for i in candidates:
+				if self.errors[i] > 0:
+					score = self.scores[i]
+					if i == self.best_index:
+						score += self.prev_bias
+					if score + self.errors[i] >= best_score:
+						self.__score(i, data)
+						uncertain = True
+			if not uncertain:
+				break
 
 		prev_best_index = self.best_index
-		self.best_index = self.scores.index(max(self.scores))
+		self.best_index = best_index
 
 		if prev_best_index != self.best_index:
 			# Check if choice has a reset method, then call it
@@ -38,7 +93,16 @@ class UtilitySystem:
 			if callable(reset_method):
 				reset_method()
 
-		return self.choices[self.best_index], self.scores[self.best_index]
+		return self.choices[self.best_index], best_score
+
+	def __score(self, index, data, inputs=None):
+		ch = self.choices[index]
+		if inputs is None and hasattr(ch, "utility_inputs"):
+			inputs = ch.utility_inputs(data)
+		self.scores[index] = ch.utility(data)
+		self.scored_inputs[index] = inputs
+		self.errors[index] = 0
+		self.rescored_count += 1
 
 	def reset(self):
 		self.best_index = -1
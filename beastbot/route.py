@@ -1,31 +1,88 @@
 import math
+import numpy as np
 import rlmath
+import reach
 import datalibs
 import predict
 from datalibs import Data
 from vec import Vec3
 
 
+# A point is passed when the car is this close to it, or past it
+PASS_DIST = 150
+
+
 class Route:
+    # A path of points on the ground. A route can be kept for many ticks: advance moves it along as the car passes
+    # its points, and the cumulative lengths make the remaining length and the ETA cheap to find
     def __init__(self, points, final_loc, time_offset, expected_vel, car_loc, good_route, high_end_vel):
         self.points = points
         self.final_loc = final_loc
         self.time_offset = time_offset
         self.expected_vel = expected_vel
-        self.length = self.__find_length(car_loc, points)
         self.car_loc = car_loc
+        self.start_loc = car_loc
         self.good_route = good_route
         self.high_end_vel = high_end_vel
+        # cum_lengths[i] is the length from car_loc along the route to points[i]
+        self.cum_lengths = self.__find_lengths(car_loc, points)
+        self.length = self.cum_lengths[-1] if points else 0
+        self.index = 0  # the next point
 
-    def __find_length(self, car_loc, points):
-        if len(points) < 1:
-            return 0
+    def __find_lengths(self, car_loc, points):
+        lengths = []
         sum_len = 0
         prev_loc = car_loc
         for loc in points:
             sum_len += prev_loc.dist(loc)
+            lengths.append(sum_len)
             prev_loc = loc
-        return sum_len
+        return lengths
+
+    @property
+    def next_point(self):
+        return self.points[self.index]
+
+    def remaining_points(self):
+        return self.points[self.index:]
+
+    def advance(self, car_loc, pass_dist=PASS_DIST):
+        # Skips the points the car has passed, which are the close ones and the ones it is beyond along the way to them.
+        # The last point is never skipped
+        self.car_loc = car_loc
+        x, y = car_loc.x, car_loc.y
+        points = self.points
+        while self.index < len(points) - 1:
+            point = points[self.index]
+            prev = points[self.index - 1] if self.index > 0 else self.start_loc
+            px, py = point.x, point.y
+            if (px - x) ** 2 + (py - y) ** 2 > pass_dist ** 2 and (x - px) * (px - prev.x) + (y - py) * (py - prev.y) <= 0:
+                break
+            self.index += 1
+        return self
+
+    def move_end(self, offset, count=1):
+        # Moves the last count points that are not passed yet by the offset, for when the destination moved a little
+        points = self.points
+        start = max(len(points) - count, self.index)
+        for i in range(start, len(points)):
+            points[i] = points[i] + offset
+            prev_loc = points[i - 1] if i > 0 else self.car_loc
+            prev_len = self.cum_lengths[i - 1] if i > 0 else 0
+            self.cum_lengths[i] = prev_len + prev_loc.dist(points[i])
+        if points:
+            self.length = self.cum_lengths[-1]
+        return self
+
+    def remaining_length(self):
+        # The length from car_loc to the end, through the remaining points
+        if not self.points:
+            return 0
+        return self.car_loc.dist(self.points[self.index]) + self.length - self.cum_lengths[self.index]
+
+    def eta(self):
+        # Driving time left at the expected velocity
+        return self.remaining_length() / max(self.expected_vel, 1)
 
 
 def find_route_to_next_ball_landing(data: Data, look_towards=None):
@@ -34,9 +91,7 @@ def find_route_to_next_ball_landing(data: Data, look_towards=None):
     vel_f = data.car.velocity.proj_onto_size(car_to_ball)
     drive_time = dist / max(1410, vel_f)
 
-    ball = data.ball.copy()
-
-    predict.move_ball(ball, drive_time)
+    ball = data.ball_trajectory.state_at(drive_time)
     time_hit = predict.next_ball_ground_hit(ball).time
     time_total = drive_time + time_hit
 
@@ -48,7 +103,7 @@ def draw_route(renderer, route: Route, r=255, g=255, b=0):
         return
 
     prev_loc_t = route.car_loc.tuple()
-    for loc in route.points:
+    for loc in route.remaining_points():
         loc_t = loc.tuple()
         renderer.draw_line_3d(prev_loc_t, loc_t, renderer.create_color(255 if route.good_route else 50, r, g, b))
         prev_loc_t = loc_t
@@ -61,11 +116,11 @@ def get_route_to_ball(data: Data, time_offset=0, look_towards=None):
     if look_towards is None:
         look_towards = datalibs.get_goal_location(data.enemy, data)
 
-    ball = predict.move_ball(data.ball.copy(), time_offset)
+    ball = data.ball_trajectory.state_at(time_offset)
 
     ball_init_loc = ball.location.flat()
     ball_to_goal = look_towards - ball_init_loc
-    if ball_to_goal.flat().length2() == 0:
+    if look_towards.dist2_flat(ball_init_loc) == 0:
         ball_to_goal = datalibs.get_goal_location(data.enemy, data) - ball_init_loc
 
     ball_init_dir = ball_to_goal.flat().normalized() * -1
@@ -86,10 +141,8 @@ def get_route_to_ball(data: Data, time_offset=0, look_towards=None):
         t = - (bx*bx - 2*bx*cx + by*by - 2*by*cy + cx*cx + cy*cy) / (2*(bx*dx + by*dy - cx*dx - cy*dy))
         t = min(max(-1400, t), 1400)
 
-        point = ball_init_loc + t * ball_init_dir
-
-        point.x = min(max(-4030, point.x), 4030)
-        point.y = min(max(-5090, point.y), 5090)
+        point = Vec3(min(max(-4030, bx + t * dx), 4030),
+                     min(max(-5090, by + t * dy), 5090))
 
         return Route([point, ball_init_loc], ball_init_dir, 1, 1410, car_loc, good_route, False)
 
@@ -125,7 +178,7 @@ def get_route(data: Data, destination, look_target):
 
             if i > 0:
                 cur_dir = cur_dir.rotate_2d(max_turn_ang * turn_sgn)
-            cur_loc += cur_dir * dist_step_size
+            cur_loc = Vec3(cur_loc.x + cur_dir.x * dist_step_size, cur_loc.y + cur_dir.y * dist_step_size)
 
             locs_visited.append(cur_loc)
 
@@ -179,22 +232,22 @@ class AimCone:
         point = point.flat()
         desired_dir = self.get_center_dir()
 
-        desired_dir_inv = -1 * desired_dir
+        desired_dir_inv = Vec3(-desired_dir.x, -desired_dir.y)
         car_loc = data.car.location.flat()
         point_to_car = car_loc - point
-        dist = point_to_car.length()
 
         ang_to_desired_dir = desired_dir_inv.ang_to_flat(point_to_car)
 
         ANG_ROUTE_ACCEPTED = math.pi / 5.0
         can_go_straight = abs(ang_to_desired_dir) < self.span_size() / 2.0
         can_with_route = abs(ang_to_desired_dir) < self.span_size() / 2.0 + ANG_ROUTE_ACCEPTED
-        point = point + desired_dir_inv * 50
+        point.x += desired_dir_inv.x * 50
+        point.y += desired_dir_inv.y * 50
         if can_go_straight:
             return point, 1.0
         elif can_with_route:
-            ang_to_right = abs(point_to_car.ang_to_flat(-1*self.right_dir))
-            ang_to_left = abs(point_to_car.ang_to_flat(-1*self.left_dir))
+            ang_to_right = abs(rlmath.fix_ang(self.right_ang + math.pi - point_to_car.ang()))
+            ang_to_left = abs(rlmath.fix_ang(self.left_ang + math.pi - point_to_car.ang()))
             closest_dir = self.right_dir if ang_to_right < ang_to_left else self.left_dir
 
             bx = point.x
@@ -208,10 +261,8 @@ class AimCone:
                         2 * (bx * dx + by * dy - cx * dx - cy * dy))
             t = min(max(-1700, t), 1700)
 
-            goto = point + 0.8 * t * closest_dir
-
-            goto.x = min(max(-4030, goto.x), 4030)
-            goto.y = min(max(-5090, goto.y), 5090)
+            goto = Vec3(min(max(-4030, bx + 0.8 * t * dx), 4030),
+                        min(max(-5090, by + 0.8 * t * dy), 5090))
 
             data.renderer.draw_line_3d(data.car.location.tuple(), goto.tuple(), data.renderer.create_color(255, 150, 150, 150))
             data.renderer.draw_line_3d(point.tuple(), goto.tuple(), data.renderer.create_color(255, 150, 150, 150))
@@ -232,6 +283,147 @@ class AimCone:
                                   renderer.create_color(255 if i == 0 or i == arm_count - 1 else 110, r, g, b))
 
 
+# Aim cones for many moments at once, and the goto points of a car for them, with numpy. Cone i is the same as
+# AimCone(right_angs[i], left_angs[i]), and the methods give what the AimCone methods give for each cone
+class AimCones:
+    def __init__(self, right_most_angs, left_most_angs):
+        right_most_angs = np.asarray(right_most_angs, dtype=float)
+        left_most_angs = np.asarray(left_most_angs, dtype=float)
+        self.right_angs = fix_angs(right_most_angs)
+        self.left_angs = fix_angs(left_most_angs)
+        self.right_dirs = np.stack([np.cos(right_most_angs), np.sin(right_most_angs)], axis=1)
+        self.left_dirs = np.stack([np.cos(left_most_angs), np.sin(left_most_angs)], axis=1)
+
+    def __len__(self):
+        return len(self.right_angs)
+
+    def cone(self, i):
+        return AimCone(float(self.right_angs[i]), float(self.left_angs[i]))
+
+    def contains_directions(self, directions):
+        # directions is an (N, 2) or (N, 3) array, one direction per cone
+        angs = np.arctan2(directions[:, 1], directions[:, 0])
+        inside = (self.right_angs < angs) & (angs < self.left_angs)
+        outside = (angs > self.right_angs) | (angs < self.left_angs)
+        return np.where(self.right_angs < self.left_angs, inside, outside)
+
+    def span_sizes(self):
+        spans = self.right_angs - self.left_angs
+        return np.where(self.right_angs < self.left_angs, math.tau + spans, spans)
+
+    def get_center_angs(self):
+        return fix_angs(self.right_angs - self.span_sizes() / 2)
+
+    def get_center_dirs(self):
+        angs = self.get_center_angs()
+        return np.stack([np.cos(angs), np.sin(angs)], axis=1)
+
+    def get_goto_points(self, car_loc, points):
+        # get_goto_point for the point of each cone, an (N, 2) or (N, 3) array. Returns the goto points as an (N, 2)
+        # array, the timing factors, and whether each goto point exists. Nothing is rendered
+        points = points[:, :2]
+        spans = self.span_sizes()
+        desired_dir_inv = -self.get_center_dirs()
+        point_to_car = np.array([car_loc.x, car_loc.y]) - points
+        point_to_car_angs = np.arctan2(point_to_car[:, 1], point_to_car[:, 0])
+        ang_to_desired_dir = np.abs(fix_angs(point_to_car_angs
+                                             - np.arctan2(desired_dir_inv[:, 1], desired_dir_inv[:, 0])))
+
+        ANG_ROUTE_ACCEPTED = math.pi / 5.0
+        can_go_straight = ang_to_desired_dir < spans / 2.0
+        can_with_route = ang_to_desired_dir < spans / 2.0 + ANG_ROUTE_ACCEPTED
+        points = points + desired_dir_inv * 50
+
+        ang_to_right = np.abs(fix_angs(self.right_angs + math.pi - point_to_car_angs))
+        ang_to_left = np.abs(fix_angs(self.left_angs + math.pi - point_to_car_angs))
+        closest_dirs = np.where((ang_to_right < ang_to_left)[:, None], self.right_dirs, self.left_dirs)
+
+        to_point = points - np.array([car_loc.x, car_loc.y])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            t = -(to_point * to_point).sum(axis=1) / (2 * (to_point * closest_dirs).sum(axis=1))
+        t = np.clip(np.nan_to_num(t), -1700, 1700)
+        route_points = points + 0.8 * t[:, None] * closest_dirs
+        np.clip(route_points[:, 0], -4030, 4030, out=route_points[:, 0])
+        np.clip(route_points[:, 1], -5090, 5090, out=route_points[:, 1])
+
+        gotos = np.where(can_go_straight[:, None], points, route_points)
+        goto_times = np.where(can_go_straight, 1.0, np.where(can_with_route, 0.5, 1.0))
+        return gotos, goto_times, can_with_route
+
+
+def fix_angs(angs):
+    # rlmath.fix_ang for arrays
+    return (angs + math.pi) % math.tau - math.pi
+
+
+def aim_cones_towards(locations, right_targets, left_targets):
+    # The cones from each of the (N, 3) locations to the two targets. The targets are Vec3s or (N, 3) arrays
+    right = np.asarray(right_targets.tuple() if isinstance(right_targets, Vec3) else right_targets) - locations
+    left = np.asarray(left_targets.tuple() if isinstance(left_targets, Vec3) else left_targets) - locations
+    return AimCones(np.arctan2(right[..., 1], right[..., 0]), np.arctan2(left[..., 1], left[..., 0]))
+
+
+# Moments tried for a shot, the intercept and these later ones
+SHOT_SLICE_STEP = 0.25
+SHOT_SLICES = 8
+# How a shot is scored: the time the car has to spare (seconds), up to SHOT_MARGIN_CAP, plus SHOT_FIT_VALUE if the
+# car already approaches the ball from inside the aim cone, minus SHOT_DELAY_COST per second after the intercept
+SHOT_MARGIN_CAP = 0.25
+SHOT_FIT_VALUE = 0.3
+SHOT_DELAY_COST = 0.6
+# ShotSearch looks again after this long (seconds), or when the ball's path moves this far (uu) from the kept shot,
+# if the tick has time for it. SHOT_SEARCH_COST is what a search costs before it is measured (seconds)
+SHOT_SEARCH_INTERVAL = 0.25
+SHOT_TOLERANCE = 100
+SHOT_SEARCH_COST = 0.0004
+
+
+class Shot:
+    def __init__(self, time, ball_loc, aim_dir, goto, goto_time):
+        self.time = time
+        self.ball_loc = ball_loc
+        self.aim_dir = aim_dir  # the center direction of the aim cone
+        self.goto = goto
+        self.goto_time = goto_time
+
+
+def find_shot(data: Data, right_target, left_target, straight=False):
+    # Scores the moments of the ball's path from the intercept on, where the car can get to the goto point of the aim
+    # cone in time, and returns the best as a Shot, or None. With straight, only goto points where the car can go
+    # straight at the ball count
+    trajectory = data.ball_trajectory
+    start = data.time_till_hit
+    times = [start + SHOT_SLICE_STEP * i for i in range(SHOT_SLICES + 1)]
+    times = np.array([time for time in times if time <= trajectory.horizon])
+    if len(times) == 0:
+        return None
+    locations = np.array([trajectory.state_at(time).location.tuple() for time in times])
+    cones = aim_cones_towards(locations, right_target, left_target)
+    gotos, goto_times, possible = cones.get_goto_points(data.car.location, locations)
+    if straight:
+        possible &= goto_times == 1.0
+
+    car = data.car
+    car_xy = np.array([car.location.x, car.location.y])
+    front = car.orientation.front
+    to_gotos = gotos - car_xy
+    dists = np.sqrt((to_gotos * to_gotos).sum(axis=1))
+    angs = np.arctan2(to_gotos[:, 1], to_gotos[:, 0]) - math.atan2(front.y, front.x)
+    reach_times = reach.reach_times_at(dists, angs, max(car.velocity.dot(front), 0), car.boost)
+    # The goto point of a route is to be reached at goto_time of the way, like the timing in ShootAtGoal
+    margins = times * goto_times - reach_times
+    fits = cones.contains_directions(locations[:, :2] - car_xy)
+    scores = np.minimum(margins, SHOT_MARGIN_CAP) + SHOT_FIT_VALUE * fits - SHOT_DELAY_COST * (times - start)
+    scores[~(possible & (margins >= 0))] = -math.inf
+
+    i = int(np.argmax(scores))
+    if scores[i] == -math.inf:
+        return None
+    aim_dir = Vec3(*cones.get_center_dirs()[i].tolist())
+    return Shot(float(times[i]), Vec3(*locations[i].tolist()), aim_dir, Vec3(*gotos[i].tolist()),
+                float(goto_times[i]))
+
+
 def debug_aim_cone(data):
     ball_loc = data.ball.location
     own_post_right, own_post_left = datalibs.get_goal_posts(data.car, data)
@@ -259,3 +451,31 @@ def debug_aim_cone(data):
     good = aim_cone_dyn.contains_direction(car_to_ball)
     data.renderer.draw_line_3d(data.car.location.tuple(), ball_loc.tuple(),
                                data.renderer.create_color(255, 255 if good else 0, 140 if good else 255, 0))
+
+
+class ShotSearch:
+    # Keeps the result of find_shot between ticks, since searching the ball's path costs a lot more than a tick
+    # usually has. The kept shot is used while the ball's path still goes through it
+    def __init__(self):
+        self.shot = None
+        self.hit_time = 0  # game time of the kept shot
+        self.search_time = -math.inf
+
+    def find(self, data: Data, right_target, left_target, straight=False):
+        time = self.hit_time - data.time
+        kept = self.shot is not None and time > 0 \
+            and data.ball_trajectory.state_at(time).location.dist(self.shot.ball_loc) < SHOT_TOLERANCE
+        if data.time - self.search_time < SHOT_SEARCH_INTERVAL and (kept or self.shot is None) \
+                or not data.deadline.allows("shot_search", SHOT_SEARCH_COST):
+            if not kept:
+                return None
+            shot = self.shot
+            return Shot(time, shot.ball_loc, shot.aim_dir, shot.goto, shot.goto_time)
+
+        start = data.deadline.clock()
+        self.shot = find_shot(data, right_target, left_target, straight)
+        data.deadline.measure("shot_search", start)
+        self.search_time = data.time
+        if self.shot is not None:
+            self.hit_time = data.time + self.shot.time
+        return self.shot
@@ -0,0 +1,204 @@
+import argparse
+import contextlib
+import io
+import math
+import multiprocessing
+import os
+import random
+import time
+import numpy as np
+
+import carsim
+import datalibs
+import headless
+import predict
+from beastbot import Beast
+
+from rlbot.utils.structures.game_data_struct import GameTickPacket
+
+
+# Plays Beast against itself without the game, as fast as the bot and the physics allow. The ball moves with
+# predict.move_ball and the cars with carsim, one tick at a time, and the agents get packets like the ones from the
+# framework. Touches push the ball away from the car, cars don't collide with each other, and there is no
+# countdown before kickoffs. A pool of processes plays many matches at once. Run from this directory:
+#   python selfplay.py --matches 8 --duration 120
+
+TICK = 1 / headless.TICK_RATE
+
+# Blue's kickoff spots as (x, y, yaw). Orange's are the same, mirrored through the center
+KICKOFF_SPOTS = [
+    (-2048, -2560, math.pi / 4),
+    (2048, -2560, 3 * math.pi / 4),
+    (-256, -3840, math.pi / 2),
+    (256, -3840, math.pi / 2),
+    (0, -4608, math.pi / 2),
+]
+KICKOFF_BOOST = 33
+
+# predict keeps a rolling ball at BALL_RADIUS, while the game has it at this height. Packets show the game's height
+GAME_BALL_REST_HEIGHT = 92.75
+
+# A car touches the ball when their centers are this close. The ball bounces off the car with this restitution
+TOUCH_DIST = datalibs.BALL_RADIUS + 70
+TOUCH_RESTITUTION = 0.6
+MAX_BALL_SPEED = 6000
+
+# Boost pads give their boost when a car is within the radius, and respawn after the delay
+FULL_PAD = (208, 100, 10)
+SMALL_PAD = (144, 12, 4)
+PAD_XY = np.array([(x, y) for x, y, z, is_full_boost in headless.SOCCAR_BOOST_PADS], dtype=float)
+PAD_RADIUS, PAD_AMOUNT, PAD_DELAY = np.array(
+    [FULL_PAD if is_full_boost else SMALL_PAD for x, y, z, is_full_boost in headless.SOCCAR_BOOST_PADS], dtype=float).T
+
+
+class Arena:
+    # Stand-in for the game. Cars alternate between the blue and orange team
+    def __init__(self, car_count=2, seed=0):
+        self.rng = random.Random(seed)
+        self.car_count = car_count
+        self.field_info = headless.make_field_info()
+        self.packet = GameTickPacket()
+        self.time = 0.0
+        self.scores = [0, 0]
+        self.pad_respawn = np.zeros(len(PAD_XY))  # time when the pad is active again
+        self.ball = datalibs.Ball()
+        self.cars = carsim.CarStates(car_count)
+        self.kickoff_pause = True
+        self.kickoff()
+
+    def kickoff(self):
+        self.ball = datalibs.Ball()
+        self.ball.location.z = datalibs.BALL_RADIUS
+        self.cars = carsim.CarStates(self.car_count)
+        spots = self.rng.sample(KICKOFF_SPOTS, (self.car_count + 1) // 2)
+        for i in range(self.car_count):
+            x, y, yaw = spots[i // 2]
+            if i % 2 == 1:
+                x, y, yaw = -x, -y, yaw + math.pi
+            self.cars.location[i] = (x, y, carsim.REST_HEIGHT)
+            self.cars.yaw[i] = yaw
+        self.cars.boost[:] = KICKOFF_BOOST
+        self.kickoff_pause = True
+
+    def step(self, controls):
+        # Advances the arena one tick, with one SimpleControllerState per car
+        columns = [[float(getattr(c, name)) for c in controls] for name in carsim.Controls.FIELDS]
+        carsim.step(self.cars, *[np.array(column) for column in columns], dt=TICK)
+        predict.move_ball(self.ball, TICK)
+        self.time += TICK
+
+        self.touch_ball()
+        self.pick_up_boost()
+        self.check_goal()
+
+    def touch_ball(self):
+        ball_loc = np.array(self.ball.location.tuple())
+        ball_vel = np.array(self.ball.velocity.tuple())
+        offsets = ball_loc - self.cars.location
+        dists = np.sqrt((offsets ** 2).sum(axis=1))
+        for i in np.flatnonzero(dists < TOUCH_DIST):
+            normal = offsets[i] / max(dists[i], 1e-9)
+            approach = (self.cars.velocity[i] - ball_vel).dot(normal)
+            if approach > 0:
+                ball_vel = ball_vel + (1 + TOUCH_RESTITUTION) * approach * normal
+            ball_loc = self.cars.location[i] + normal * TOUCH_DIST
+            self.kickoff_pause = False
+
+        speed = math.sqrt(ball_vel.dot(ball_vel))
+        if speed > MAX_BALL_SPEED:
+            ball_vel *= MAX_BALL_SPEED / speed
+        ball_loc[2] = max(ball_loc[2], datalibs.BALL_RADIUS)
+        self.ball.location.set_xyz(*ball_loc)
+        self.ball.location_2d.set_xyz(ball_loc[0], ball_loc[1], 0.0)
+        self.ball.velocity.set_xyz(*ball_vel)
+
+    def pick_up_boost(self):
+        # (car, pad) arrays. A pad goes to the first car that can take it
+        offsets = self.cars.location[:, None, :2] - PAD_XY[None, :, :]
+        close = (offsets ** 2).sum(axis=2) < PAD_RADIUS ** 2
+        takes = close & (self.pad_respawn <= self.time) & (self.cars.boost < 100)[:, None]
+        if takes.any():
+            for p in np.flatnonzero(takes.any(axis=0)):
+                i = np.flatnonzero(takes[:, p])[0]
+                self.cars.boost[i] = min(self.cars.boost[i] + PAD_AMOUNT[p], 100)
+                self.pad_respawn[p] = self.time + PAD_DELAY[p]
+
+    def check_goal(self):
+        loc = self.ball.location
+        if abs(loc.y) > datalibs.ARENA_LENGTH2 + datalibs.BALL_RADIUS and predict.is_in_goal_mouth(loc):
+            # The ball is in orange's goal when y is positive, so blue scores
+            self.scores[0 if loc.y > 0 else 1] += 1
+            self.kickoff()
+
+    def make_packet(self):
+        # The current state as a packet. The packet object is reused, like the framework does
+        packet = self.packet
+        ball = self.ball
+        location = (ball.location.x, ball.location.y, ball.location.z + GAME_BALL_REST_HEIGHT - datalibs.BALL_RADIUS)
+        headless.set_physics(packet.game_ball.physics, location, ball.velocity.tuple(),
+                             angular_velocity=ball.angular_velocity.tuple())
+        packet.num_cars = self.car_count
+        for i in range(self.car_count):
+            game_car = packet.game_cars[i]
+            game_car.team = i % 2
+            game_car.boost = int(self.cars.boost[i])
+            game_car.has_wheel_contact = bool(self.cars.on_ground[i])
+            headless.set_physics(game_car.physics, tuple(self.cars.location[i]), tuple(self.cars.velocity[i]),
+                                 (0, float(self.cars.yaw[i]), 0))
+        packet.num_boost = len(self.pad_respawn)
+        for p, active in enumerate((self.pad_respawn <= self.time).tolist()):
+            packet.game_boosts[p].is_active = active
+        info = packet.game_info
+        info.seconds_elapsed = self.time
+        info.is_round_active = True
+        info.is_kickoff_pause = self.kickoff_pause
+        info.game_speed = 1.0
+        info.world_gravity_z = predict.GRAVITY.z
+        return packet
+
+
+def play_match(seed, duration=300.0, car_count=2):
+    # Plays one match of duration game seconds, and returns the result
+    start = time.perf_counter()
+    arena = Arena(car_count, seed)
+    with contextlib.redirect_stdout(io.StringIO()):
+        agents = [headless.make_agent(Beast, i % 2, i, arena.field_info) for i in range(car_count)]
+        ticks = int(round(duration / TICK))
+        for tick in range(ticks):
+            packet = arena.make_packet()
+            arena.step([agent.get_output(packet) for agent in agents])
+    return {"seed": seed, "scores": arena.scores, "sim_seconds": arena.time, "wall_seconds": time.perf_counter() - start}
+
+
+def play_match_args(args):
+    return play_match(*args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play Beast against itself without the game")
+    parser.add_argument("--matches", type=int, default=4, help="number of matches")
+    parser.add_argument("--duration", type=float, default=300.0, help="game seconds per match")
+    parser.add_argument("--processes", type=int, default=os.cpu_count(), help="matches played at once")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first match, each next match adds one")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    jobs = [(args.seed + m, args.duration) for m in range(args.matches)]
+    results = []
+    with multiprocessing.Pool(min(args.processes, args.matches)) as pool:
+        for result in pool.imap_unordered(play_match_args, jobs):
+            results.append(result)
+            print("seed {:>4}  blue {:>2} - {:<2} orange  {:.1f}x real time".format(
+                result["seed"], result["scores"][0], result["scores"][1],
+                result["sim_seconds"] / result["wall_seconds"]))
+    wall = time.perf_counter() - start
+
+    sim_seconds = sum(r["sim_seconds"] for r in results)
+    print("{} matches, blue {} - {} orange".format(
+        len(results), sum(r["scores"][0] for r in results), sum(r["scores"][1] for r in results)))
+    print("{:.1f} simulated seconds per wall second, {:.1f} per process".format(
+        sim_seconds / wall, sim_seconds / sum(r["wall_seconds"] for r in results)))
+
+
+if __name__ == "__main__":
+    main()
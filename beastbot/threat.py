@@ -0,0 +1,108 @@
+import math
+import numpy as np
+import batchpredict
+import datalibs
+import deadline
+import predict
+
+
+# Estimates how likely the ball is to end up in a team's goal, if that team doesn't act. The opponent's arrival time
+# from predict.time_till_reach_ball and the direction of its touch are uncertain, so they are perturbed with a fixed
+# table of samples. Each sample that touches the ball before we do moves the ball from where it is at that time,
+# in the perturbed direction.
+# The touched balls are followed through their bounces, all at once, with batchpredict.move_balls, so bouncing and
+# rolling shots count too. The untouched ball is checked along every segment of the shared BallTrajectory, which has
+# the contacts in it already.
+# The samples are the same every tick, so the result changes smoothly with the game state instead of jumping with
+# new random numbers. Following the touched balls costs milliseconds, so only the first MIN_SAMPLES samples are used
+# when the tick has no time for all of them. That estimate is coarser, but it is the best one the tick has time for.
+
+SAMPLES = 16
+# Samples used when the tick has no time for all of them, and what all of them cost before it is measured (seconds)
+MIN_SAMPLES = 4
+SAMPLES_COST = 0.002
+# The arrival time is scaled by exp(ETA_SPREAD * normal sample), the touch direction turned by TOUCH_ANG_SPREAD *
+# normal sample radians
+ETA_SPREAD = 0.25
+TOUCH_ANG_SPREAD = 0.4
+# Speed added to the ball by a touch, along the touch direction
+TOUCH_SPEED = 1400
+# How far ahead touched balls are followed, and the untouched ball, in seconds
+TOUCH_HORIZON = 4.0
+HORIZON = 6.0
+
+_normals = np.random.RandomState(0).standard_normal((SAMPLES, 2))
+ETA_FACTORS = np.exp(ETA_SPREAD * _normals[:, 0])
+TOUCH_ANGS = TOUCH_ANG_SPREAD * _normals[:, 1]
+
+
+class Threat:
+    def __init__(self, probability, time_to_goal, enemy_first):
+        self.probability = probability  # fraction of the samples ending in the goal
+        self.time_to_goal = time_to_goal  # expected time until the ball is in the goal in those samples, or inf
+        self.enemy_first = enemy_first  # fraction of the samples where the opponent touches the ball first
+
+
+def goal_times(locations, velocities, angular_velocities, durations, team):
+    # The time each ball enters the team's goal within its duration, or inf. The balls are followed through their
+    # bounces with batchpredict.move_balls, which stops each one where it enters a goal
+    times = np.empty(len(locations))
+    ends = batchpredict.move_balls(locations, velocities, angular_velocities, durations, times)[0]
+    return np.where(ends[:, 1] * datalibs.team_sign(team) > 0, times, np.inf)
+
+
+def untouched_goal_time(trajectory: "predict.BallTrajectory", team):
+    # goal_times along the segments of the trajectory, with plain floats since there are few segments and the first
+    # one entering the goal ends the search
+    trajectory.state_at(min(HORIZON, trajectory.horizon))
+    sign = datalibs.team_sign(team)
+    radius = datalibs.BALL_RADIUS
+    back_wall = datalibs.ARENA_LENGTH2 - radius
+    segments = trajectory.segments
+    for i, (start, ball, gravity) in enumerate(segments):
+        if start >= HORIZON:
+            break
+        end = segments[i + 1][0] if i + 1 < len(segments) else HORIZON
+        loc, vel = ball.location, ball.velocity
+        if vel.y * sign <= 0:
+            continue
+        time = max(back_wall - loc.y * sign, 0) / (vel.y * sign)
+        if time > end - start:
+            continue
+        x = loc.x + vel.x * time
+        z = loc.z + vel.z * time + (0.5 * predict.GRAVITY.z * time * time if gravity else 0)
+        if z < datalibs.GOAL_HEIGHT - radius and abs(x) < datalibs.GOAL_WIDTH2 - radius:
+            return start + time
+    return math.inf
+
+
+def evaluate(ball, trajectory: "predict.BallTrajectory", enemy, our_time, team, tick_deadline=deadline.NO_DEADLINE):
+    # Returns the Threat to the team's goal. our_time is when we would touch the ball. All samples are used if the
+    # deadline allows it, otherwise the first MIN_SAMPLES of them
+    untouched_time = untouched_goal_time(trajectory, team)
+    enemy_eta = predict.time_till_reach_ball(ball, enemy)
+
+    samples = SAMPLES if tick_deadline.allows("threat_samples", SAMPLES_COST) else MIN_SAMPLES
+    start = tick_deadline.clock()
+    etas = enemy_eta * ETA_FACTORS[:samples]
+    # Touches after the ball went in don't count
+    touches = etas < min(our_time, untouched_time, trajectory.horizon)
+    touch_times = etas[touches]
+    sample_times = np.full(samples, untouched_time)
+
+    if len(touch_times) > 0:
+        locations, velocities, angular_velocities = batchpredict.from_balls(
+            [trajectory.state_at(time) for time in touch_times])
+        angs = np.arctan2(locations[:, 1] - enemy.location.y, locations[:, 0] - enemy.location.x)
+        angs += TOUCH_ANGS[:samples][touches]
+        velocities[:, 0] += np.cos(angs) * TOUCH_SPEED
+        velocities[:, 1] += np.sin(angs) * TOUCH_SPEED
+        times = goal_times(locations, velocities, angular_velocities, TOUCH_HORIZON, team)
+        sample_times[touches] = touch_times + times
+
+    scored = sample_times < math.inf
+    probability = float(scored.mean())
+    time_to_goal = float(sample_times[scored].mean()) if scored.any() else math.inf
+    if samples == SAMPLES:
+        tick_deadline.measure("threat_samples", start)
+    return Threat(probability, time_to_goal, float(touches.mean()))
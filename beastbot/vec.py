@@ -1,8 +1,11 @@
 import math
+import numpy as np
 import rlmath
 
 
 class Vec3:
+    __slots__ = ("x", "y", "z")
+
     def __init__(self, x: float=0, y: float=0, z: float=0):
         self.x = float(x)
         self.y = float(y)
@@ -25,7 +28,34 @@ class Vec3:
 
     def __truediv__(self, scale):
         scale = 1 / float(scale)
-        return self * scale
+        return Vec3(self.x * scale, self.y * scale, self.z * scale)
+
+    # In-place operations. These modify and return this vector instead of allocating a new one,
+    # so only use them on vectors that are not shared with anyone else
+
+    def iadd(self, other):
+        self.x += other.x
+        self.y += other.y
+        self.z += other.z
+        return self
+
+    def isub(self, other):
+        self.x -= other.x
+        self.y -= other.y
+        self.z -= other.z
+        return self
+
+    def imul(self, scale):
+        self.x *= scale
+        self.y *= scale
+        self.z *= scale
+        return self
+
+    def set_xyz(self, x, y, z):
+        self.x = x
+        self.y = y
+        self.z = z
+        return self
 
     def __str__(self):
         return "Vec3(" + str(self.x) + ", " + str(self.y) + ", " + str(self.z) + ")"
@@ -42,11 +72,18 @@ class Vec3:
     def dist2(self, other):
         return (self.x - other.x)**2 + (self.y - other.y)**2 + (self.z - other.z)**2
 
+    def dist_flat(self, other):
+        return math.sqrt(self.dist2_flat(other))
+
+    def dist2_flat(self, other):
+        return (self.x - other.x)**2 + (self.y - other.y)**2
+
     def normalized(self):
         return self / self.length()
 
     def rescale(self, new_len):
-        return new_len * self.normalized()
+        scale = new_len / self.length()
+        return Vec3(self.x * scale, self.y * scale, self.z * scale)
 
     def mul_components(self, other):
         return Vec3(self.x*other.x, self.y*other.y, self.z*other.z)
@@ -58,11 +95,17 @@ class Vec3:
                     s * self.x + c * self.y)
 
     def lerp(self, other, t):
-        return self * (1 - t) + other * t
+        return Vec3(self.x * (1 - t) + other.x * t,
+                    self.y * (1 - t) + other.y * t,
+                    self.z * (1 - t) + other.z * t)
 
     def dot(self, other):
         return self.x*other.x + self.y*other.y + self.z*other.z
 
+    # Same as (self - origin).dot(other), but without the temporary vector
+    def dot_sub(self, other, origin):
+        return (self.x - origin.x)*other.x + (self.y - origin.y)*other.y + (self.z - origin.z)*other.z
+
     def cross(self, other):
         return Vec3(
             self.y * other.z - self.z * other.y,
@@ -92,8 +135,7 @@ class Vec3:
 
     def proj_onto_size(self, other):
         try:
-            other = other.normalized()
-            return self.dot(other) / other.dot(other)   # can be negative!
+            return self.dot(other) / other.length()   # can be negative!
         except ZeroDivisionError:
             return self.length()
 
@@ -144,9 +186,40 @@ class Orientation:
         self.up = Vec3(-cr*cy*sp-sr*sy, -cr*sy*sp+sr*cy, cp*cr)
 
 
+    def matrix(self):
+        # The rows are front, right and up, so matrix @ v is v in the orientation's space, like relative_location
+        return np.array([self.front.tuple(), self.right.tuple(), self.up.tuple()])
+
+
+def orientation_matrices(rotations):
+    # Orientation.matrix of many rotations at once. rotations is an (N, 3) array of (pitch, yaw, roll) and the
+    # result is an (N, 3, 3) array
+    pitch, yaw, roll = np.asarray(rotations, dtype=float).reshape(-1, 3).T
+    cr = np.cos(roll)
+    sr = np.sin(roll)
+    cp = np.cos(pitch)
+    sp = np.sin(pitch)
+    cy = np.cos(yaw)
+    sy = np.sin(yaw)
+
+    matrices = np.empty((len(pitch), 3, 3))
+    matrices[:, 0] = np.stack([cp*cy, cp*sy, sp], axis=-1)
+    matrices[:, 1] = np.stack([cy*sp*sr-cr*sy, sy*sp*sr+cr*cy, -cp*sr], axis=-1)
+    matrices[:, 2] = np.stack([-cr*cy*sp-sr*sy, -cr*sy*sp+sr*cy, cp*cr], axis=-1)
+    return matrices
+
+
 # x are how far in front of center, y is how far right of center, and z is how far above
 def relative_location(center, target, ori):
-    x = (target - center).dot(ori.front)
-    y = (target - center).dot(ori.right)
-    z = (target - center).dot(ori.up)
-    return Vec3(x, y, z)
\ No newline at end of file
+    dx = target.x - center.x
+    dy = target.y - center.y
+    dz = target.z - center.z
+    front, right, up = ori.front, ori.right, ori.up
+    return Vec3(dx*front.x + dy*front.y + dz*front.z,
+                dx*right.x + dy*right.y + dz*right.z,
+                dx*up.x + dy*up.y + dz*up.z)
+
+
+def relative_locations(center, targets, matrix):
+    # relative_location of an (M, 3) array of targets at once, given an orientation matrix. Returns an (M, 3) array
+    return (np.asarray(targets, dtype=float) - center.tuple()) @ matrix.T